@@ -1,14 +1,61 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import RecordLog, PersonDetection, GPUMetrics
+from .models import Camera, RecordingNode, RecordLog, PersonDetection, GPUMetrics
+
+
+@admin.register(Camera)
+class CameraAdmin(admin.ModelAdmin):
+    list_display = ['ip', 'name', 'port', 'username', 'stream_path', 'sub_stream_path', 'record_mode', 'enabled', 'updated_at']
+    list_filter = ['enabled', 'record_mode']
+    list_editable = ['enabled']
+    search_fields = ['ip', 'name']
+
+    fieldsets = (
+        ('基本信息', {
+            'fields': ('name', 'ip', 'port', 'stream_path', 'sub_stream_path', 'enabled')
+        }),
+        ('认证信息', {
+            'fields': ('username', 'password_env'),
+            'description': '密码不保存在数据库中，填写各录制节点上保存密码的环境变量名（如 CAMERA1_PASSWORD）',
+        }),
+        ('录制配置', {
+            'fields': ('record_mode',)
+        }),
+        ('检测采样', {
+            'fields': ('sampling_mode', 'coarse_sample_interval'),
+        }),
+        ('检测区域', {
+            'fields': ('roi_polygon',),
+            'description': '人物检测只在多边形外接矩形内推理，脚部（边界框底边中点）不在多边形内的检测被丢弃；'
+                           '修改后各分析 worker 在 ROI_CACHE_TTL 秒内生效',
+        }),
+        ('保留策略', {
+            'fields': ('retention_days', 'storage_budget_gb', 'archive_after_days'),
+            'description': '留空使用 RETENTION_* 环境变量的默认值，0 表示不限制',
+        }),
+    )
+
+
+@admin.register(RecordingNode)
+class RecordingNodeAdmin(admin.ModelAdmin):
+    list_display = ['name', 'last_heartbeat', 'camera_count_display', 'cameras']
+    readonly_fields = ['name', 'last_heartbeat', 'cameras']
+
+    def has_add_permission(self, request):
+        return False
+
+    def camera_count_display(self, obj):
+        """显示负责的摄像头数量"""
+        return len(obj.cameras or [])
+    camera_count_display.short_description = '摄像头数量'
 
 
 @admin.register(RecordLog)
 class RecordLogAdmin(admin.ModelAdmin):
-    list_display = ['id', 'camera_ip', 'start_time_display', 'duration_display', 'status_display', 'file_size_display', 'detection_count_display', 'video_url_display']
-    list_filter = ['status', 'analysis_status', 'camera_ip', 'start_time']
+    list_display = ['id', 'camera_ip', 'start_time_display', 'duration_display', 'status_display', 'record_mode', 'file_size_display', 'detection_count_display', 'video_url_display']
+    list_filter = ['status', 'analysis_status', 'record_mode', 'storage_tier', 'camera_ip', 'start_time']
     search_fields = ['camera_ip', 'task_id', 'file_path', 'error_message']
-    readonly_fields = ['task_id', 'start_time', 'end_time', 'duration_display', 'video_preview', 'detection_summary']
+    readonly_fields = ['task_id', 'start_time', 'end_time', 'duration_display', 'motion_display', 'video_preview', 'detection_summary']
     date_hierarchy = 'start_time'
     list_per_page = 50
     actions = ['analyze_selected_videos', 'reanalyze_selected_videos']
@@ -21,7 +68,7 @@ class RecordLogAdmin(admin.ModelAdmin):
             'fields': ('start_time', 'end_time', 'duration_display')
         }),
         ('文件信息', {
-            'fields': ('file_path', 'file_size', 'video_preview', 'detection_summary')
+            'fields': ('file_path', 'sub_file_path', 'file_size', 'record_mode', 'storage_tier', 'motion_display', 'video_preview', 'detection_summary')
         }),
         ('错误信息', {
             'fields': ('error_message',),
@@ -34,6 +81,16 @@ class RecordLogAdmin(admin.ModelAdmin):
         return obj.start_time.strftime('%Y-%m-%d %H:%M:%S')
     start_time_display.short_description = '开始时间'
 
+    def motion_display(self, obj):
+        """显示有运动的秒数"""
+        import os
+        threshold = int(os.getenv('MOTION_SKIP_THRESHOLD', '2'))
+        motion_seconds = obj.motion_seconds(threshold)
+        if motion_seconds is None:
+            return '-'
+        return f"{motion_seconds}/{len(obj.motion_index)} 秒"
+    motion_display.short_description = '运动秒数'
+
     def duration_display(self, obj):
         """显示时长"""
         duration = obj.duration()
@@ -197,7 +254,7 @@ class RecordLogAdmin(admin.ModelAdmin):
 
     def analyze_selected_videos(self, request, queryset):
         """批量分析选中的视频（跳过已分析的）"""
-        from apps.cameras.tasks import analyze_video_for_person
+        from apps.cameras.tasks import queue_person_analysis
         import os
 
         # 只处理成功录制且未分析的视频（状态为 pending 或 failed）
@@ -217,7 +274,7 @@ class RecordLogAdmin(admin.ModelAdmin):
                 continue
 
             # 异步执行分析任务
-            analyze_video_for_person.delay(record.id)
+            queue_person_analysis([record.id])
             analyzed_count += 1
 
         if analyzed_count > 0:
@@ -237,7 +294,7 @@ class RecordLogAdmin(admin.ModelAdmin):
 
     def reanalyze_selected_videos(self, request, queryset):
         """批量重新分析选中的视频（删除旧记录）"""
-        from apps.cameras.tasks import analyze_video_for_person
+        from apps.cameras.tasks import queue_person_analysis
         import os
 
         # 只处理成功录制的视频
@@ -258,13 +315,14 @@ class RecordLogAdmin(admin.ModelAdmin):
                 record.detections.all().delete()
                 deleted_count += old_detections
 
-            # 重置分析状态
+            # 重置分析状态（从头检测，不从检查点继续）
             record.analysis_status = 'pending'
             record.analysis_time = None
-            record.save(update_fields=['analysis_status', 'analysis_time'])
+            record.analysis_checkpoint = None
+            record.save(update_fields=['analysis_status', 'analysis_time', 'analysis_checkpoint'])
 
             # 异步执行分析任务
-            analyze_video_for_person.delay(record.id)
+            queue_person_analysis([record.id])
             analyzed_count += 1
 
         if analyzed_count > 0:
@@ -288,7 +346,7 @@ class PersonDetectionAdmin(admin.ModelAdmin):
     list_display = ['id', 'camera_ip_display', 'record_log_link', 'frame_number', 'timestamp_display', 'confidence_display', 'caption_status_display', 'image_preview_thumb', 'created_at_display']
     list_filter = ['caption_status', 'record_log__camera_ip', 'created_at']
     search_fields = ['record_log__camera_ip', 'record_log__file_path', 'image_path', 'caption']
-    readonly_fields = ['record_log', 'frame_number', 'timestamp', 'image_path', 'confidence', 'bbox', 'created_at', 'caption_generated_at', 'image_preview_large']
+    readonly_fields = ['record_log', 'frame_number', 'timestamp', 'image_path', 'thumbnail_path', 'confidence', 'bbox', 'created_at', 'caption_generated_at', 'image_preview_large']
     date_hierarchy = 'created_at'
     list_per_page = 50
     ordering = ['-created_at']
@@ -302,7 +360,7 @@ class PersonDetectionAdmin(admin.ModelAdmin):
             'fields': ('frame_number', 'timestamp', 'confidence', 'bbox')
         }),
         ('图片信息', {
-            'fields': ('image_path', 'image_preview_large', 'created_at')
+            'fields': ('image_path', 'thumbnail_path', 'image_preview_large', 'created_at')
         }),
         ('图片描述', {
             'fields': ('caption_status', 'caption', 'caption_zh', 'keywords', 'caption_generated_at'),
@@ -361,7 +419,7 @@ class PersonDetectionAdmin(admin.ModelAdmin):
         if image_url:
             return format_html(
                 '<a href="{}" target="_blank"><img src="{}" style="width: 100px; height: auto; border: 1px solid #ddd; border-radius: 4px;"/></a>',
-                image_url, image_url
+                image_url, obj.get_thumbnail_url()
             )
         return "-"
     image_preview_thumb.short_description = '缩略图'
@@ -0,0 +1,837 @@
+"""
+单个录像的人物检测
+
+VideoAnalysis 负责一条 RecordLog 的完整检测流程：校验文件、按运动指数确定需要检测的秒、
+打开视频和帧读取器、产出采样帧、对推理结果去重、保存截图和 PersonDetection 记录。
+推理由调用方执行，同一个 VideoAnalysis 既用于 analyze_video_for_person 任务（单个录像），
+也用于检测服务（多个录像的帧拼成一批推理）。
+"""
+import os
+import bisect
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisSkipped(Exception):
+    """录像无需或无法检测，状态已写入 RecordLog"""
+
+
+def reclaim_stale_analyses(timeout=None):
+    """
+    检测中的录像超过 DETECTION_STALE_TIMEOUT 秒（默认 1800）没有刷新领取时间时，视为检测进程已退出，退回待检测
+
+    Returns:
+        list: 退回待检测的 RecordLog ID
+    """
+    from django.db.models import Q
+    from apps.cameras.models import RecordLog
+
+    if timeout is None:
+        timeout = int(os.getenv('DETECTION_STALE_TIMEOUT', '1800'))
+    # 没有领取时间的检测中记录来自加入该字段之前，同样视为遗留
+    stale = Q(analysis_claimed_at__lt=timezone.now() - timedelta(seconds=timeout)) | Q(analysis_claimed_at__isnull=True)
+    ids = list(RecordLog.objects.filter(stale, analysis_status='processing').values_list('id', flat=True))
+    reclaimed = []
+    for record_log_id in ids:
+        # 条件更新：期间刚完成或刷新了领取时间的录像不受影响
+        if RecordLog.objects.filter(stale, id=record_log_id, analysis_status='processing').update(
+            analysis_status='pending', analysis_claimed_at=None
+        ):
+            reclaimed.append(record_log_id)
+    if reclaimed:
+        logger.warning(f"{len(reclaimed)} 个录像检测中超过 {timeout} 秒未更新，已退回待检测: {reclaimed}")
+    return reclaimed
+
+
+class Checkpoint:
+    """
+    检查点写入任务：排在同一批写入任务之后，之前的截图和检测记录全部写入后再记录进度
+
+    Args:
+        state: 写入 RecordLog.analysis_checkpoint 的进度
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+
+def read_frame_at(cap, timestamp):
+    """
+    定位到指定时间戳并读取一帧
+
+    Returns:
+        tuple: (帧序号, 帧)，读取失败时为 (None, None)
+    """
+    import cv2  # 延迟导入
+
+    cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+    ret, frame = cap.read()
+    if not ret or frame is None:
+        return None, None
+    return int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1, frame
+
+
+def infer_frames(model, entries):
+    """
+    推理采样帧（可以来自多个录像），检测缓存命中的帧不送入模型
+
+    Args:
+        entries: [(VideoAnalysis, (帧序号, 时间戳, 帧)), ...]
+
+    Returns:
+        tuple: (与 entries 一一对应的置信度达标的人物框（模型输入坐标）, 实际推理的帧数)
+    """
+    from apps.cameras.detection import extract_batch_person_detections
+
+    boxes = [analysis.cached_boxes(item[0]) for analysis, item in entries]
+    missing = [index for index, cached in enumerate(boxes) if cached is None]
+    if missing:
+        results = model([entries[index][0].model_input(entries[index][1][2]) for index in missing], verbose=False)
+        # 缓存模型输出的全部人物框，调整置信度阈值时重新过滤即可
+        for index, detections in zip(missing, extract_batch_person_detections(results, 0)):
+            analysis, (frame_number, _, frame) = entries[index]
+            boxes[index] = analysis.remember_boxes(frame_number, frame, detections)
+    person_detections = [analysis.filter_boxes(item[2], cached) for (analysis, item), cached in zip(entries, boxes)]
+    return person_detections, len(missing)
+
+
+class VideoAnalysis:
+    """
+    一条 RecordLog 的人物检测
+
+    有子码流文件时在子码流上解码和推理，检测到人物的帧再从主码流文件中取同一时刻的画面保存截图。
+    有运动指数时跳过运动低于 MOTION_SKIP_THRESHOLD 的秒，整分钟都没有运动时直接完成。
+    开启 DETECTION_MOTION_FILTER 时，与上一个采样帧相比没有变化的帧也不送入模型。
+    摄像头配置了检测区域时只把区域的外接矩形送入模型，区域外的人物不保存。
+    DETECTION_TRACKING 开启时按人物轨迹去重（见 apps.cameras.tracking），接续同一摄像头上一分钟的轨迹。
+    摄像头使用自适应采样时，sample_frames() 只产出扫描帧，select_batch() 对检测到人物或运动的区间补充推理加密帧。
+
+    用法：open() 后迭代 sample_frames() 得到采样帧，推理结果解析出的人物框交给 select_batch() 去重，
+    select() 返回的写入任务交给 save()，全部帧处理完后调用 flush_tracks() 保存仍在画面中的轨迹（或当前时间窗口内的最佳检测），
+    然后 complete()，最后 release()。
+    save() 把截图交给 SnapshotWriter 异步编码，PersonDetection 记录攒到检查点或 complete() 时，
+    等截图写完后与进度（或完成状态）在同一个事务内一次 bulk_create。
+    每隔 DETECTION_CHECKPOINT_INTERVAL 秒视频写一次检查点，重试时从检查点之后的帧继续。
+    配置了 DETECTION_CACHE_DIR 时，推理结果写入检测缓存（见 apps.cameras.detection_cache），重新分析时命中的帧不再推理。
+
+    Args:
+        log: RecordLog
+        refresh_cache: 不读取检测缓存，全部重新推理并覆盖缓存
+    """
+
+    def __init__(self, log, refresh_cache=False):
+        self.log = log
+        self.refresh_cache = refresh_cache
+        self.pics_base_dir = os.getenv('PICS_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraWarningPics')
+        self.sample_interval = int(os.getenv('DETECTION_SAMPLE_INTERVAL', '1'))
+        self.confidence_threshold = float(os.getenv('DETECTION_CONFIDENCE_THRESHOLD', '0.5'))
+        self.dedup_window = int(os.getenv('DETECTION_DEDUP_WINDOW', '10'))
+        self.motion_threshold = int(os.getenv('MOTION_SKIP_THRESHOLD', '2'))
+        self.checkpoint_interval = float(os.getenv('DETECTION_CHECKPOINT_INTERVAL', '20'))
+
+        self.cap = None
+        self.main_cap = None
+        self.refine_cap = None
+        self.sampling = None
+        self.reader = None
+        self.motion_filter = None
+        self.roi = None
+        self.cache = None
+        self.detections = []    # 待写入的 PersonDetection
+        self.snapshot_writer = None
+        self.opened = False
+        self.tracker = None
+        self.saved_frames = set()   # 已保存截图的帧序号（多条轨迹可能选中同一帧）
+        self.last_detection_time = -self.dedup_window  # 当前去重时间窗口的开始时间（未开启轨迹去重时）
+        self.candidate = None       # 当前时间窗口内置信度最高、尚未保存的检测（未开启轨迹去重时）
+        self.refined_done = set()   # 检查点之后已处理过的加密帧（从检查点继续时不再推理）
+        self.start_frame = 0        # 第一个采样帧（从检查点继续时不为 0）
+        self.last_checkpoint = 0.0  # 上次写检查点的视频时间
+        self.stats = Counter()
+
+    def open(self):
+        """
+        标记为检测中并打开视频
+
+        Raises:
+            AnalysisSkipped: 文件不存在、无法解码或整分钟没有运动，状态已保存
+        """
+        import cv2  # 延迟导入
+        from apps.cameras.detection_cache import DetectionCache
+        from apps.cameras.motion import FrameMotionFilter, active_seconds, is_motion_filter_enabled
+        from apps.cameras.frame_readers import get_frame_reader_class
+        from apps.cameras.roi import get_camera_roi
+        from apps.cameras.sampling import get_sampling_policy
+        from apps.cameras.snapshots import SnapshotWriter
+        from apps.cameras.tracking import is_tracking_enabled
+
+        log = self.log
+
+        # 标记为检测中
+        log.analysis_status = 'processing'
+        log.analysis_claimed_at = timezone.now()
+        log.save(update_fields=['analysis_status', 'analysis_claimed_at'])
+
+        if not log.file_path or not os.path.exists(log.file_path):
+            logger.error(f"视频文件不存在: {log.file_path}")
+            self.fail()
+            raise AnalysisSkipped("视频文件不存在")
+
+        # 根据录制时计算的运动指数确定需要检测的秒（为 None 表示全部检测）
+        self.motion_index = bytes(log.motion_index) if log.motion_index is not None else None
+        self.motion_active = None
+        if self.motion_index is not None and self.motion_threshold > 0:
+            self.motion_active = active_seconds(self.motion_index, self.motion_threshold)
+            if not self.motion_active:
+                logger.info(f"整分钟没有运动，跳过检测: {log.file_path}")
+                self.complete()
+                raise AnalysisSkipped("没有运动，跳过检测")
+
+        logger.info(f"开始分析视频: {log.file_path}")
+        logger.info(f"配置: 采样间隔={self.sample_interval}s, 置信度={self.confidence_threshold}, 去重窗口={self.dedup_window}s")
+
+        # 有子码流文件时用子码流做检测，解码量只有主码流的几分之一
+        analysis_path = log.file_path
+        if log.sub_file_path and os.path.exists(log.sub_file_path):
+            analysis_path = log.sub_file_path
+            self.main_cap = cv2.VideoCapture(log.file_path)
+            logger.info(f"使用子码流检测: {analysis_path}，截图取自主码流")
+
+        # 打开视频并验证
+        self.cap = cv2.VideoCapture(analysis_path)
+        if not self.cap.isOpened():
+            self._reject(f"无法打开视频文件: {analysis_path}")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # 验证视频属性有效性
+        if fps <= 0 or total_frames <= 0:
+            self._reject(f"视频文件损坏或格式错误: FPS={fps}, 帧数={total_frames}")
+
+        logger.info(f"视频信息: FPS={fps}, 总帧数={total_frames}, 时长={total_frames / fps:.1f}秒")
+
+        # 尝试读取第一帧以验证解码能力
+        test_ret, test_frame = self.cap.read()
+        if not test_ret or test_frame is None:
+            self._reject("无法解码视频帧，视频可能损坏")
+
+        # 小时合并后的录像只分析本分钟
+        self.segment_frames = None
+        if log.segment_offset is not None:
+            self.segment_frames = int((log.segment_duration or 60) * fps)
+            total_frames = self.segment_frames
+            logger.info(f"小时合并文件，分析区间: {log.segment_offset:.1f}s 起 {log.segment_duration or 60:.1f}s")
+
+        self.fps = fps
+        self.total_frames = total_frames
+        self.analysis_path = analysis_path
+        # 加密（固定间隔）采样的帧间隔；自适应采样时读取器按扫描间隔采样
+        self.fine_interval = max(int(fps * self.sample_interval), 1)
+        self.frame_interval = self.fine_interval
+        self.sampling = get_sampling_policy(log.camera_ip)
+        if self.sampling.adaptive:
+            self.frame_interval = max(int(fps * self.sampling.coarse_interval), self.fine_interval)
+        self.file_offset = log.segment_offset or 0
+
+        # 读取器只完整解码采样帧；重置到开头（小时合并文件定位到本分钟的偏移）
+        self.reader = get_frame_reader_class()(
+            self.cap, fps, log.segment_offset, path=analysis_path, frame_interval=self.frame_interval,
+            duration=self.segment_frames / fps if self.segment_frames is not None else None,
+        )
+        self.reader.reset()
+        if self.reader.scaled and self.main_cap is None:
+            # 读取器输出的是缩小后的帧，截图从原视频读取
+            self.main_cap = cv2.VideoCapture(log.file_path)
+
+        if is_motion_filter_enabled():
+            self.motion_filter = FrameMotionFilter()
+
+        self.roi = get_camera_roi(log.camera_ip)
+        if self.roi is not None:
+            logger.info(f"检测区域: 外接矩形 {self.roi.bounds}（归一化坐标）")
+
+        self.cache = DetectionCache.for_video(
+            analysis_path,
+            [log.segment_offset, log.segment_duration] if log.segment_offset is not None else None,
+            list(self.roi.bounds) if self.roi is not None else None,
+            self.reader.width if self.reader.scaled else None,
+            refresh=self.refresh_cache,
+        )
+        if self.cache is not None:
+            logger.info(f"检测缓存: {self.cache.path}，已缓存 {len(self.cache.frames)} 帧")
+
+        if log.analysis_checkpoint:
+            self.resume(log.analysis_checkpoint, is_tracking_enabled())
+        elif is_tracking_enabled():
+            self.tracker = self.load_tracker()
+
+        # 关键帧索引对应主码流文件；静止的秒可以整段跳到下一个需要检测的 GOP
+        self.keyframes = log.keyframe_index if analysis_path == log.file_path else None
+        self.active_sorted = sorted(self.motion_active) if self.motion_active is not None else None
+
+        self.video_filename, self.output_dir = self.get_output_location()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.snapshot_writer = SnapshotWriter()
+        self.opened = True
+        logger.info(
+            f"视频验证通过，开始分析（帧读取器: {self.reader.name}，采样: {self.sampling}），输出目录: {self.output_dir}"
+        )
+
+    def load_tracker(self):
+        """创建人物跟踪器，接续同一摄像头上一分钟录像结束时的轨迹"""
+        from apps.cameras.models import RecordLog
+        from apps.cameras.tracking import PersonTracker
+
+        tracker = PersonTracker()
+        start = self.log.start_time
+        # 上一分钟的录像（中间缺录超过 max_age 时轨迹已结束，不需要查更早的录像）
+        previous_state = (
+            RecordLog.objects.filter(
+                camera_ip=self.log.camera_ip,
+                start_time__lt=start,
+                start_time__gte=start - timedelta(seconds=60 + tracker.max_age),
+                track_state__isnull=False,
+            )
+            .order_by('-start_time')
+            .values_list('track_state', flat=True)
+            .first()
+        )
+        tracker.load(previous_state, start.timestamp())
+        if tracker.tracks:
+            logger.info(f"接续上一分钟的人物轨迹 {len(tracker.tracks)} 条")
+        return tracker
+
+    def resume(self, checkpoint, tracking):
+        """从检查点继续：跳过已处理的帧，恢复去重状态"""
+        from apps.cameras.tracking import PersonTracker
+
+        self.start_frame = checkpoint['frame'] + self.frame_interval
+        self.last_checkpoint = checkpoint['frame'] / self.fps
+        self.stats['inferred_frames'] = checkpoint.get('inferred_frames', 0)
+        self.stats['refined_windows'] = checkpoint.get('refined_windows', 0)
+        self.refined_done = set(checkpoint.get('refined_frame_numbers') or [])
+        self.stats['refined_frames'] = checkpoint.get('refined_frames', 0)
+        if checkpoint.get('last_detection_time') is not None:
+            self.last_detection_time = checkpoint['last_detection_time']
+        if tracking:
+            self.tracker = PersonTracker()
+            self.tracker.load(checkpoint.get('tracks'), self.log.start_time.timestamp() + self.last_checkpoint)
+        self.saved_frames = set(self.log.detections.values_list('frame_number', flat=True))
+        logger.info(
+            f"从检查点继续: 第 {self.start_frame} 帧（{self.start_frame / self.fps:.1f}s），"
+            f"已保存 {len(self.saved_frames)} 个检测"
+        )
+
+    def get_output_location(self):
+        """截图文件名前缀和输出目录"""
+        log = self.log
+        camera_ip = log.camera_ip
+
+        if log.segment_offset is not None:
+            # 小时合并文件名是小时，截图仍按分钟命名
+            return log.start_time.strftime('%M'), os.path.join(
+                self.pics_base_dir, camera_ip, log.start_time.strftime("%Y/%m/%d/%H")
+            )
+
+        video_filename = os.path.basename(log.file_path).replace('.mp4', '')
+        # 从视频路径提取日期信息，例如: /path/to/192.168.0.201/2025/11/18/20/02.mp4
+        path_parts = os.path.dirname(log.file_path).split(os.sep)
+        for i, part in enumerate(path_parts):
+            if part == camera_ip and i + 4 < len(path_parts):
+                return video_filename, os.path.join(self.pics_base_dir, camera_ip, *path_parts[i + 1:i + 5])
+
+        # 备用方案：使用当前时间
+        now = datetime.now()
+        return video_filename, os.path.join(self.pics_base_dir, camera_ip, now.strftime("%Y/%m/%d/%H"))
+
+    def sample_frames(self):
+        """按采样间隔读取帧，运动指数覆盖范围内的静止秒不解码；产出 (帧序号, 时间戳, 帧)"""
+        from apps.cameras.keyframes import keyframe_before
+
+        reader = self.reader
+        motion_index, motion_active = self.motion_index, self.motion_active
+        current_frame = self.start_frame   # 下一个采样帧
+        if current_frame:
+            # 从检查点继续，检查点之前的帧不再解码
+            jump_frame = current_frame
+            if self.keyframes:
+                jump_to = keyframe_before(self.keyframes, self.file_offset + current_frame / self.fps) - self.file_offset
+                jump_frame = min(max(int(round(jump_to * self.fps)), 0), current_frame)
+            reader.seek(jump_frame)
+        while True:
+            if self.segment_frames is not None and current_frame >= self.segment_frames:
+                logger.info(f"本分钟区间读取结束，已采样到第 {current_frame} 帧")
+                return
+
+            timestamp = current_frame / self.fps
+            second = int(timestamp)
+            if motion_active is not None and second < len(motion_index) and second not in motion_active:
+                self.stats['motion_skipped'] += 1
+                # 直接跳到下一个需要检测的秒对应的采样帧
+                next_index = bisect.bisect_right(self.active_sorted, second)
+                target = self.active_sorted[next_index] if next_index < len(self.active_sorted) else len(motion_index)
+                target_frame = -(-int(target * self.fps) // self.frame_interval) * self.frame_interval
+                if self.keyframes:
+                    # 定位到目标之前的关键帧，中间的静止画面连 grab 都不需要
+                    jump_to = keyframe_before(self.keyframes, self.file_offset + target) - self.file_offset
+                    jump_frame = int(round(jump_to * self.fps))
+                    if jump_frame > reader.position + 1:
+                        self.stats['gop_skipped_frames'] += jump_frame - reader.position
+                        reader.seek(jump_frame)
+                current_frame = max(target_frame, current_frame + self.frame_interval)
+                continue
+
+            ok, frame = reader.read(current_frame)
+            if not ok:
+                # 视频读取结束（正常到达末尾或文件损坏）
+                logger.info(f"视频读取结束，已采样到第 {current_frame}/{self.total_frames} 帧")
+                return
+            if frame is None:
+                logger.warning(f"帧 {current_frame} 无效（空帧），跳过")
+            elif self.motion_filter is not None and not self.motion_filter.accept(self.model_input(frame)):
+                self.stats['prefilter_skipped'] += 1
+            else:
+                self.stats['sampled_frames'] += 1
+                yield current_frame, timestamp, frame
+            current_frame += self.frame_interval
+
+    def select(self, frame_number, timestamp, frame, person_detections):
+        """
+        按人物轨迹（或时间窗口）去重，选出需要保存的检测（同一录像的帧需按时间顺序传入，没有人物的帧也要传入）
+
+        Args:
+            person_detections: 该帧检测区域内、置信度达标的人物框（整帧坐标）
+
+        Returns:
+            list: 写入任务 [(帧序号, 时间戳, 帧, 检测), ...]，轨迹去重时可能是之前帧的截图；
+                到检查点间隔时末尾附带 Checkpoint
+        """
+        jobs = self._select(frame_number, timestamp, frame, person_detections)
+        if self._checkpoint_due(timestamp):
+            jobs += self._checkpoint(frame_number, timestamp)
+        return jobs
+
+    def _checkpoint_due(self, timestamp):
+        return self.checkpoint_interval > 0 and timestamp - self.last_checkpoint >= self.checkpoint_interval
+
+    def _select(self, frame_number, timestamp, frame, person_detections):
+        if self.tracker is not None:
+            height, width = frame.shape[:2]
+            jobs = self.tracker.update(self.log.start_time.timestamp() + timestamp, [
+                (
+                    [detection['bbox'][0] / width, detection['bbox'][1] / height,
+                     detection['bbox'][2] / width, detection['bbox'][3] / height],
+                    detection['confidence'],
+                    (frame_number, timestamp, frame, detection),
+                )
+                for detection in person_detections
+            ])
+            return self._accept(jobs)
+
+        jobs = []
+        time_since_last = timestamp - self.last_detection_time
+        if self.candidate is not None and time_since_last >= self.dedup_window:
+            # 时间窗口结束，保存窗口内置信度最高的检测
+            jobs, self.candidate = [self.candidate], None
+        if not person_detections:
+            return self._accept(jobs)
+
+        best_detection = max(person_detections, key=lambda x: x['confidence'])
+        if time_since_last >= self.dedup_window:
+            # 距离上个窗口开始 >= dedup_window，从这次检测开始新的时间窗口
+            self.last_detection_time = timestamp
+            self.candidate = (frame_number, timestamp, frame, best_detection)
+        elif self.candidate is not None and best_detection['confidence'] > self.candidate[3]['confidence']:
+            self.candidate = (frame_number, timestamp, frame, best_detection)
+        else:
+            logger.debug(f"✗ 跳过重复检测: 帧{frame_number}, 时间{timestamp:.1f}s, 距窗口开始仅{time_since_last:.1f}s (需>={self.dedup_window}s)")
+        return self._accept(jobs)
+
+    def _flush_pending(self):
+        """尚未保存的检测：轨迹去重时为尚未保存过截图的轨迹，时间窗口去重时为当前窗口内的最佳检测"""
+        if self.tracker is not None:
+            return self._accept(self.tracker.flush())
+        jobs, self.candidate = [self.candidate] if self.candidate is not None else [], None
+        return self._accept(jobs)
+
+    def flush_tracks(self):
+        """录像的帧全部处理完后，保存仍在画面中的轨迹或当前时间窗口内的最佳检测（需在 release() 之前调用）"""
+        for job in self._flush_pending():
+            self.save(job)
+
+    def _checkpoint(self, frame_number, timestamp, refined_frame_numbers=()):
+        """
+        检查点：尚未保存过截图的轨迹（或当前时间窗口的最佳检测）先保存目前为止的最佳截图（候选帧无法写入检查点），
+        然后记录进度和去重状态
+
+        Args:
+            refined_frame_numbers: 扫描帧 frame_number 之后、已处理过的本区间加密帧
+        """
+        self.last_checkpoint = timestamp
+        jobs = self._flush_pending()
+        jobs.append(Checkpoint({
+            'frame': frame_number,
+            'inferred_frames': self.stats['inferred_frames'],
+            'refined_windows': self.stats['refined_windows'],
+            'refined_frames': self.stats['refined_frames'],
+            'refined_frame_numbers': sorted(refined_frame_numbers),
+            'last_detection_time': self.last_detection_time,
+            'tracks': self.tracker.state() if self.tracker is not None else None,
+        }))
+        return jobs
+
+    def _accept(self, jobs):
+        """同一帧只保存一次（保留置信度最高的检测）"""
+        accepted = []
+        for job in sorted(jobs, key=lambda job: job[3]['confidence'], reverse=True):
+            if job[0] in self.saved_frames:
+                continue
+            self.saved_frames.add(job[0])
+            accepted.append(job)
+        self.stats['detections'] += len(accepted)
+        return accepted
+
+    def model_input(self, frame):
+        """送入模型的画面：配置了检测区域时为区域外接矩形的裁剪"""
+        return self.roi.crop(frame) if self.roi is not None else frame
+
+    def cached_boxes(self, frame_number):
+        """检测缓存中该帧的人物框（归一化坐标），未开启缓存或未命中时为 None"""
+        if self.cache is None:
+            return None
+        boxes = self.cache.get(frame_number)
+        if boxes is not None:
+            self.stats['cache_hits'] += 1
+        return boxes
+
+    def remember_boxes(self, frame_number, frame, person_detections):
+        """
+        模型输出的人物框按模型输入画面归一化，写入检测缓存
+
+        Returns:
+            list: [[x1, y1, x2, y2, 置信度], ...]（归一化坐标）
+        """
+        height, width = self.model_input(frame).shape[:2]
+        boxes = []
+        for detection in person_detections:
+            x1, y1, x2, y2 = detection['bbox']
+            boxes.append([
+                round(x1 / width, 6), round(y1 / height, 6), round(x2 / width, 6), round(y2 / height, 6),
+                round(detection['confidence'], 6),
+            ])
+        if self.cache is not None:
+            self.cache.put(frame_number, boxes)
+        return boxes
+
+    def filter_boxes(self, frame, boxes):
+        """归一化人物框换算为模型输入坐标，保留置信度达标的（extract_batch_person_detections 的格式）"""
+        height, width = self.model_input(frame).shape[:2]
+        return [
+            {'confidence': confidence, 'bbox': [x1 * width, y1 * height, x2 * width, y2 * height]}
+            for x1, y1, x2, y2, confidence in boxes
+            if confidence >= self.confidence_threshold
+        ]
+
+    def detect(self, model, batch):
+        """
+        批量推理本录像的采样帧
+
+        Args:
+            batch: [(帧序号, 时间戳, 帧), ...]
+
+        Returns:
+            list: 写入任务
+        """
+        person_detections, _ = infer_frames(model, [(self, item) for item in batch])
+        return self.select_batch(model, list(zip(batch, person_detections)))
+
+    def select_batch(self, model, items):
+        """
+        对本录像一批已推理的采样帧去重；自适应采样时先对需要加密的区间补充推理
+
+        Args:
+            items: [((帧序号, 时间戳, 帧), 人物框), ...]，按时间顺序，人物框为 infer_frames 的结果
+
+        Returns:
+            list: 写入任务
+        """
+        if not items:
+            return []
+        items = [(item, self._in_region(item[2], detections)) for item, detections in items]
+        self.stats['inferred_frames'] += len(items)
+        refined = self.refine(model, items) if self.sampling.adaptive else []
+
+        # 加密帧按时间顺序插在扫描帧之间；检查点只在扫描帧上写，等该扫描帧区间内的加密帧都处理完再写，
+        # 重试时从下一个扫描帧的区间继续，区间内已处理的加密帧记录在检查点中
+        jobs = []
+        pending = None  # 待写的检查点 (扫描帧序号, 时间戳, 之后已处理的加密帧)
+        window_end = self.frame_interval - self.frame_interval // 2 if refined else 0
+        for (item, detections), is_refined in sorted(
+            [(entry, False) for entry in items] + [(entry, True) for entry in refined],
+            key=lambda pair: pair[0][0][0],
+        ):
+            frame_number = item[0]
+            if pending is not None and frame_number >= pending[0] + window_end:
+                jobs += self._checkpoint(*pending)
+                pending = None
+            jobs += self._select(*item, detections)
+            if is_refined:
+                if pending is not None:
+                    pending[2].append(frame_number)
+            elif self._checkpoint_due(item[1]):
+                pending = (frame_number, item[1], [])
+        if pending is not None:
+            jobs += self._checkpoint(*pending)
+        return jobs
+
+    def refine(self, model, items):
+        """
+        自适应采样：扫描帧检测到人物或所代表区间内有运动时，按固定采样间隔读取区间内的加密帧并推理
+
+        Returns:
+            list: [((帧序号, 时间戳, 帧), 检测区域内的人物框), ...]
+        """
+        from apps.cameras.sampling import refine_window
+
+        limit = self.segment_frames if self.segment_frames is not None else self.total_frames
+        numbers = []
+        for (frame_number, _, _), detections in items:
+            if detections or self._window_has_motion(frame_number):
+                self.stats['refined_windows'] += 1
+                numbers += [
+                    number for number in refine_window(frame_number, self.frame_interval, self.fine_interval, limit)
+                    if number not in self.refined_done
+                ]
+        if not numbers:
+            return []
+
+        frames = self.read_frames(numbers)
+        if not frames:
+            return []
+        person_detections, _ = infer_frames(model, [(self, item) for item in frames])
+        self.stats['refined_frames'] += len(frames)
+        self.stats['inferred_frames'] += len(frames)
+        return [(item, self._in_region(item[2], detections)) for item, detections in zip(frames, person_detections)]
+
+    def read_frames(self, frame_numbers):
+        """
+        按帧序号读取加密帧（在推理线程中执行，使用独立的 VideoCapture，不影响读取器的位置）
+
+        Returns:
+            list: [(帧序号, 时间戳, 帧), ...]
+        """
+        import cv2  # 延迟导入
+
+        if self.refine_cap is None:
+            self.refine_cap = cv2.VideoCapture(self.analysis_path)
+        cap = self.refine_cap
+        frames = []
+        position = None     # 下一次 read 将得到的帧序号
+        for frame_number in sorted(set(frame_numbers)):
+            # 同一区间内的帧向前 grab，跨区间时重新定位
+            if position is None or frame_number < position or frame_number - position > self.frame_interval:
+                cap.set(cv2.CAP_PROP_POS_MSEC, (self.file_offset + frame_number / self.fps) * 1000)
+                position = frame_number
+            while position < frame_number and cap.grab():
+                position += 1
+            ret, frame = cap.read()
+            position += 1
+            if ret and frame is not None:
+                frames.append((frame_number, frame_number / self.fps, frame))
+        return frames
+
+    def _window_has_motion(self, frame_number):
+        """扫描帧所代表区间内的运动指数是否达到加密阈值"""
+        if not self.sampling.refine_motion or self.motion_index is None:
+            return False
+        half = self.frame_interval // 2
+        first = max(int((frame_number - half) / self.fps), 0)
+        last = int((frame_number + self.frame_interval - half) / self.fps)
+        return any(score >= self.sampling.refine_motion for score in self.motion_index[first:last + 1])
+
+    def _in_region(self, frame, person_detections):
+        """裁剪画面的坐标换算回整帧，脚部不在检测区域内的丢弃"""
+        if not person_detections or self.roi is None:
+            return person_detections
+        height, width = frame.shape[:2]
+        in_region = []
+        for detection in person_detections:
+            bbox = self.roi.to_frame_bbox(detection['bbox'], width, height)
+            if self.roi.contains_bbox(bbox, width, height):
+                in_region.append({**detection, 'bbox': bbox})
+        self.stats['roi_dropped'] += len(person_detections) - len(in_region)
+        return in_region
+
+    def save(self, job):
+        """提交一个检测的截图编码，PersonDetection 记录留到检查点或 complete() 批量写入"""
+        from apps.cameras.models import PersonDetection
+
+        if isinstance(job, Checkpoint):
+            self.write_checkpoint(job.state)
+            return
+
+        frame_number, timestamp, snapshot, detection = job
+        bbox = detection['bbox']
+
+        if self.main_cap is not None:
+            # 截图取原视频同一时刻的高清画面，边界框按分辨率比例换算
+            main_frame_number, main_frame = read_frame_at(self.main_cap, self.file_offset + timestamp)
+            if main_frame is not None:
+                scale_x = main_frame.shape[1] / snapshot.shape[1]
+                scale_y = main_frame.shape[0] / snapshot.shape[0]
+                bbox = [bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y]
+                snapshot = main_frame
+                if not self.file_offset:
+                    # 小时合并文件的帧序号是整个小时内的，仍使用本分钟内的序号
+                    frame_number = main_frame_number
+            else:
+                logger.warning(f"原视频读取失败，使用分析帧截图: 时间{timestamp:.1f}s")
+
+        # 截图按 SNAPSHOT_MAX_WIDTH 缩小时，边界框同比例换算
+        scale = self.snapshot_writer.scale(snapshot)
+        if scale != 1.0:
+            bbox = [value * scale for value in bbox]
+
+        # 保存图片（异步编码）
+        image_path, thumbnail_path = self.snapshot_writer.paths(
+            os.path.join(self.output_dir, f"{self.video_filename}_frame_{frame_number:05d}_person")
+        )
+        self.snapshot_writer.submit(snapshot, image_path, thumbnail_path)
+
+        self.detections.append(PersonDetection(
+            record_log=self.log,
+            frame_number=frame_number,
+            timestamp=timestamp,
+            image_path=image_path,
+            thumbnail_path=thumbnail_path,
+            confidence=detection['confidence'],
+            bbox=bbox
+        ))
+        logger.debug(f"✓ 保存人物检测: 帧{frame_number}, 时间{timestamp:.1f}s, 置信度{detection['confidence']:.2f}")
+
+    def write_checkpoint(self, state):
+        """等待截图写完，写入已攒下的检测记录和进度"""
+        from apps.cameras.models import PersonDetection
+
+        self.snapshot_writer.drain()
+        self.log.analysis_checkpoint = state
+        # 刷新领取时间，长录像检测中不会被当作遗留记录退回待检测
+        self.log.analysis_claimed_at = timezone.now()
+        with transaction.atomic():
+            if self.detections:
+                # 唯一约束 (record_log, frame_number)：检查点之前已写入的帧不会重复
+                PersonDetection.objects.bulk_create(self.detections, ignore_conflicts=True)
+            self.log.save(update_fields=['analysis_checkpoint', 'analysis_claimed_at'])
+        self.detections = []
+        self.stats['checkpoints'] += 1
+
+    def complete(self):
+        """等待截图写完，写入检测记录并标记为检测完成"""
+        from apps.cameras.models import PersonDetection
+
+        if self.snapshot_writer is not None:
+            # 截图写入失败时抛出异常，录像标记为失败，不写入指向缺失文件的记录
+            self.snapshot_writer.drain()
+
+        self.log.analysis_status = 'completed'
+        self.log.analysis_time = timezone.now()
+        self.log.analysis_checkpoint = None
+        update_fields = ['analysis_status', 'analysis_time', 'analysis_checkpoint']
+        if self.opened:
+            self.log.inferred_frames = self.stats['inferred_frames']
+            update_fields.append('inferred_frames')
+        if self.tracker is not None:
+            # 仍在画面中的轨迹留给下一分钟接续
+            self.log.track_state = self.tracker.state()
+            update_fields.append('track_state')
+        # 检测记录和完成状态一起提交，不会出现已完成但只写了一部分检测的录像
+        with transaction.atomic():
+            if self.detections:
+                PersonDetection.objects.bulk_create(self.detections, ignore_conflicts=True)
+            self.log.save(update_fields=update_fields)
+        self.detections = []
+        if not self.opened:
+            return
+        logger.info(f"帧读取: 完整解码 {self.stats['decoded_frames']} 帧，仅 grab {self.stats['grabbed_frames']} 帧")
+        if self.motion_active is not None:
+            logger.info(
+                f"运动过滤: 跳过 {self.stats['motion_skipped']} 个静止采样帧，"
+                f"按关键帧索引免解码 {self.stats['gop_skipped_frames']} 帧"
+            )
+        if self.motion_filter is not None:
+            checked = self.stats['prefilter_skipped'] + self.stats['sampled_frames']
+            saved = self.stats['prefilter_skipped'] / checked * 100 if checked else 0
+            logger.info(
+                f"运动预过滤: {checked} 个采样帧中跳过 {self.stats['prefilter_skipped']} 个画面无变化的帧，"
+                f"减少推理 {saved:.0f}%（阈值 {self.motion_filter.threshold}）"
+            )
+        if self.sampling.adaptive:
+            logger.info(
+                f"自适应采样: 扫描 {self.stats['inferred_frames'] - self.stats['refined_frames']} 帧，"
+                f"加密 {self.stats['refined_windows']} 个区间 {self.stats['refined_frames']} 帧，"
+                f"共推理 {self.stats['inferred_frames']} 帧（固定间隔采样需推理 {self.fixed_sampling_frames()} 帧）"
+            )
+        else:
+            logger.info(f"采样: 共推理 {self.stats['inferred_frames']} 帧")
+        if self.roi is not None:
+            logger.info(f"检测区域: 丢弃区域外的人物框 {self.stats['roi_dropped']} 个")
+        if self.cache is not None:
+            logger.info(
+                f"检测缓存: 命中 {self.stats['cache_hits']} 帧，"
+                f"推理 {self.stats['inferred_frames'] - self.stats['cache_hits']} 帧"
+            )
+        if self.tracker is not None:
+            logger.info(
+                f"人物跟踪: 新轨迹 {self.tracker.created} 条，保存截图 {self.stats['detections']} 张，"
+                f"录像结束时仍在画面中 {len(self.tracker.tracks)} 条"
+            )
+        if self.snapshot_writer.stats['images']:
+            logger.info(f"截图写入: {self.snapshot_writer.summary()}")
+        logger.info(f"视频分析完成: {self.log.file_path}, 检测到 {self.stats['detections']} 个人物")
+
+    def fixed_sampling_frames(self):
+        """按 DETECTION_SAMPLE_INTERVAL 固定间隔采样（同样跳过静止的秒）需要推理的帧数，用于对比自适应采样"""
+        limit = self.segment_frames if self.segment_frames is not None else self.total_frames
+        count = 0
+        for frame_number in range(0, limit, self.fine_interval):
+            second = int(frame_number / self.fps)
+            if self.motion_active is None or second >= len(self.motion_index) or second in self.motion_active:
+                count += 1
+        return count
+
+    def fail(self):
+        """标记为检测失败"""
+        self.log.analysis_status = 'failed'
+        self.log.save(update_fields=['analysis_status'])
+
+    def release(self):
+        """释放读取器和视频资源"""
+        if self.reader is not None:
+            self.stats['decoded_frames'] = self.reader.decoded_frames
+            self.stats['grabbed_frames'] = self.reader.grabbed_frames
+        if self.cache is not None:
+            # 中途失败时已推理的帧也写入缓存，重试时不再推理
+            try:
+                self.cache.save()
+            except OSError as e:
+                logger.warning(f"检测缓存写入失败: {self.cache.path}: {e}")
+        for resource in (self.reader, self.cap, self.main_cap, self.refine_cap):
+            if resource is None:
+                continue
+            try:
+                resource.release()
+            except Exception:
+                pass
+        self.reader = self.cap = self.main_cap = self.refine_cap = None
+
+    def _reject(self, error_msg):
+        logger.error(error_msg)
+        self.fail()
+        raise AnalysisSkipped(error_msg)
@@ -0,0 +1,130 @@
+"""
+两级分辨率级联检测
+
+所有采样帧都按 YOLO_IMGSZ 推理时，明显没有人的帧浪费算力，远处的小人物又容易漏检。
+开启 DETECTION_CASCADE 后，每个采样帧先按 DETECTION_CASCADE_IMGSZ（默认 320）做一次低分辨率推理：
+
+- 最高人物置信度低于 DETECTION_CASCADE_LOW（默认 0.1，也是低分辨率推理的置信度下限）：视为没有人物
+- 最高人物置信度不低于 DETECTION_CASCADE_HIGH（默认 0.7）：直接采用低分辨率的结果
+- 介于两者之间的“不确定”帧升级：按 DETECTION_CASCADE_REFINE_IMGSZ（默认 YOLO_IMGSZ）重新推理，
+  或配置 DETECTION_CASCADE_MODEL 时改用更大的模型
+
+CascadeModel 与 YOLO 模型的调用方式相同（model(frames, verbose=False) 返回逐帧结果），
+检测任务和检测服务直接替换模型即可；统计升级帧比例和两级合计的每秒帧数。
+"""
+import os
+import time
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def is_cascade_enabled():
+    """是否使用两级级联检测（DETECTION_CASCADE）"""
+    return os.getenv('DETECTION_CASCADE', 'False').lower() in ('true', '1', 't')
+
+
+def get_cascade_config(force=False):
+    """级联参数（也是检测缓存键的一部分），未开启时为 None（force 为 True 时总是返回）"""
+    from apps.cameras.detection import get_imgsz
+
+    if not force and not is_cascade_enabled():
+        return None
+    return {
+        'imgsz': int(os.getenv('DETECTION_CASCADE_IMGSZ', '320')),
+        'low': float(os.getenv('DETECTION_CASCADE_LOW', '0.1')),
+        'high': float(os.getenv('DETECTION_CASCADE_HIGH', '0.7')),
+        'refine_imgsz': int(os.getenv('DETECTION_CASCADE_REFINE_IMGSZ', '0')) or get_imgsz(),
+        'refine_model': os.getenv('DETECTION_CASCADE_MODEL', ''),
+    }
+
+
+class CascadeModel:
+    """
+    两级级联检测模型
+
+    Args:
+        model: 第一级（低分辨率）使用的 YOLO 模型
+        refine_model: 第二级使用的 YOLO 模型（可以与 model 相同）
+        imgsz: 第一级输入尺寸
+        refine_imgsz: 第二级输入尺寸
+        low: 第一级最高人物置信度低于该值时视为没有人物
+        high: 第一级最高人物置信度不低于该值时直接采用
+    """
+
+    def __init__(self, model, refine_model, imgsz, refine_imgsz, low, high):
+        self.model = model
+        self.refine_model = refine_model
+        self.imgsz = imgsz
+        self.refine_imgsz = refine_imgsz
+        self.low = low
+        self.high = high
+        self.stats = Counter()
+
+    def __call__(self, frames, verbose=False):
+        from apps.cameras.detection import extract_batch_person_detections
+
+        frames = list(frames)
+        if not frames:
+            return []
+        started = time.perf_counter()
+        results = list(self.model(frames, imgsz=self.imgsz, conf=self.low, verbose=verbose))
+        first_done = time.perf_counter()
+
+        escalate = [
+            index for index, detections in enumerate(extract_batch_person_detections(results, self.low))
+            if detections and max(detection['confidence'] for detection in detections) < self.high
+        ]
+        if escalate:
+            refined = self.refine_model([frames[index] for index in escalate], imgsz=self.refine_imgsz, verbose=verbose)
+            for index, result in zip(escalate, refined):
+                results[index] = result
+
+        finished = time.perf_counter()
+        self.stats['frames'] += len(frames)
+        self.stats['escalated'] += len(escalate)
+        self.stats['first_seconds'] += first_done - started
+        self.stats['refine_seconds'] += finished - first_done
+        return results
+
+    def summary(self):
+        """升级比例和两级合计的每秒帧数"""
+        frames = self.stats['frames']
+        if not frames:
+            return "级联检测: 没有推理帧"
+        seconds = self.stats['first_seconds'] + self.stats['refine_seconds']
+        return (
+            f"级联检测: 推理 {frames} 帧，升级 {self.stats['escalated']} 帧"
+            f"（{self.stats['escalated'] / frames * 100:.1f}%），"
+            f"净速度 {frames / seconds if seconds else 0:.1f} 帧/秒"
+            f"（第一级 imgsz={self.imgsz} {self.stats['first_seconds']:.2f}s，"
+            f"第二级 imgsz={self.refine_imgsz} {self.stats['refine_seconds']:.2f}s）"
+        )
+
+
+def get_cascade_model(model, device=None, backend=None, force=False):
+    """
+    按环境变量包装为级联模型，未开启 DETECTION_CASCADE 时原样返回
+
+    Args:
+        model: 已加载的 YOLO_MODEL_PATH 模型（第一级）
+        device: 第二级单独的模型使用的设备
+        backend: 第二级单独的模型使用的推理后端
+        force: 不论 DETECTION_CASCADE 是否开启都包装（用于对比测试）
+    """
+    from apps.cameras.detection import get_yolo_model
+
+    config = get_cascade_config(force)
+    if config is None:
+        return model
+    refine_model = model
+    if config['refine_model']:
+        refine_model = get_yolo_model(config['refine_model'], device, config['refine_imgsz'], backend)
+    logger.info(
+        f"级联检测: 第一级 imgsz={config['imgsz']}，最高置信度在 [{config['low']}, {config['high']}) 的帧"
+        f"升级到第二级 {config['refine_model'] or '同一模型'} imgsz={config['refine_imgsz']}"
+    )
+    return CascadeModel(
+        model, refine_model, config['imgsz'], config['refine_imgsz'], config['low'], config['high']
+    )
@@ -0,0 +1,206 @@
+"""
+录像小时合并
+
+每个摄像头每小时 60 个分钟文件，时间长了 inode 和目录扫描、归档同步都很慢。
+已结束的小时用 ffmpeg concat 直接复制（不重新编码）合并为 <ip>/YYYY/MM/DD/HH.mp4，
+每条 RecordLog 的 file_path 改指向小时文件，并记录本分钟在文件内的偏移 segment_offset 和时长 segment_duration，
+播放时通过 #t= 媒体片段定位到本分钟。
+
+合并结果经 ffprobe 校验时长后才更新数据库、删除原分钟文件；校验失败时保留原文件，下次重试。
+子码流文件只用于人物检测，合并时一并删除，因此只合并检测已结束的小时。
+编码或分辨率不一致的小时无法直接复制合并，标记 compaction_skipped 后不再参与合并。
+"""
+import os
+import subprocess
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from apps.cameras.keyframes import split_keyframes
+from apps.cameras.probe import probe_keyframes, probe_video
+
+logger = logging.getLogger(__name__)
+
+# 合并中的临时文件后缀
+COMPACTING_SUFFIX = ".compacting.mp4"
+
+
+def build_concat_command(list_file, output_file):
+    """生成 concat 直接复制合并的 ffmpeg 命令"""
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", list_file,
+        "-map", "0:v",
+        "-c", "copy",
+        "-movflags", "+faststart",    # moov 前置，浏览器按 #t= 跳转时无需先下载整个文件
+        "-y", output_file,
+    ]
+
+
+class HourCompactor:
+    """
+    按小时合并分钟录像
+
+    Args:
+        grace_minutes: 小时结束后等待多久再合并（等待最后一个切片写完）
+        max_hours: 每次运行最多合并的小时数
+        dry_run: 只列出可合并的小时，不执行
+    """
+
+    def __init__(self, grace_minutes=None, max_hours=None, dry_run=False):
+        self.grace_minutes = grace_minutes or int(os.getenv('COMPACTION_GRACE_MINUTES', '10'))
+        self.max_hours = max_hours or int(os.getenv('COMPACTION_MAX_HOURS', '50'))
+        self.tolerance = float(os.getenv('COMPACTION_DURATION_TOLERANCE', '2'))
+        self.dry_run = dry_run
+        self.stats = Counter()
+
+    def find_hours(self, camera_ips=None):
+        """
+        查询可以合并的 (摄像头IP, 小时) 列表，从最旧的小时开始
+
+        只考虑主存储中录制成功、尚未合并的录像；小时结束超过 grace_minutes 才参与合并
+        """
+        from apps.cameras.models import RecordLog
+
+        cutoff = timezone.now().replace(minute=0, second=0, microsecond=0)
+        if timezone.now() - cutoff < timedelta(minutes=self.grace_minutes):
+            cutoff -= timedelta(hours=1)
+
+        queryset = RecordLog.objects.filter(
+            status='success', storage_tier='hot', segment_offset__isnull=True, compaction_skipped=False,
+            start_time__lt=cutoff,
+        )
+        if camera_ips:
+            queryset = queryset.filter(camera_ip__in=camera_ips)
+        return list(
+            queryset.annotate(hour=TruncHour('start_time'))
+            .values_list('camera_ip', 'hour')
+            .distinct()
+            .order_by('hour', 'camera_ip')[:self.max_hours]
+        )
+
+    def run(self, camera_ips=None):
+        """
+        合并可合并的小时
+
+        Returns:
+            Counter: 统计信息
+        """
+        for camera_ip, hour in self.find_hours(camera_ips):
+            try:
+                self.compact_hour(camera_ip, hour)
+            except Exception as e:
+                logger.error(f"{camera_ip} {hour:%Y-%m-%d %H}时 合并失败: {e}", exc_info=True)
+                self.stats['failed_hours'] += 1
+        return self.stats
+
+    def compact_hour(self, camera_ip, hour):
+        """合并一个摄像头一个小时的录像，返回小时文件路径（跳过时返回 None）"""
+        from apps.cameras.models import RecordLog
+
+        label = f"{camera_ip} {hour:%Y-%m-%d %H}时"
+        logs = list(RecordLog.objects.filter(
+            camera_ip=camera_ip, status='success', storage_tier='hot', segment_offset__isnull=True,
+            compaction_skipped=False, start_time__gte=hour, start_time__lt=hour + timedelta(hours=1),
+        ).order_by('start_time', 'id'))
+
+        # 子码流文件会在合并后删除，等待检测结束
+        if any(log.analysis_status in ('pending', 'processing') for log in logs):
+            logger.info(f"{label} 还有未完成检测的录像，暂不合并")
+            self.stats['skipped_hours'] += 1
+            return None
+
+        missing = [log.id for log in logs if not log.file_path or not os.path.exists(log.file_path)]
+        if missing and not self.dry_run:
+            # 文件已不存在的记录标记为失败，避免该小时每次都被重新选中
+            RecordLog.objects.filter(id__in=missing).update(status='failed', error_message='合并时录像文件不存在')
+        logs = [log for log in logs if log.id not in missing]
+
+        hour_dirs = {os.path.dirname(log.file_path) for log in logs}
+        if len(hour_dirs) != 1:
+            # 不在同一目录说明目录结构异常，不处理
+            self.stats['skipped_hours'] += 1
+            return None
+
+        hour_dir = hour_dirs.pop()
+        output_file = f"{hour_dir}.mp4"
+        if os.path.exists(output_file):
+            if RecordLog.objects.filter(camera_ip=camera_ip, file_path=output_file).exists():
+                logger.warning(f"{label} 小时文件已存在，跳过: {output_file}")
+                self.stats['skipped_hours'] += 1
+                return None
+            # 上次合并后数据库未更新成功，残留的小时文件无人引用，重新合并
+            os.remove(output_file)
+
+        # 逐个读取时长计算偏移，编码或分辨率不一致（如 copy 回退转码）时无法直接复制合并
+        probes = [probe_video(log.file_path) for log in logs]
+        signatures = {(p['codec'], p['width'], p['height']) for p in probes}
+        if len(signatures) != 1:
+            logger.warning(f"{label} 编码或分辨率不一致，无法直接合并: {signatures}")
+            if not self.dry_run:
+                # 保留分钟文件（偏移仍为空，按分钟文件播放和检测），标记跳过，避免该小时每次都被重新选中
+                RecordLog.objects.filter(id__in=[log.id for log in logs]).update(compaction_skipped=True)
+            self.stats['skipped_hours'] += 1
+            return None
+
+        if self.dry_run:
+            self.stats['compacted_hours'] += 1
+            self.stats['compacted_files'] += len(logs)
+            return output_file
+
+        temp_file = f"{hour_dir}{COMPACTING_SUFFIX}"
+        list_file = f"{hour_dir}.concat.txt"
+        try:
+            with open(list_file, "w") as f:
+                for log in logs:
+                    f.write(f"file '{log.file_path}'\n")
+            subprocess.run(build_concat_command(list_file, temp_file), check=True, capture_output=True, timeout=600)
+
+            # 校验：合并后的时长与各分钟时长之和一致
+            expected = sum(p['duration'] for p in probes)
+            actual = probe_video(temp_file)['duration']
+            if abs(actual - expected) > self.tolerance:
+                raise ValueError(f"合并后时长 {actual:.1f}s 与预期 {expected:.1f}s 不一致")
+            keyframes = probe_keyframes(temp_file)
+            os.replace(temp_file, output_file)
+        finally:
+            for path in (list_file, temp_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        offset = 0.0
+        old_paths = []
+        for log, probe in zip(logs, probes):
+            old_paths += [log.file_path, log.sub_file_path]
+            log.file_path = output_file
+            log.sub_file_path = None
+            log.segment_offset = offset
+            log.segment_duration = probe['duration']
+            # 关键帧索引改为小时文件内的时间和偏移
+            log.keyframe_index = split_keyframes(keyframes, offset, offset + probe['duration'])
+            offset += probe['duration']
+        with transaction.atomic():
+            RecordLog.objects.bulk_update(
+                logs, ['file_path', 'sub_file_path', 'segment_offset', 'segment_duration', 'keyframe_index']
+            )
+
+        # 数据库更新成功后才删除原文件
+        for path in old_paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+        try:
+            os.rmdir(hour_dir)
+        except OSError:
+            pass    # 目录中还有其他文件（如未录制成功的残留），保留目录
+
+        self.stats['compacted_hours'] += 1
+        self.stats['compacted_files'] += len(logs)
+        logger.info(f"{label} 已合并 {len(logs)} 个文件: {output_file}")
+        return output_file
@@ -0,0 +1,262 @@
+"""
+YOLO 人物检测公共逻辑
+
+供 analyze_video_for_person 任务和录制进程内的实时检测共用。
+torch、YOLO 等重型依赖在函数内部延迟导入。
+
+模型按 (模型路径, 设备, 输入尺寸, 推理后端) 缓存在进程内，多个任务复用同一个模型，
+不再每个一分钟的视频都从磁盘加载一次。
+
+推理后端由 YOLO_BACKEND 选择：
+    torch    - PyTorch（默认，有 GPU 时使用 GPU）
+    onnx     - 导出为 ONNX 后用 ONNX Runtime 在 CPU 上推理
+    openvino - 导出为 OpenVINO IR 后在 CPU 上推理
+导出结果按模型文件哈希缓存在 YOLO_EXPORT_DIR，模型文件不变时只导出一次。
+导出模型仍由 ultralytics 加载，前后处理与 PyTorch 一致，输出的人物框相同。
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# COCO 数据集中 person 的类别 ID
+PERSON_CLASS_ID = 0
+
+# 可选的推理后端：名称 -> ultralytics 导出格式（None 表示不导出）
+YOLO_BACKENDS = {
+    'torch': None,
+    'onnx': 'onnx',
+    'openvino': 'openvino',
+}
+
+# 进程内模型缓存：(模型路径, 设备, 输入尺寸, 推理后端) -> 模型，按最近使用顺序排列
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+def get_device(use_gpu=None):
+    """根据 USE_GPU 配置和 CUDA 可用性选择推理设备"""
+    import torch  # 延迟导入
+
+    if use_gpu is None:
+        use_gpu = os.getenv('USE_GPU', 'True').lower() in ('true', '1', 't')
+    return 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
+
+
+def load_yolo_model(model_path, device, backend='torch', imgsz=None):
+    """加载 YOLO 模型并移动到指定设备；ONNX/OpenVINO 后端加载导出的模型，在 CPU 上推理"""
+    from ultralytics import YOLO  # 延迟导入
+
+    if backend != 'torch':
+        model = YOLO(export_model(model_path, backend, imgsz or get_imgsz()), task='detect')
+        model.overrides['device'] = 'cpu'
+        return model
+
+    model = YOLO(model_path)
+    if device == 'cuda':
+        # 设置 CUDA 环境变量避免多进程冲突
+        os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
+    model.to(device)
+    return model
+
+
+def get_backend():
+    """推理后端（YOLO_BACKEND，默认 torch）"""
+    backend = os.getenv('YOLO_BACKEND', 'torch')
+    if backend not in YOLO_BACKENDS:
+        raise ValueError(f"未知的推理后端: {backend}，可选: {', '.join(YOLO_BACKENDS)}")
+    return backend
+
+
+def file_sha256(path):
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_model(model_path, backend, imgsz):
+    """
+    将 PyTorch 权重导出为指定后端的模型，按权重哈希缓存
+
+    导出在临时目录中进行，完成后原子地移动到缓存路径，多个 worker 同时导出也不会互相覆盖。
+
+    Returns:
+        str: 导出的模型路径（ONNX 文件或 OpenVINO 模型目录）
+    """
+    from ultralytics import YOLO  # 延迟导入
+
+    export_format = YOLO_BACKENDS[backend]
+    if not os.path.exists(model_path):
+        # 模型名（如 yolov8n.pt）由 ultralytics 下载，加载一次得到实际的权重文件
+        model_path = YOLO(model_path).ckpt_path
+
+    export_dir = os.getenv('YOLO_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(model_path)), 'yolo_exports'))
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    name = f"{stem}-{file_sha256(model_path)[:16]}-{imgsz}"
+    target = os.path.join(export_dir, f"{name}.onnx" if export_format == 'onnx' else f"{name}_openvino_model")
+    if os.path.exists(target):
+        return target
+
+    logger.info(f"导出 YOLO 模型为 {backend}: {model_path} -> {target}")
+    os.makedirs(export_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"{name}.", dir=export_dir)
+    try:
+        weights = os.path.join(work_dir, f"{stem}.pt")
+        shutil.copyfile(model_path, weights)
+        # dynamic=True 允许不同的批大小
+        exported = YOLO(weights).export(format=export_format, imgsz=imgsz, dynamic=True, device='cpu')
+        try:
+            os.replace(exported, target)
+        except OSError:
+            if not os.path.exists(target):
+                raise
+            # 其他 worker 已经导出完成
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return target
+
+
+def get_imgsz():
+    """推理输入尺寸（YOLO_IMGSZ，默认 640 与 ultralytics 默认值一致）"""
+    return int(os.getenv('YOLO_IMGSZ', '640'))
+
+
+def get_model_cache_size():
+    """
+    进程内最多缓存的模型数（YOLO_MODEL_CACHE_SIZE，默认 1）
+
+    级联检测使用单独的第二级模型（DETECTION_CASCADE_MODEL）时至少为 2，加载第二级模型不会淘汰第一级
+    """
+    from apps.cameras.cascade import get_cascade_config
+
+    size = int(os.getenv('YOLO_MODEL_CACHE_SIZE', '1'))
+    cascade = get_cascade_config()
+    if cascade is not None and cascade['refine_model']:
+        size = max(size, 2)
+    return size
+
+
+def get_yolo_model(model_path=None, device=None, imgsz=None, backend=None):
+    """
+    从进程内缓存获取 YOLO 模型，未命中时加载（推理后端默认读取 YOLO_BACKEND）
+
+    缓存最多保留 get_model_cache_size() 个模型，超出时淘汰最久未使用的；
+    GPU 显存占用超过 YOLO_CACHE_MAX_GPU_PERCENT（默认 90）时，先淘汰其他模型再加载。
+    """
+    model_path = model_path or os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')
+    device = device or get_device()
+    imgsz = imgsz or get_imgsz()
+    backend = backend or get_backend()
+    if backend != 'torch':
+        device = 'cpu'
+    key = (model_path, device, imgsz, backend)
+
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            return model
+
+        max_models = get_model_cache_size()
+        while _model_cache and (len(_model_cache) >= max_models or _gpu_memory_pressure()):
+            _evict_oldest()
+
+        model = load_yolo_model(model_path, device, backend, imgsz)
+        model.overrides['imgsz'] = imgsz
+        _model_cache[key] = model
+        logger.info(f"YOLO 模型已加载并缓存: {model_path} ({backend}, {device}, imgsz={imgsz})")
+        return model
+
+
+def evict_models():
+    """清空进程内模型缓存并释放显存"""
+    with _model_cache_lock:
+        while _model_cache:
+            _evict_oldest()
+
+
+def evict_if_memory_pressure():
+    """GPU 显存占用超过阈值时清空模型缓存（每个分析任务结束时调用），返回是否发生淘汰"""
+    with _model_cache_lock:
+        if not _model_cache or not _gpu_memory_pressure():
+            return False
+        logger.warning("GPU 显存占用过高，清空 YOLO 模型缓存")
+        while _model_cache:
+            _evict_oldest()
+        return True
+
+
+def _evict_oldest():
+    import gc
+    import torch  # 延迟导入
+
+    key, _ = _model_cache.popitem(last=False)
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    logger.info(f"YOLO 模型已从缓存中淘汰: {key}")
+
+
+def _gpu_memory_pressure():
+    """GPU 显存占用是否超过 YOLO_CACHE_MAX_GPU_PERCENT"""
+    import torch  # 延迟导入
+
+    if not torch.cuda.is_available():
+        return False
+    device = torch.cuda.current_device()
+    total = torch.cuda.get_device_properties(device).total_memory
+    used_percent = torch.cuda.memory_reserved(device) / total * 100
+    return used_percent > float(os.getenv('YOLO_CACHE_MAX_GPU_PERCENT', '90'))
+
+
+def extract_person_detections(result, confidence_threshold):
+    """
+    从单帧检测结果中提取置信度达标的人物框
+
+    Returns:
+        list[dict]: [{'confidence': float, 'bbox': [x1, y1, x2, y2]}, ...]
+    """
+    return extract_batch_person_detections([result], confidence_threshold)[0]
+
+
+def extract_batch_person_detections(results, confidence_threshold):
+    """
+    从一批检测结果中提取置信度达标的人物框
+
+    整批的框拼成一个 (N, 6+) 矩阵，只做一次 GPU -> CPU 拷贝，用 NumPy 掩码过滤类别和置信度，
+    不再逐个框访问 box.cls / box.conf / box.xyxy（每次访问都是一次小张量拷贝）。
+
+    Returns:
+        list[list[dict]]: 与 results 一一对应，每帧 [{'confidence': float, 'bbox': [x1, y1, x2, y2]}, ...]
+    """
+    import numpy as np  # 延迟导入
+    import torch  # 延迟导入
+
+    results = list(results)
+    if not results:
+        return []
+
+    # boxes.data 每行为 x1, y1, x2, y2, [track_id,] conf, cls
+    tensors = [result.boxes.data for result in results]
+    if all(isinstance(tensor, torch.Tensor) for tensor in tensors):
+        data = torch.cat(tensors).cpu().numpy()
+    else:
+        data = np.concatenate([np.asarray(tensor) for tensor in tensors])
+    frame_indices = np.repeat(np.arange(len(results)), [len(tensor) for tensor in tensors])
+
+    keep = (data[:, -1] == PERSON_CLASS_ID) & (data[:, -2] >= confidence_threshold)
+    boxes = data[keep, :4].tolist()
+    confidences = data[keep, -2].tolist()
+
+    person_detections = [[] for _ in results]
+    for index, confidence, bbox in zip(frame_indices[keep].tolist(), confidences, boxes):
+        person_detections[index].append({'confidence': confidence, 'bbox': bbox})
+    return person_detections
@@ -0,0 +1,206 @@
+"""
+检测结果缓存
+
+重新分析（analyze_videos --force、后台的“重新分析选中的视频”）时，只要录像文件、模型和推理输入不变，
+YOLO 的输出就不会变。DetectionCache 按内容寻址保存每个录像逐帧的原始人物框：
+
+    键 = SHA-256(录像标识, 分析区间, 模型文件哈希, 推理后端, 输入尺寸, 帧读取器输出宽度, 检测区域外接矩形[, 级联参数])
+
+录像标识由 DETECTION_CACHE_KEY 决定：stat（默认）为路径、大小和修改时间；content 为文件内容的 SHA-256，
+录像较大时计算较慢，但文件移动、复制后仍能命中。
+
+缓存命中的采样帧不再送入模型。缓存的是模型输出的全部人物框（ultralytics 默认置信度下限 0.25），
+只调整 DETECTION_CONFIDENCE_THRESHOLD（不低于 0.25）、去重或轨迹参数时按缓存重新过滤，不需要重新推理；
+修改采样间隔或采样策略时，已缓存的帧仍然命中，只推理新增的帧。
+边界框按模型输入画面的宽高归一化保存，与分辨率无关。
+
+缓存文件保存在 DETECTION_CACHE_DIR（为空时不缓存），一个录像一个 JSON 文件，
+超过 DETECTION_CACHE_MAX_AGE_DAYS 天（默认 30）未更新的由保留策略任务删除。
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本，格式变化时递增，旧文件自然失效
+CACHE_VERSION = 1
+
+CACHE_KEY_MODES = ('stat', 'content')
+
+# 模型文件 (路径, 大小, 修改时间) -> SHA-256，避免每个录像都重新计算
+_model_hashes = {}
+_model_hashes_lock = threading.Lock()
+
+
+def get_cache_dir():
+    """检测缓存目录（DETECTION_CACHE_DIR），为空时不缓存"""
+    return os.getenv('DETECTION_CACHE_DIR', '')
+
+
+def video_identity(path):
+    """录像标识：stat 模式为路径、大小和修改时间，content 模式为文件内容哈希"""
+    from apps.cameras.detection import file_sha256
+
+    mode = os.getenv('DETECTION_CACHE_KEY', 'stat')
+    if mode not in CACHE_KEY_MODES:
+        logger.warning(f"未知的检测缓存键 {mode}，使用 stat，可选: {', '.join(CACHE_KEY_MODES)}")
+        mode = 'stat'
+    if mode == 'content':
+        return {'sha256': file_sha256(path)}
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def model_identity(model_path):
+    """模型标识：权重文件的 SHA-256；模型名（如 yolov8n.pt，由 ultralytics 下载）直接使用名称"""
+    from apps.cameras.detection import file_sha256
+
+    if not os.path.exists(model_path):
+        return model_path
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    with _model_hashes_lock:
+        digest = _model_hashes.get(key)
+    if digest is None:
+        digest = file_sha256(model_path)
+        with _model_hashes_lock:
+            _model_hashes[key] = digest
+    return digest
+
+
+def cache_key(parts):
+    """缓存键：各组成部分按键排序序列化后的 SHA-256"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DetectionCache:
+    """
+    一个录像在某个模型和推理输入下逐帧的原始人物框
+
+    Args:
+        path: 缓存文件路径
+        key_parts: 组成缓存键的参数（写入文件，便于排查）
+        refresh: 为 True 时不读取已有缓存，推理结果覆盖写入
+    """
+
+    def __init__(self, path, key_parts, refresh=False):
+        self.path = path
+        self.key_parts = key_parts
+        self.frames = {}    # 帧序号 -> [[x1, y1, x2, y2, 置信度], ...]（归一化坐标）
+        self.dirty = False
+        if not refresh:
+            self.frames = self._load()
+
+    @classmethod
+    def for_video(cls, video_path, segment, roi_bounds, input_width, refresh=False):
+        """
+        按录像和当前的模型配置打开缓存，未开启缓存时返回 None
+
+        Args:
+            video_path: 解码和推理使用的录像文件（有子码流时为子码流文件）
+            segment: 小时合并文件中本分钟的 (偏移, 时长)，普通录像为 None
+            roi_bounds: 检测区域外接矩形（归一化坐标），未配置时为 None
+            input_width: 帧读取器输出的宽度，读取器输出原始分辨率时为 None
+            refresh: 不读取已有缓存
+        """
+        from apps.cameras.cascade import get_cascade_config
+        from apps.cameras.detection import get_backend, get_imgsz
+
+        cache_dir = get_cache_dir()
+        if not cache_dir:
+            return None
+        key_parts = {
+            'version': CACHE_VERSION,
+            'video': video_identity(video_path),
+            'segment': segment,
+            'model': model_identity(os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')),
+            'backend': get_backend(),
+            'imgsz': get_imgsz(),
+            'input_width': input_width,
+            'roi_bounds': roi_bounds,
+        }
+        cascade = get_cascade_config()
+        if cascade is not None:
+            # 级联检测的结果与单级不同；未开启时不加入键，已有的缓存仍然有效
+            if cascade['refine_model']:
+                cascade = {**cascade, 'refine_model': model_identity(cascade['refine_model'])}
+            key_parts['cascade'] = cascade
+        key = cache_key(key_parts)
+        return cls(os.path.join(cache_dir, key[:2], f"{key}.json"), key_parts, refresh)
+
+    def get(self, frame_number):
+        """该帧缓存的人物框，未缓存时为 None（没有人物的帧为空列表）"""
+        return self.frames.get(frame_number)
+
+    def put(self, frame_number, boxes):
+        self.frames[frame_number] = boxes
+        self.dirty = True
+
+    def save(self):
+        """有新增的帧时写入缓存文件（先写临时文件再原子替换，并发分析同一录像也不会写出半个文件）"""
+        if not self.dirty:
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.detections.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'key': self.key_parts,
+                    'frames': {str(number): boxes for number, boxes in sorted(self.frames.items())},
+                }, f, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"检测缓存读取失败，重新推理: {self.path}: {e}")
+            return {}
+        return {int(number): boxes for number, boxes in data.get('frames', {}).items()}
+
+
+def prune_cache(max_age_days=None):
+    """
+    删除超过 DETECTION_CACHE_MAX_AGE_DAYS 天未更新的缓存文件
+
+    Returns:
+        int: 删除的文件数
+    """
+    cache_dir = get_cache_dir()
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    if max_age_days is None:
+        max_age_days = float(os.getenv('DETECTION_CACHE_MAX_AGE_DAYS', '30'))
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir():
+            continue
+        for item in os.scandir(entry.path):
+            try:
+                if item.is_file() and item.stat().st_mtime < cutoff:
+                    os.remove(item.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(entry.path)    # 只删除空目录
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,257 @@
+"""
+跨录像批量人物检测服务
+
+analyze_video_for_person 每个任务只处理一个录像，每批最多 DETECTION_BATCH_SIZE 帧，最后一批通常不满；
+摄像头多时会产生大量小批次推理。检测服务常驻运行（DETECTION_MODE=service），同时从最多
+DETECTION_SERVICE_VIDEOS 个待检测的 RecordLog 中读取采样帧，不同录像的帧拼成固定大小
+DETECTION_SERVICE_BATCH_SIZE 的批次推理，结果按录像分别去重、保存：
+
+    每个录像一个解码线程 --> 合并帧队列 --> 批量推理 --> 写入线程（按录像保存截图、完成状态）
+
+待检测录像通过条件更新 analysis_status pending -> processing 领取，多个服务进程可以同时运行。
+服务进程崩溃后留在检测中的录像，超过 DETECTION_STALE_TIMEOUT 秒没有刷新领取时间即退回待检测。
+凑批最多等待 DETECTION_SERVICE_MAX_WAIT 秒，录像少时不足一批也会及时推理。
+"""
+import os
+import queue
+import threading
+import time
+import logging
+from collections import Counter
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class VideoEnd:
+    """
+    录像的帧已全部产出
+
+    Args:
+        error: 解码出错时的异常
+        skipped: 录像无需检测（状态已由 VideoAnalysis 保存）
+        interrupted: 服务停止时尚未读完
+    """
+
+    def __init__(self, error=None, skipped=False, interrupted=False):
+        self.error = error
+        self.skipped = skipped
+        self.interrupted = interrupted
+
+
+class DetectionService:
+    """
+    跨录像批量检测服务
+
+    Args:
+        max_videos: 同时解码的录像数
+        batch_size: 每次推理的帧数
+    """
+
+    def __init__(self, max_videos=None, batch_size=None):
+        self.max_videos = max_videos or int(os.getenv('DETECTION_SERVICE_VIDEOS', '8'))
+        self.batch_size = batch_size or int(os.getenv('DETECTION_SERVICE_BATCH_SIZE', '32'))
+        self.max_wait = float(os.getenv('DETECTION_SERVICE_MAX_WAIT', '0.5'))
+        self.poll_interval = float(os.getenv('DETECTION_SERVICE_POLL_INTERVAL', '5'))
+        self.stats = Counter()
+        self.pipeline = None
+
+        self._stop = threading.Event()
+        self._frames = queue.Queue(max(self.batch_size * 2, self.max_videos * 4))
+        self._decoding = set()      # 正在解码的 RecordLog ID（在合并帧的线程中维护）
+        self._active = {}           # 已领取、尚未写完的 RecordLog ID -> VideoAnalysis
+        self._active_lock = threading.Lock()
+        self._next_reclaim = 0
+
+    def stop(self):
+        """停止领取新录像，已领取的录像停止解码后退回待检测"""
+        if not self._stop.is_set():
+            logger.info("检测服务收到停止信号，等待在途批次完成...")
+        self._stop.set()
+
+    def run(self):
+        """运行直到 stop()"""
+        from apps.cameras.cascade import CascadeModel, get_cascade_model
+        from apps.cameras.detection import get_yolo_model
+        from apps.cameras.pipeline import AnalysisPipeline
+
+        model = get_cascade_model(get_yolo_model())
+        logger.info(
+            f"检测服务启动: 同时检测 {self.max_videos} 个录像，每批 {self.batch_size} 帧，凑批最多等待 {self.max_wait}s"
+        )
+        self.pipeline = AnalysisPipeline(self.batch_size, max_wait=self.max_wait)
+        try:
+            self.pipeline.run(self.frames(), lambda batch: self.infer(model, batch), self.write)
+        except BaseException:
+            self._stop.set()
+            # 推理出错时在途录像无法完成，标记为失败
+            with self._active_lock:
+                remaining, self._active = list(self._active.values()), {}
+            for analysis in remaining:
+                analysis.release()
+                try:
+                    analysis.fail()
+                except Exception:
+                    pass
+            raise
+        logger.info(f"检测服务已停止: {dict(self.stats)}，{self.pipeline.summary()}")
+        if isinstance(model, CascadeModel):
+            logger.info(model.summary())
+        return self.stats
+
+    def frames(self):
+        """合并各录像解码线程产出的帧（在流水线的解码线程中迭代）"""
+        next_claim = 0
+        idle = False
+        while True:
+            if self._stop.is_set():
+                if not self._decoding and self._frames.empty():
+                    return
+            elif len(self._decoding) < self.max_videos and time.monotonic() >= next_claim:
+                wanted = self.max_videos - len(self._decoding)
+                if self.claim(wanted) < wanted:
+                    # 待检测的录像不够，下一次轮询前不再查询数据库
+                    next_claim = time.monotonic() + self.poll_interval
+                if not self._decoding:
+                    if not idle:
+                        logger.info("没有待检测的录像，等待新录像...")
+                    idle = True
+                    self._stop.wait(self.poll_interval)
+                    continue
+                idle = False
+
+            try:
+                analysis, item = self._frames.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if isinstance(item, VideoEnd):
+                self._decoding.discard(analysis.log.id)
+            yield analysis, item
+
+    def claim(self, limit):
+        """领取最多 limit 个待检测录像并为每个录像启动解码线程，返回领取数量"""
+        from apps.cameras.analysis import VideoAnalysis, reclaim_stale_analyses
+        from apps.cameras.models import RecordLog
+
+        close_old_connections()
+        if time.monotonic() >= self._next_reclaim:
+            # 崩溃的服务进程领取后未完成的录像退回待检测，重新领取
+            reclaim_stale_analyses()
+            self._next_reclaim = time.monotonic() + 60
+        candidates = list(
+            RecordLog.objects.filter(status='success', analysis_status='pending')
+            .order_by('start_time')[:limit * 2]
+        )
+        claimed = 0
+        for log in candidates:
+            if claimed >= limit:
+                break
+            # 条件更新保证多个服务进程不会领取同一个录像
+            if not RecordLog.objects.filter(id=log.id, analysis_status='pending').update(
+                analysis_status='processing', analysis_claimed_at=timezone.now()
+            ):
+                continue
+            analysis = VideoAnalysis(log)
+            with self._active_lock:
+                self._active[log.id] = analysis
+            self._decoding.add(log.id)
+            threading.Thread(
+                target=self._decode_video, args=(analysis,), name=f'detect-decode-{log.id}', daemon=True
+            ).start()
+            claimed += 1
+        return claimed
+
+    def infer(self, model, batch):
+        """
+        不同录像的帧合并为一次推理，结果按录像去重
+
+        Args:
+            batch: [(VideoAnalysis, (帧序号, 时间戳, 帧) 或 VideoEnd), ...]
+
+        Returns:
+            list: 写入任务 [(VideoAnalysis, 检测写入任务或 VideoEnd), ...]，同一录像内保持输入顺序
+        """
+        from apps.cameras.analysis import infer_frames
+
+        # 检测缓存命中的帧不送入模型
+        entries = [(analysis, item) for analysis, item in batch if not isinstance(item, VideoEnd)]
+        person_detections, inferred = infer_frames(model, entries)
+        person_detections = iter(person_detections)
+        if inferred:
+            self.stats['batches'] += 1
+            self.stats['frames'] += inferred
+
+        # 按录像分组去重（自适应采样时各录像分别补充推理加密帧）；录像结束标记排在该录像的写入任务之后
+        jobs = []
+        pending = {}
+        for analysis, item in batch:
+            if isinstance(item, VideoEnd):
+                for job in analysis.select_batch(model, pending.pop(analysis, [])):
+                    jobs.append((analysis, job))
+                jobs.append((analysis, item))
+            else:
+                pending.setdefault(analysis, []).append((item, next(person_detections)))
+        for analysis, items in pending.items():
+            for job in analysis.select_batch(model, items):
+                jobs.append((analysis, job))
+        return jobs
+
+    def write(self, job):
+        """保存检测，录像结束时更新检测状态（在流水线的写入线程中执行）"""
+        analysis, payload = job
+        close_old_connections()
+        if not isinstance(payload, VideoEnd):
+            analysis.save(payload)
+            return
+
+        with self._active_lock:
+            self._active.pop(analysis.log.id, None)
+        if payload.error is None and not payload.skipped and not payload.interrupted:
+            analysis.flush_tracks()
+        analysis.release()
+        if payload.skipped:
+            self.stats['skipped_videos'] += 1
+        elif payload.interrupted:
+            # 服务停止时未读完，退回待检测，下次从检查点继续（检查点之后的检测尚未写入，截图下次覆盖）
+            analysis.log.analysis_status = 'pending'
+            analysis.log.save(update_fields=['analysis_status'])
+            self.stats['interrupted_videos'] += 1
+        elif payload.error is not None:
+            analysis.fail()
+            self.stats['failed_videos'] += 1
+        else:
+            analysis.complete()
+            self.stats['completed_videos'] += 1
+
+    def _decode_video(self, analysis):
+        """单个录像的解码线程"""
+        from apps.cameras.analysis import AnalysisSkipped
+
+        end = VideoEnd()
+        try:
+            analysis.open()
+            for item in analysis.sample_frames():
+                if not self._put((analysis, item)):
+                    end = VideoEnd(interrupted=True)
+                    break
+        except AnalysisSkipped:
+            end = VideoEnd(skipped=True)
+        except Exception as e:
+            logger.error(f"录像解码失败 (RecordLog {analysis.log.id}): {e}", exc_info=True)
+            end = VideoEnd(error=e)
+        finally:
+            connection.close()
+            # 结束标记必须送达，否则合并线程会一直等待该录像
+            self._frames.put((analysis, end))
+
+    def _put(self, item):
+        """放入合并帧队列，服务停止时返回 False"""
+        while not self._stop.is_set():
+            try:
+                self._frames.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -0,0 +1,52 @@
+"""
+关键帧索引
+
+录制完成后用 ffprobe 读取一次关键帧的时间戳和字节偏移，保存在 RecordLog.keyframe_index。
+采样跳过静止画面、截取片段时直接定位到目标所在的 GOP，不必从文件开头解码。
+时间戳均为文件内的时间（小时合并后的文件包含 segment_offset）。
+"""
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def keyframe_before(keyframes, timestamp):
+    """
+    返回不晚于 timestamp 的最后一个关键帧时间戳
+
+    Args:
+        keyframes: [[时间戳, 字节偏移], ...]，为空时返回 0
+    """
+    if not keyframes:
+        return 0.0
+    times = [item[0] for item in keyframes]
+    index = bisect.bisect_right(times, timestamp + 1e-3) - 1
+    return times[max(index, 0)]
+
+
+def split_keyframes(keyframes, start, end):
+    """取出 [start, end) 范围内的关键帧（小时合并后按分钟拆分索引）"""
+    return [item for item in keyframes if start <= item[0] < end]
+
+
+def build_clip_command(path, start, duration, output_file, keyframes=None):
+    """
+    生成截取片段的 ffmpeg 命令（直接复制，不重新编码）
+
+    直接复制只能从关键帧开始，有关键帧索引时起点对齐到 start 之前最近的关键帧，
+    片段时长相应延长，保证包含 [start, start + duration) 的完整画面。
+    """
+    clip_start = keyframe_before(keyframes, start) if keyframes else start
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-ss", f"{clip_start:.3f}",     # 输入端定位：直接跳到关键帧所在位置，不解码前面的内容
+        "-i", path,
+        "-t", f"{duration + start - clip_start:.3f}",
+        "-map", "0:v",
+        "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        "-movflags", "+faststart",
+        "-y", output_file,
+    ]
@@ -0,0 +1,329 @@
+"""
+录制进程内的实时人物检测（帧旁路模式）
+
+启用 FRAME_TAP_ENABLED 后，录制用的 ffmpeg 进程额外输出一路 1fps、缩小尺寸的 BGR 原始帧到管道，
+由本模块在录制进程内直接送入 YOLO。检测结果在人物出现几秒后即可写出截图，
+不必等切片关闭后再由 analyze_video_for_person 重新完整解码一遍 MP4。
+摄像头配置的检测区域和人物轨迹去重（DETECTION_TRACKING）与离线分析相同。
+
+切片关闭、RecordLog 写入数据库后，落在该切片时间范围内的检测结果批量写入 PersonDetection，
+检测框按录像分辨率换算，该切片直接标记为检测完成，不再投递分析任务。
+切片时间范围内有旁路帧被丢弃（队列满或推理失败）时，该切片的实时检测结果不完整，仍走离线分析。
+"""
+import asyncio
+import os
+import threading
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.cameras.tracking import is_tracking_enabled
+
+logger = logging.getLogger(__name__)
+
+# 旁路帧率（每秒 1 帧）
+FRAME_TAP_FPS = 1
+
+# 截图帧序号按 25fps 估算（转码录制固定 25fps，国内摄像头默认也是 25fps）
+ESTIMATED_VIDEO_FPS = 25
+
+
+def get_frame_tap_size():
+    """旁路帧尺寸 (宽, 高)，由 FRAME_TAP_SIZE 配置，例如 640x360"""
+    width, height = os.getenv('FRAME_TAP_SIZE', '640x360').lower().split('x')
+    return int(width), int(height)
+
+
+def build_frame_tap_args(fd):
+    """生成旁路输出的 ffmpeg 参数：降帧、缩放后以 BGR 原始帧写入管道 fd"""
+    width, height = get_frame_tap_size()
+    return [
+        "-map", "0:v",
+        "-vf", f"fps={FRAME_TAP_FPS},scale={width}:{height}",
+        "-pix_fmt", "bgr24",
+        "-f", "rawvideo",
+        f"pipe:{fd}",
+    ]
+
+
+class LiveDetector:
+    """
+    旁路帧实时检测器
+
+    所有摄像头的旁路帧进入同一个有界队列，队列满时丢弃最旧的帧，保证读取管道的协程永远不会阻塞，
+    从而不会反压 ffmpeg 影响录制。推理在线程中批量执行，一次最多 DETECTION_BATCH_SIZE 帧。
+    """
+
+    def __init__(self):
+        self.width, self.height = get_frame_tap_size()
+        self.frame_bytes = self.width * self.height * 3
+        self.pics_base_dir = os.getenv('PICS_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraWarningPics')
+        self.model_path = os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')
+        self.confidence_threshold = float(os.getenv('DETECTION_CONFIDENCE_THRESHOLD', '0.5'))
+        self.dedup_window = int(os.getenv('DETECTION_DEDUP_WINDOW', '10'))
+        self.batch_size = int(os.getenv('DETECTION_BATCH_SIZE', '8'))
+        self.tracking = is_tracking_enabled()
+        # 未归属到切片的检测结果最长保留时间（秒），超时说明对应切片录制失败
+        self.pending_ttl = int(os.getenv('FRAME_TAP_PENDING_TTL', '300'))
+
+        self.model = None
+        self.dropped_frames = 0
+        self._queue = asyncio.Queue(maxsize=int(os.getenv('FRAME_TAP_QUEUE_SIZE', '64')))
+        self._pending = defaultdict(list)   # 摄像头IP -> 待归属切片的检测结果
+        self._dropped = defaultdict(list)   # 摄像头IP -> 未经检测就丢弃的旁路帧时间
+        self._last_saved = {}               # 摄像头IP -> 上次保存截图的时间（时间窗口去重）
+        self._trackers = {}                 # 摄像头IP -> PersonTracker（轨迹去重）
+        self._minutes = {}                  # 摄像头IP -> 最近一帧所在的分钟
+        self._saved_times = {}              # 摄像头IP -> 本分钟已保存截图的帧时间
+        self._lock = threading.Lock()
+
+    def submit(self, camera_ip, captured_at, data):
+        """提交一帧原始 BGR 数据（在事件循环中调用，不阻塞）"""
+        if self._queue.full():
+            self._mark_dropped([self._queue.get_nowait()])
+            if self.dropped_frames % 100 == 1:
+                logger.warning(f"实时检测跟不上旁路帧速率，已丢弃 {self.dropped_frames} 帧")
+        self._queue.put_nowait((camera_ip, captured_at, data))
+
+    def _mark_dropped(self, batch):
+        """记录未经检测的旁路帧，所在切片回退为离线分析"""
+        with self._lock:
+            for camera_ip, captured_at, _ in batch:
+                self._dropped[camera_ip].append(captured_at)
+        self.dropped_frames += len(batch)
+
+    async def run(self):
+        """持续从队列取帧批量推理"""
+        from apps.cameras.detection import get_device, get_yolo_model
+
+        try:
+            device = get_device()
+            self.model = await asyncio.to_thread(get_yolo_model, self.model_path, device)
+        except Exception as e:
+            logger.error(f"实时检测模型加载失败，切片将回退为离线分析: {e}", exc_info=True)
+            return
+        logger.info(f"实时检测模型加载完成，使用设备: {device}，旁路帧尺寸: {self.width}x{self.height}")
+
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._detect, batch)
+            except Exception as e:
+                logger.error(f"实时检测失败: {e}", exc_info=True)
+                self._mark_dropped(batch)
+
+    def _detect(self, batch):
+        import numpy as np  # 延迟导入
+        from apps.cameras.detection import extract_batch_person_detections
+        from apps.cameras.roi import get_camera_roi
+
+        # 检测区域按摄像头缓存，过期时查询数据库
+        close_old_connections()
+        frames = [
+            np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            for _, _, data in batch
+        ]
+        rois = [get_camera_roi(camera_ip) for camera_ip, _, _ in batch]
+        # 配置了检测区域时只把外接矩形送入模型，与离线分析一致
+        results = self.model(
+            [roi.crop(frame) if roi is not None else frame for frame, roi in zip(frames, rois)], verbose=False
+        )
+        batch_detections = extract_batch_person_detections(results, self.confidence_threshold)
+
+        for frame, roi, person_detections, (camera_ip, captured_at, _) in zip(frames, rois, batch_detections, batch):
+            if roi is not None:
+                person_detections = self._in_region(roi, person_detections)
+            if self.tracking:
+                jobs = self._track(camera_ip, captured_at, frame, person_detections)
+            else:
+                jobs = self._dedup(camera_ip, captured_at, frame, person_detections)
+            for job in jobs:
+                self._save(camera_ip, *job)
+
+    def _in_region(self, roi, person_detections):
+        """裁剪画面的坐标换算回旁路帧，脚部不在检测区域内的丢弃"""
+        in_region = []
+        for detection in person_detections:
+            bbox = roi.to_frame_bbox(detection['bbox'], self.width, self.height)
+            if roi.contains_bbox(bbox, self.width, self.height):
+                in_region.append({**detection, 'bbox': bbox})
+        return in_region
+
+    def _dedup(self, camera_ip, captured_at, frame, person_detections):
+        """按 DETECTION_DEDUP_WINDOW 时间窗口去重，返回需要保存的 (时间, 帧, 检测)"""
+        if not person_detections:
+            return []
+        last_saved = self._last_saved.get(camera_ip)
+        if last_saved and (captured_at - last_saved).total_seconds() < self.dedup_window:
+            return []
+        self._last_saved[camera_ip] = captured_at
+        return [(captured_at, frame, max(person_detections, key=lambda x: x['confidence']))]
+
+    def _track(self, camera_ip, captured_at, frame, person_detections):
+        """
+        按人物轨迹去重（与离线分析相同的 PersonTracker），返回需要保存的 (时间, 帧, 检测)
+
+        跟踪器按摄像头常驻内存，轨迹跨分钟延续；进入新的一分钟时，与离线分析在录像结束时一样，
+        从未保存过截图的轨迹先保存上一分钟的最佳截图，截图能归属到刚关闭的切片。
+        """
+        from apps.cameras.tracking import PersonTracker
+
+        tracker = self._trackers.get(camera_ip)
+        if tracker is None:
+            tracker = self._trackers[camera_ip] = PersonTracker()
+
+        jobs = []
+        minute = captured_at.replace(second=0, microsecond=0)
+        if self._minutes.get(camera_ip) not in (None, minute):
+            jobs += self._accept(camera_ip, tracker.flush())
+            self._saved_times[camera_ip] = set()
+        self._minutes[camera_ip] = minute
+
+        jobs += self._accept(camera_ip, tracker.update(captured_at.timestamp(), [
+            (
+                [detection['bbox'][0] / self.width, detection['bbox'][1] / self.height,
+                 detection['bbox'][2] / self.width, detection['bbox'][3] / self.height],
+                detection['confidence'],
+                (captured_at, frame, detection),
+            )
+            for detection in person_detections
+        ]))
+        return jobs
+
+    def _accept(self, camera_ip, jobs):
+        """同一帧只保存一次（保留置信度最高的检测）"""
+        saved = self._saved_times.setdefault(camera_ip, set())
+        accepted = []
+        for job in sorted(jobs, key=lambda job: job[2]['confidence'], reverse=True):
+            if job[0] not in saved:
+                saved.add(job[0])
+                accepted.append(job)
+        return accepted
+
+    def _save(self, camera_ip, captured_at, frame, detection):
+        """写出截图，检测结果等待归属到切片"""
+        import cv2  # 延迟导入
+
+        frame_number = captured_at.second * ESTIMATED_VIDEO_FPS
+        output_dir = os.path.join(self.pics_base_dir, camera_ip, captured_at.strftime("%Y/%m/%d/%H"))
+        os.makedirs(output_dir, exist_ok=True)
+        image_path = os.path.join(
+            output_dir, f"{captured_at.strftime('%M')}_frame_{frame_number:05d}_person.jpg"
+        )
+        cv2.imwrite(image_path, frame)
+
+        with self._lock:
+            self._pending[camera_ip].append({
+                'captured_at': captured_at,
+                'image_path': image_path,
+                'confidence': detection['confidence'],
+                # 旁路帧坐标系（FRAME_TAP_SIZE），归属到切片时换算为录像分辨率
+                'bbox': detection['bbox'],
+            })
+        logger.info(f"✓ 实时检测到人物: {camera_ip} {captured_at.strftime('%H:%M:%S')}, 置信度{detection['confidence']:.2f}")
+
+    def attach(self, records):
+        """
+        将检测结果归属到刚写入数据库的切片（在 RecordLogWriter 的线程中调用）
+
+        Args:
+            records: RecordLogWriter 写入的记录，包含 id/camera_ip/file_path/start_time/end_time
+        """
+        from apps.cameras.models import RecordLog, PersonDetection
+        from apps.cameras.tasks import queue_person_analysis
+
+        if self.model is None:
+            # 模型尚未加载或加载失败，这些切片没有经过实时检测，仍走离线分析
+            queue_person_analysis([record['id'] for record in records])
+            return
+
+        def in_segment(record, captured_at):
+            return record['start_time'] <= captured_at < record['end_time']
+
+        # 先写入数据库再从待归属列表中移除，写入失败时 RecordLogWriter 重试提交，检测结果不会丢失
+        attached = []       # [(切片, 检测结果)]
+        incomplete = []     # [(切片, 检测结果)]：有旁路帧被丢弃，检测结果不完整
+        dropped = []        # 已处理切片时间范围内的丢帧时间
+        with self._lock:
+            for record in records:
+                items = [item for item in self._pending.get(record['camera_ip'], [])
+                         if in_segment(record, item['captured_at'])]
+                record_dropped = [(record['camera_ip'], dropped_at)
+                                  for dropped_at in self._dropped.get(record['camera_ip'], [])
+                                  if in_segment(record, dropped_at)]
+                dropped += record_dropped
+                (incomplete if record_dropped else attached).append((record, items))
+
+        detections = []
+        for record, items in attached:
+            if not items:
+                continue
+            scale_x, scale_y = self._record_scale(record)
+            for item in items:
+                timestamp = (item['captured_at'] - record['start_time']).total_seconds()
+                bbox = item['bbox']
+                detections.append(PersonDetection(
+                    record_log_id=record['id'],
+                    frame_number=int(timestamp * ESTIMATED_VIDEO_FPS),
+                    timestamp=timestamp,
+                    image_path=item['image_path'],
+                    confidence=item['confidence'],
+                    bbox=[bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y],
+                ))
+
+        close_old_connections()
+        if detections:
+            # 唯一约束 (record_log, frame_number)：重试时不会重复写入
+            PersonDetection.objects.bulk_create(detections, ignore_conflicts=True)
+        if attached:
+            RecordLog.objects.filter(id__in=[record['id'] for record, _ in attached]).update(
+                analysis_status='completed',
+                analysis_time=timezone.now(),
+            )
+        if incomplete:
+            # 离线分析会重新保存截图，不完整的实时检测截图不再保留
+            for _, items in incomplete:
+                for item in items:
+                    if os.path.exists(item['image_path']):
+                        os.remove(item['image_path'])
+            logger.warning(f"{len(incomplete)} 个切片有旁路帧未经实时检测，回退为离线分析")
+            queue_person_analysis([record['id'] for record, _ in incomplete])
+
+        handled_ids = {id(item) for _, items in attached + incomplete for item in items}
+        with self._lock:
+            for camera_ip in {record['camera_ip'] for record in records}:
+                self._pending[camera_ip] = [
+                    item for item in self._pending.get(camera_ip, []) if id(item) not in handled_ids
+                ]
+            for camera_ip, dropped_at in dropped:
+                self._dropped[camera_ip].remove(dropped_at)
+            self._expire_pending()
+        logger.info(f"实时检测结果已归属 {len(attached)} 个切片，共 {len(detections)} 个人物")
+
+    def _record_scale(self, record):
+        """旁路帧坐标换算到录像分辨率的比例 (x, y)；读取录像分辨率失败时保持旁路帧坐标"""
+        from apps.cameras.probe import probe_video
+
+        try:
+            info = probe_video(record['file_path'])
+        except Exception as e:
+            logger.warning(f"读取录像分辨率失败，检测框保持旁路帧坐标: {record['file_path']}: {e}")
+            return 1.0, 1.0
+        if not info['width'] or not info['height']:
+            return 1.0, 1.0
+        return info['width'] / self.width, info['height'] / self.height
+
+    def _expire_pending(self):
+        cutoff = datetime.now() - timedelta(seconds=self.pending_ttl)
+        for camera_ip, pending in self._pending.items():
+            expired = [item for item in pending if item['captured_at'] < cutoff]
+            if expired:
+                logger.warning(f"{camera_ip} 有 {len(expired)} 个实时检测结果找不到对应切片，已丢弃")
+                self._pending[camera_ip] = [item for item in pending if item['captured_at'] >= cutoff]
+        for camera_ip, dropped in self._dropped.items():
+            self._dropped[camera_ip] = [dropped_at for dropped_at in dropped if dropped_at >= cutoff]
@@ -47,6 +47,11 @@ class Command(BaseCommand):
             action='store_true',
             help='强制重新分析（删除已有的检测记录）',
         )
+        parser.add_argument(
+            '--refresh-cache',
+            action='store_true',
+            help='不使用检测缓存，全部重新推理（默认录像和模型未变化时复用缓存的推理结果）',
+        )
 
     def handle(self, *args, **options):
         # 构建查询条件
@@ -110,11 +115,15 @@ class Command(BaseCommand):
                 deleted_count = record.detections.count()
                 record.detections.all().delete()
                 self.stdout.write(f'  删除了 {deleted_count} 条旧的检测记录')
+            if options['force'] and record.analysis_checkpoint:
+                # 强制重新分析时从头检测，不从检查点继续
+                record.analysis_checkpoint = None
+                record.save(update_fields=['analysis_checkpoint'])
 
             try:
                 if options['async_mode']:
                     # 异步执行
-                    task = analyze_video_for_person.delay(record.id)
+                    task = analyze_video_for_person.delay(record.id, refresh_cache=options['refresh_cache'])
                     self.stdout.write(
                         self.style.SUCCESS(
                             f'[{idx}/{total_count}] 已提交异步任务: {record.camera_ip} - {record.file_path} (Task ID: {task.id})'
@@ -123,7 +132,7 @@ class Command(BaseCommand):
                 else:
                     # 同步执行
                     self.stdout.write(f'[{idx}/{total_count}] 分析中: {record.camera_ip} - {record.file_path}')
-                    result = analyze_video_for_person(record.id)
+                    result = analyze_video_for_person(record.id, refresh_cache=options['refresh_cache'])
                     self.stdout.write(self.style.SUCCESS(f'  {result}'))
 
                 success_count += 1
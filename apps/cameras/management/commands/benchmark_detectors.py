@@ -0,0 +1,160 @@
+"""
+对比各推理后端的检测速度和人物框一致性
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.cameras.detection import YOLO_BACKENDS
+from apps.cameras.tracking import box_iou
+
+
+class Command(BaseCommand):
+    help = '对比 YOLO 推理后端（torch/onnx/openvino）的每秒帧数，并检查人物框与第一个后端是否一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends',
+            type=str,
+            default=','.join(YOLO_BACKENDS),
+            help=f"逗号分隔的推理后端，第一个作为对照，默认 {','.join(YOLO_BACKENDS)}",
+        )
+        parser.add_argument(
+            '--video',
+            type=str,
+            help='从视频中按秒采样测试帧，不指定时使用 ultralytics 自带的示例图片',
+        )
+        parser.add_argument(
+            '--frames',
+            type=int,
+            default=64,
+            help='测试帧数，默认 64',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=int(os.getenv('DETECTION_BATCH_SIZE', '8')),
+            help='每批帧数，默认 DETECTION_BATCH_SIZE',
+        )
+        parser.add_argument(
+            '--device',
+            type=str,
+            default='cpu',
+            help='torch 后端使用的设备，默认 cpu（与导出后端在同一条件下对比）',
+        )
+        parser.add_argument(
+            '--cascade',
+            action='store_true',
+            help='同时测试两级级联检测（第一个后端，DETECTION_CASCADE_* 参数），输出升级帧比例和净速度',
+        )
+
+    def handle(self, *args, **options):
+        from apps.cameras.cascade import get_cascade_model
+        from apps.cameras.detection import get_yolo_model
+
+        backends = [name.strip() for name in options['backends'].split(',') if name.strip()]
+        unknown = [name for name in backends if name not in YOLO_BACKENDS]
+        if unknown:
+            raise CommandError(f"未知的推理后端: {', '.join(unknown)}，可选: {', '.join(YOLO_BACKENDS)}")
+
+        frames = self.load_frames(options)
+        batch_size = max(options['batch_size'], 1)
+        confidence_threshold = float(os.getenv('DETECTION_CONFIDENCE_THRESHOLD', '0.5'))
+        self.stdout.write(f"测试帧: {len(frames)} 帧，每批 {batch_size} 帧")
+
+        reference = None
+        for backend in backends:
+            try:
+                model = get_yolo_model(device=options['device'], backend=backend)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{backend:>9}: 加载失败: {e}"))
+                continue
+
+            detections, elapsed = self.run_model(model, frames, batch_size, confidence_threshold)
+            line = f"{backend:>9}: {len(frames) / elapsed:7.1f} 帧/秒，人物框 {sum(len(d) for d in detections)} 个"
+            if reference is None:
+                reference = detections
+            else:
+                line += f"，{self.compare(reference, detections)}"
+            self.stdout.write(line)
+
+        if options['cascade'] and reference is not None:
+            # 不受 DETECTION_CASCADE 开关影响，按当前的 DETECTION_CASCADE_* 参数测试
+            model = get_yolo_model(device=options['device'], backend=backends[0])
+            cascade = get_cascade_model(model, options['device'], backends[0], force=True)
+            detections, elapsed = self.run_model(cascade, frames, batch_size, confidence_threshold)
+            self.stdout.write(
+                f"{'cascade':>9}: {len(frames) / elapsed:7.1f} 帧/秒，人物框 {sum(len(d) for d in detections)} 个，"
+                f"{self.compare(reference, detections)}"
+            )
+            self.stdout.write(f"           {cascade.summary()}")
+
+    def run_model(self, model, frames, batch_size, confidence_threshold):
+        """
+        按批推理全部测试帧（先预热一批）
+
+        Returns:
+            tuple: (逐帧人物框, 耗时秒数)
+        """
+        from apps.cameras.cascade import CascadeModel
+        from apps.cameras.detection import extract_batch_person_detections
+
+        # 预热一批，排除首次推理的初始化开销
+        model(frames[:batch_size], verbose=False)
+        if isinstance(model, CascadeModel):
+            model.stats.clear()
+
+        detections = []
+        started = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            results = model(frames[i:i + batch_size], verbose=False)
+            detections += extract_batch_person_detections(results, confidence_threshold)
+        return detections, time.perf_counter() - started
+
+    def load_frames(self, options):
+        """读取测试帧（BGR numpy 数组）"""
+        import cv2  # 延迟导入
+
+        count = max(options['frames'], 1)
+        if not options['video']:
+            from ultralytics.utils import ASSETS  # 延迟导入
+
+            images = [cv2.imread(str(path)) for path in sorted(ASSETS.glob('*.jpg'))]
+            images = [image for image in images if image is not None]
+            if not images:
+                raise CommandError('没有找到 ultralytics 示例图片，请通过 --video 指定测试视频')
+            return [images[i % len(images)] for i in range(count)]
+
+        if not os.path.exists(options['video']):
+            raise CommandError(f"视频文件不存在: {options['video']}")
+        cap = cv2.VideoCapture(options['video'])
+        try:
+            frames = []
+            while len(frames) < count:
+                # 每秒取一帧，与检测采样一致
+                cap.set(cv2.CAP_PROP_POS_MSEC, len(frames) * 1000)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+        finally:
+            cap.release()
+        if not frames:
+            raise CommandError(f"无法从视频读取帧: {options['video']}")
+        return frames
+
+    def compare(self, reference, detections):
+        """逐帧按 IoU 匹配人物框，统计与对照后端一致的比例"""
+        threshold = 0.9
+        matched = total = 0
+        for expected, actual in zip(reference, detections):
+            total += max(len(expected), len(actual))
+            remaining = list(actual)
+            for box in expected:
+                best = max(remaining, key=lambda other: box_iou(box['bbox'], other['bbox']), default=None)
+                if best is not None and box_iou(box['bbox'], best['bbox']) >= threshold:
+                    matched += 1
+                    remaining.remove(best)
+        if not total:
+            return "双方都没有人物框"
+        return f"与对照一致 {matched}/{total}（IoU≥{threshold}）"
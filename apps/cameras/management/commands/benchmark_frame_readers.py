@@ -0,0 +1,129 @@
+"""
+对比各采样帧读取器的解码耗时
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.cameras.frame_readers import FRAME_READERS
+
+
+class Command(BaseCommand):
+    help = '在合成视频（或指定视频）上对比采样帧读取器的解码耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--video',
+            type=str,
+            help='使用已有视频文件，不指定时用 ffmpeg 生成合成视频',
+        )
+        parser.add_argument(
+            '--duration',
+            type=int,
+            default=60,
+            help='合成视频时长（秒），默认 60',
+        )
+        parser.add_argument(
+            '--size',
+            type=str,
+            default='1920x1080',
+            help='合成视频分辨率，默认 1920x1080',
+        )
+        parser.add_argument(
+            '--fps',
+            type=int,
+            default=25,
+            help='合成视频帧率，默认 25',
+        )
+        parser.add_argument(
+            '--gop',
+            type=int,
+            default=50,
+            help='合成视频关键帧间隔（帧），默认 50',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=float(os.getenv('DETECTION_SAMPLE_INTERVAL', '1')),
+            help='采样间隔（秒），默认 DETECTION_SAMPLE_INTERVAL',
+        )
+        parser.add_argument(
+            '--readers',
+            type=str,
+            default=','.join(FRAME_READERS),
+            help=f"逗号分隔的读取器，默认 {','.join(FRAME_READERS)}",
+        )
+
+    def handle(self, *args, **options):
+        import cv2  # 延迟导入
+
+        names = [name.strip() for name in options['readers'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in FRAME_READERS]
+        if unknown:
+            raise CommandError(f"未知的帧读取器: {', '.join(unknown)}，可选: {', '.join(FRAME_READERS)}")
+
+        temp_dir = None
+        video = options['video']
+        try:
+            if not video:
+                temp_dir = tempfile.mkdtemp(prefix='frame_reader_bench_')
+                video = os.path.join(temp_dir, 'synthetic.mp4')
+                self.stdout.write(f"生成 {options['duration']}s {options['size']}@{options['fps']} 合成视频...")
+                self.generate_video(video, options)
+            elif not os.path.exists(video):
+                raise CommandError(f'视频文件不存在: {video}')
+
+            baseline = None
+            for name in names:
+                reader = None
+                cap = cv2.VideoCapture(video)
+                if not cap.isOpened():
+                    raise CommandError(f'无法打开视频文件: {video}')
+                try:
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    frame_interval = max(int(fps * options['interval']), 1)
+                    reader = FRAME_READERS[name](cap, fps, path=video, frame_interval=frame_interval)
+                    reader.reset()
+
+                    sampled = 0
+                    started = time.perf_counter()
+                    frame_number = 0
+                    while True:
+                        ok, frame = reader.read(frame_number)
+                        if not ok:
+                            break
+                        sampled += frame is not None
+                        frame_number += frame_interval
+                    elapsed = time.perf_counter() - started
+                finally:
+                    if reader is not None:
+                        reader.release()
+                    cap.release()
+
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f"{name:>6}: {elapsed:7.2f}s  采样 {sampled} 帧, 完整解码 {reader.decoded_frames} 帧, "
+                    f"仅 grab {reader.grabbed_frames} 帧, 相对 {names[0]} {baseline / elapsed:.1f}x"
+                )
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def generate_video(self, path, options):
+        """用 ffmpeg testsrc2 生成与摄像头录像相近的 H.264 视频"""
+        cmd = [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "lavfi",
+            "-i", f"testsrc2=size={options['size']}:rate={options['fps']}:duration={options['duration']}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-pix_fmt", "yuv420p",
+            "-g", str(options['gop']),
+            "-y", path,
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'生成合成视频失败: {result.stderr.strip()}')
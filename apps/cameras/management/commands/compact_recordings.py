@@ -0,0 +1,39 @@
+"""
+手动合并分钟录像为小时文件
+"""
+from django.core.management.base import BaseCommand
+from apps.cameras.compaction import HourCompactor
+
+
+class Command(BaseCommand):
+    help = '将已结束小时的分钟录像直接复制合并为小时文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera-ip',
+            type=str,
+            action='append',
+            help='只处理指定摄像头（可重复指定）',
+        )
+        parser.add_argument(
+            '--max-hours',
+            type=int,
+            help='最多合并的小时数（默认读取 COMPACTION_MAX_HOURS）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只统计可合并的小时，不实际执行',
+        )
+
+    def handle(self, *args, **options):
+        compactor = HourCompactor(max_hours=options['max_hours'], dry_run=options['dry_run'])
+        stats = compactor.run(options['camera_ip'])
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}合并 {stats['compacted_hours']} 个小时（{stats['compacted_files']} 个文件），"
+            f"跳过 {stats['skipped_hours']} 个"
+        ))
+        if stats['failed_hours']:
+            self.stdout.write(self.style.WARNING(f"{stats['failed_hours']} 个小时合并失败，详见日志"))
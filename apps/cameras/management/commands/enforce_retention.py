@@ -0,0 +1,40 @@
+"""
+手动执行录像保留策略
+"""
+from django.core.management.base import BaseCommand
+from apps.cameras.retention import RetentionEngine
+
+
+class Command(BaseCommand):
+    help = '按保留天数、归档天数和主存储容量上限清理录像'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera-ip',
+            type=str,
+            action='append',
+            help='只处理指定摄像头（可重复指定）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只统计将要删除和归档的录像，不实际执行',
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            help='每个摄像头每条规则最多处理的块数（默认读取 RETENTION_MAX_CHUNKS）',
+        )
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine(dry_run=options['dry_run'], max_chunks=options['max_chunks'])
+        stats = engine.run(options['camera_ip'])
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}删除 {stats['deleted_logs']} 条录像、{stats['deleted_images']} 张截图，"
+            f"释放 {stats['freed_bytes'] / 1024 ** 3:.2f}GB；"
+            f"归档 {stats['archived_logs']} 条录像（{stats['archived_bytes'] / 1024 ** 3:.2f}GB）"
+        ))
+        if stats['failed_cameras']:
+            self.stdout.write(self.style.WARNING(f"{stats['failed_cameras']} 个摄像头执行失败，详见日志"))
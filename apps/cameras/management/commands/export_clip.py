@@ -0,0 +1,53 @@
+"""
+从录像中截取片段（直接复制，不重新编码）
+"""
+import os
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.cameras.keyframes import build_clip_command
+from apps.cameras.models import RecordLog
+
+
+class Command(BaseCommand):
+    help = '按关键帧索引从录像中截取片段'
+
+    def add_arguments(self, parser):
+        parser.add_argument('record_log_id', type=int, help='RecordLog ID')
+        parser.add_argument(
+            '--start',
+            type=float,
+            default=0,
+            help='片段在本分钟内的开始时间（秒）',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='片段时长（秒）',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            required=True,
+            help='输出文件路径',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            log = RecordLog.objects.get(id=options['record_log_id'])
+        except RecordLog.DoesNotExist:
+            raise CommandError(f"RecordLog {options['record_log_id']} 不存在")
+        if not log.file_path or not os.path.exists(log.file_path):
+            raise CommandError(f'视频文件不存在: {log.file_path}')
+
+        # 小时合并后的录像需要加上本分钟在文件内的偏移
+        start = (log.segment_offset or 0) + options['start']
+        if not log.keyframe_index:
+            self.stdout.write(self.style.WARNING('没有关键帧索引，片段起点由 ffmpeg 自行对齐到关键帧'))
+
+        cmd = build_clip_command(log.file_path, start, options['duration'], options['output'], log.keyframe_index)
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'截取失败: {result.stderr.strip()}')
+        self.stdout.write(self.style.SUCCESS(f"片段已保存: {options['output']}"))
@@ -0,0 +1,39 @@
+"""
+从环境变量（CAMERA1_*、CAMERA2_* ...）导入摄像头配置到 Camera 表
+"""
+import os
+
+from django.core.management.base import BaseCommand
+from apps.cameras.models import Camera
+
+
+class Command(BaseCommand):
+    help = '从 CAMERA*_IP 等环境变量导入摄像头配置'
+
+    def handle(self, *args, **options):
+        index = 1
+        imported = 0
+        while os.getenv(f"CAMERA{index}_IP"):
+            ip = os.getenv(f"CAMERA{index}_IP")
+            camera, created = Camera.objects.update_or_create(
+                ip=ip,
+                defaults={
+                    'name': f"camera{index}",
+                    'port': int(os.getenv(f"CAMERA{index}_PORT", "554")),
+                    'username': os.getenv(f"CAMERA{index}_USER", ""),
+                    # 只保存环境变量名，密码仍由各节点的环境变量提供
+                    'password_env': f"CAMERA{index}_PASSWORD",
+                    'stream_path': os.getenv(f"CAMERA{index}_PATH", "Streaming/Channels/101"),
+                    'sub_stream_path': os.getenv(f"CAMERA{index}_SUB_PATH", ""),
+                    'record_mode': os.getenv(f"CAMERA{index}_RECORD_MODE", "transcode"),
+                },
+            )
+            action = '新增' if created else '更新'
+            self.stdout.write(self.style.SUCCESS(f'{action}摄像头: {camera}'))
+            imported += 1
+            index += 1
+
+        if imported == 0:
+            self.stdout.write(self.style.WARNING('没有找到 CAMERA*_IP 环境变量'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'共导入 {imported} 个摄像头'))
@@ -0,0 +1,43 @@
+"""
+常驻人物检测服务：多个录像的采样帧拼成固定大小的批次推理
+"""
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.cameras.detection_service import DetectionService
+
+
+class Command(BaseCommand):
+    help = '常驻人物检测服务（DETECTION_MODE=service），跨录像批量推理待检测的录像'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--videos',
+            type=int,
+            help='同时检测的录像数（默认读取 DETECTION_SERVICE_VIDEOS）',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='每次推理的帧数（默认读取 DETECTION_SERVICE_BATCH_SIZE）',
+        )
+
+    def handle(self, *args, **options):
+        if settings.DETECTION_MODE != 'service':
+            self.stdout.write(self.style.WARNING(
+                'DETECTION_MODE 不是 service，录制完成后仍会投递 analyze_video_for_person 任务，'
+                '服务只处理尚未被任务领取的待检测录像'
+            ))
+
+        service = DetectionService(max_videos=options['videos'], batch_size=options['batch_size'])
+
+        # Ctrl+C 和 supervisor 发送的 SIGTERM 都走优雅退出：在途批次写完，未读完的录像退回待检测
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda signum, frame: service.stop())
+
+        stats = service.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"检测服务已停止: 完成 {stats['completed_videos']} 个录像，"
+            f"推理 {stats['batches']} 批 {stats['frames']} 帧"
+        ))
@@ -0,0 +1,76 @@
+"""
+常驻分段录制：一个 asyncio 事件循环驱动所有摄像头的 ffmpeg 进程
+"""
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.cameras.models import Camera
+from apps.cameras.recorder import RecordingSupervisor
+
+
+class Command(BaseCommand):
+    help = '常驻分段录制摄像头视频（替代每分钟启动一次 ffmpeg 的录制任务）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera-ip',
+            type=str,
+            action='append',
+            help='只录制指定摄像头（可重复指定，不参与节点分片）',
+        )
+        parser.add_argument(
+            '--node',
+            type=str,
+            help='录制节点名称（默认使用主机名），多个节点按一致性哈希分担摄像头',
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            help='覆盖输入源（本地视频文件或本地 RTSP 地址），仅用于测试，需配合单个 --camera-ip',
+        )
+        parser.add_argument(
+            '--base-dir',
+            type=str,
+            help='录制根目录（默认读取 CAMERA_BASE_DIR）',
+        )
+        parser.add_argument(
+            '--frame-tap',
+            action='store_true',
+            help='录制进程内输出低分辨率旁路帧做实时人物检测（默认读取 FRAME_TAP_ENABLED）',
+        )
+
+    def handle(self, *args, **options):
+        cameras = None
+
+        if options['camera_ip']:
+            cameras = [
+                camera.to_recorder_config()
+                for camera in Camera.objects.filter(ip__in=options['camera_ip'])
+            ]
+            if not cameras:
+                raise CommandError('没有找到指定的摄像头，请先在 Admin 中添加或运行 import_cameras_from_env')
+            self.stdout.write(self.style.SUCCESS(f'开始录制 {len(cameras)} 路摄像头'))
+        else:
+            self.stdout.write(self.style.SUCCESS('以录制节点身份运行，按一致性哈希领取摄像头'))
+
+        if options['source'] and (cameras is None or len(cameras) != 1):
+            raise CommandError('--source 只能用于单个摄像头，请通过 --camera-ip 指定')
+
+        asyncio.run(self._run(cameras, options))
+        self.stdout.write(self.style.SUCCESS('录制已停止'))
+
+    async def _run(self, cameras, options):
+        supervisor = RecordingSupervisor(
+            base_dir=options['base_dir'],
+            source=options['source'],
+            node_name=options['node'],
+            frame_tap=options['frame_tap'] or None,
+        )
+
+        # Ctrl+C 和 supervisor 发送的 SIGTERM 都走优雅退出：等待 ffmpeg 写完当前切片
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, supervisor.stop)
+
+        await supervisor.run(cameras)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0005_gpumetrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='record_mode',
+            field=models.CharField(choices=[('transcode', 'H.264转码'), ('copy', '直接复制'), ('fallback', '转码(NAL错误回退)')], default='transcode', max_length=20, verbose_name='录制模式'),
+        ),
+    ]
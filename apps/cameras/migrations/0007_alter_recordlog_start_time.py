@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0006_recordlog_record_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recordlog',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='开始时间'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0007_alter_recordlog_start_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Camera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='名称')),
+                ('ip', models.CharField(max_length=50, unique=True, verbose_name='摄像头IP')),
+                ('port', models.IntegerField(default=554, verbose_name='RTSP端口')),
+                ('username', models.CharField(max_length=50, verbose_name='用户名')),
+                ('password_env', models.CharField(max_length=100, verbose_name='密码环境变量名')),
+                ('stream_path', models.CharField(default='Streaming/Channels/101', max_length=200, verbose_name='主码流路径')),
+                ('record_mode', models.CharField(choices=[('transcode', 'H.264转码'), ('copy', '直接复制')], default='transcode', max_length=20, verbose_name='录制模式')),
+                ('enabled', models.BooleanField(default=True, verbose_name='启用录制')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '摄像头',
+                'verbose_name_plural': '摄像头',
+                'ordering': ['ip'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecordingNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='节点名称')),
+                ('last_heartbeat', models.DateTimeField(verbose_name='最后心跳时间')),
+                ('cameras', models.JSONField(blank=True, default=list, verbose_name='负责的摄像头')),
+            ],
+            options={
+                'verbose_name': '录制节点',
+                'verbose_name_plural': '录制节点',
+                'ordering': ['name'],
+            },
+        ),
+    ]
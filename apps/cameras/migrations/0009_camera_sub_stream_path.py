@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0008_camera_recordingnode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='sub_stream_path',
+            field=models.CharField(blank=True, help_text='如 Streaming/Channels/102，填写后同时录制子码流，人物检测使用子码流文件', max_length=200, verbose_name='子码流路径'),
+        ),
+        migrations.AddField(
+            model_name='recordlog',
+            name='sub_file_path',
+            field=models.CharField(blank=True, max_length=500, null=True, verbose_name='子码流文件路径'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0009_camera_sub_stream_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='motion_index',
+            field=models.BinaryField(blank=True, null=True, verbose_name='每秒运动指数'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0010_recordlog_motion_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='archive_after_days',
+            field=models.PositiveIntegerField(blank=True, help_text='超过该天数的录像移动到 RETENTION_ARCHIVE_DIR，留空使用 RETENTION_ARCHIVE_AFTER_DAYS', null=True, verbose_name='归档天数'),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='超过该天数的录像、截图和记录一并删除，留空使用 RETENTION_DAYS', null=True, verbose_name='保留天数'),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='storage_budget_gb',
+            field=models.FloatField(blank=True, help_text='超出后最旧的录像转入归档目录（未配置归档目录时删除），留空使用 RETENTION_BUDGET_GB', null=True, verbose_name='主存储上限(GB)'),
+        ),
+        migrations.AddField(
+            model_name='recordlog',
+            name='storage_tier',
+            field=models.CharField(choices=[('hot', '主存储'), ('archive', '归档存储')], default='hot', max_length=20, verbose_name='存储层级'),
+        ),
+        migrations.AddIndex(
+            model_name='recordlog',
+            index=models.Index(fields=['camera_ip', 'storage_tier', 'start_time'], name='cameras_rec_camera__861688_idx'),
+        ),
+    ]
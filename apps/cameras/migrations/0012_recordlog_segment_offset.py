@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0011_retention_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='compaction_skipped',
+            field=models.BooleanField(default=False, verbose_name='跳过合并'),
+        ),
+        migrations.AddField(
+            model_name='recordlog',
+            name='segment_duration',
+            field=models.FloatField(blank=True, null=True, verbose_name='文件内时长(秒)'),
+        ),
+        migrations.AddField(
+            model_name='recordlog',
+            name='segment_offset',
+            field=models.FloatField(blank=True, null=True, verbose_name='文件内偏移(秒)'),
+        ),
+    ]
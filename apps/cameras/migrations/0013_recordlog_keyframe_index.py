@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0012_recordlog_segment_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='keyframe_index',
+            field=models.JSONField(blank=True, null=True, verbose_name='关键帧索引'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0013_recordlog_keyframe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='roi_polygon',
+            field=models.JSONField(blank=True, help_text='多边形顶点 [[x, y], ...]，坐标为画面宽高的比例（0-1），如 [[0, 0.4], [1, 0.4], [1, 1], [0, 1]]；留空检测整个画面', null=True, verbose_name='检测区域'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0014_camera_roi_polygon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persondetection',
+            name='thumbnail_path',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='缩略图路径'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0015_persondetection_thumbnail_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='track_state',
+            field=models.JSONField(blank=True, help_text='检测结束时仍在画面中的人物轨迹，供同一摄像头下一分钟接续去重', null=True, verbose_name='人物轨迹'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_detections(apps, schema_editor):
+    """任务重试产生的重复检测（同一录像同一帧）只保留最早的一条，截图文件名相同无需删除"""
+    PersonDetection = apps.get_model('cameras', 'PersonDetection')
+    duplicates = (
+        PersonDetection.objects.values('record_log_id', 'frame_number')
+        .annotate(keep_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for group in duplicates.iterator():
+        PersonDetection.objects.filter(
+            record_log_id=group['record_log_id'], frame_number=group['frame_number']
+        ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0016_recordlog_track_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='analysis_checkpoint',
+            field=models.JSONField(blank=True, help_text='检测中断或失败后，重试从检查点之后的帧继续', null=True, verbose_name='检测检查点'),
+        ),
+        migrations.RunPython(remove_duplicate_detections, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='persondetection',
+            constraint=models.UniqueConstraint(fields=('record_log', 'frame_number'), name='unique_detection_frame'),
+        ),
+    ]
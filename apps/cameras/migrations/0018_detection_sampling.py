@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0017_analysis_checkpoint_unique_detection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='coarse_sample_interval',
+            field=models.FloatField(blank=True, help_text='自适应采样的扫描间隔，留空使用 DETECTION_COARSE_INTERVAL', null=True, verbose_name='粗采样间隔(秒)'),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='sampling_mode',
+            field=models.CharField(blank=True, choices=[('fixed', '固定间隔'), ('adaptive', '自适应（粗扫描 + 局部加密）')], help_text='自适应：按粗采样间隔扫描，检测到人物或运动的区间再按 DETECTION_SAMPLE_INTERVAL 加密；留空使用 DETECTION_SAMPLING_MODE', max_length=20, verbose_name='采样策略'),
+        ),
+        migrations.AddField(
+            model_name='recordlog',
+            name='inferred_frames',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='推理帧数'),
+        ),
+    ]
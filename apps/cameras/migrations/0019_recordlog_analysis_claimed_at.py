@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0018_detection_sampling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordlog',
+            name='analysis_claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='检测领取时间'),
+        ),
+    ]
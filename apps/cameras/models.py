@@ -1,7 +1,152 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
+from datetime import timedelta
 import os
 
 
+class Camera(models.Model):
+    """摄像头配置"""
+    RECORD_MODE_CHOICES = [
+        ('transcode', 'H.264转码'),
+        ('copy', '直接复制'),
+    ]
+    SAMPLING_MODE_CHOICES = [
+        ('fixed', '固定间隔'),
+        ('adaptive', '自适应（粗扫描 + 局部加密）'),
+    ]
+
+    name = models.CharField(max_length=100, blank=True, verbose_name="名称")
+    ip = models.CharField(max_length=50, unique=True, verbose_name="摄像头IP")
+    port = models.IntegerField(default=554, verbose_name="RTSP端口")
+    username = models.CharField(max_length=50, verbose_name="用户名")
+    # 数据库中不保存明文密码，只保存密码所在的环境变量名
+    password_env = models.CharField(max_length=100, verbose_name="密码环境变量名")
+    stream_path = models.CharField(max_length=200, default='Streaming/Channels/101', verbose_name="主码流路径")
+    sub_stream_path = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name="子码流路径",
+        help_text="如 Streaming/Channels/102，填写后同时录制子码流，人物检测使用子码流文件"
+    )
+
+    # 录制配置
+    record_mode = models.CharField(
+        max_length=20,
+        choices=RECORD_MODE_CHOICES,
+        default='transcode',
+        verbose_name="录制模式"
+    )
+    enabled = models.BooleanField(default=True, verbose_name="启用录制")
+
+    # 人物检测区域（归一化坐标，与分辨率无关，主码流和子码流共用）
+    roi_polygon = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="检测区域",
+        help_text="多边形顶点 [[x, y], ...]，坐标为画面宽高的比例（0-1），如 [[0, 0.4], [1, 0.4], [1, 1], [0, 1]]；留空检测整个画面"
+    )
+
+    # 检测采样策略（留空使用 DETECTION_SAMPLING_* 环境变量的全局默认值）
+    sampling_mode = models.CharField(
+        max_length=20,
+        choices=SAMPLING_MODE_CHOICES,
+        blank=True,
+        verbose_name="采样策略",
+        help_text="自适应：按粗采样间隔扫描，检测到人物或运动的区间再按 DETECTION_SAMPLE_INTERVAL 加密；留空使用 DETECTION_SAMPLING_MODE"
+    )
+    coarse_sample_interval = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="粗采样间隔(秒)",
+        help_text="自适应采样的扫描间隔，留空使用 DETECTION_COARSE_INTERVAL"
+    )
+
+    # 保留策略（留空使用 RETENTION_* 环境变量的全局默认值）
+    retention_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="保留天数",
+        help_text="超过该天数的录像、截图和记录一并删除，留空使用 RETENTION_DAYS"
+    )
+    storage_budget_gb = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="主存储上限(GB)",
+        help_text="超出后最旧的录像转入归档目录（未配置归档目录时删除），留空使用 RETENTION_BUDGET_GB"
+    )
+    archive_after_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="归档天数",
+        help_text="超过该天数的录像移动到 RETENTION_ARCHIVE_DIR，留空使用 RETENTION_ARCHIVE_AFTER_DAYS"
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "摄像头"
+        verbose_name_plural = "摄像头"
+        ordering = ['ip']
+
+    def __str__(self):
+        return f"{self.name} ({self.ip})" if self.name else self.ip
+
+    def clean(self):
+        super().clean()
+        if self.roi_polygon in (None, []):
+            self.roi_polygon = None
+            return
+        from apps.cameras.roi import validate_polygon
+
+        try:
+            validate_polygon(self.roi_polygon)
+        except ValueError as e:
+            raise ValidationError({'roi_polygon': str(e)})
+
+    def get_password(self):
+        """从环境变量读取密码"""
+        return os.getenv(self.password_env, '')
+
+    def get_rtsp_url(self):
+        """生成 RTSP 地址"""
+        return f"rtsp://{self.username}:{self.get_password()}@{self.ip}:{self.port}/{self.stream_path}"
+
+    def to_recorder_config(self):
+        """转换为录制器使用的配置"""
+        return {
+            'ip': self.ip,
+            'user': self.username,
+            'password': self.get_password(),
+            'port': self.port,
+            'path': self.stream_path,
+            'sub_path': self.sub_stream_path or None,
+            'record_mode': self.record_mode,
+        }
+
+
+class RecordingNode(models.Model):
+    """录制节点（run_recorder 进程定期上报心跳）"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="节点名称")
+    last_heartbeat = models.DateTimeField(verbose_name="最后心跳时间")
+    cameras = models.JSONField(default=list, blank=True, verbose_name="负责的摄像头")
+
+    class Meta:
+        verbose_name = "录制节点"
+        verbose_name_plural = "录制节点"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def alive_names(cls, ttl):
+        """返回 ttl 秒内有心跳的节点名称"""
+        cutoff = timezone.now() - timedelta(seconds=ttl)
+        return list(cls.objects.filter(last_heartbeat__gte=cutoff).values_list('name', flat=True))
+
+
 class RecordLog(models.Model):
     """摄像头录制日志"""
     STATUS_CHOICES = [
@@ -10,6 +155,17 @@ class RecordLog(models.Model):
         ('timeout', '超时'),
     ]
 
+    RECORD_MODE_CHOICES = [
+        ('transcode', 'H.264转码'),
+        ('copy', '直接复制'),
+        ('fallback', '转码(NAL错误回退)'),
+    ]
+
+    STORAGE_TIER_CHOICES = [
+        ('hot', '主存储'),
+        ('archive', '归档存储'),
+    ]
+
     ANALYSIS_STATUS_CHOICES = [
         ('pending', '待检测'),
         ('processing', '检测中'),
@@ -21,7 +177,8 @@ class RecordLog(models.Model):
     camera_user = models.CharField(max_length=50, verbose_name="用户名")
     task_id = models.CharField(max_length=200, null=True, blank=True, verbose_name="任务ID")
 
-    start_time = models.DateTimeField(auto_now_add=True, verbose_name="开始时间")
+    # 分段录制时由录制进程写入切片的实际开始时间，因此不使用 auto_now_add
+    start_time = models.DateTimeField(default=timezone.now, verbose_name="开始时间")
     end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
 
     status = models.CharField(
@@ -33,6 +190,51 @@ class RecordLog(models.Model):
 
     file_path = models.CharField(max_length=500, null=True, blank=True, verbose_name="录制文件路径")
     file_size = models.BigIntegerField(null=True, blank=True, verbose_name="文件大小(字节)")
+    # 小时合并后 file_path 指向整小时文件，本分钟位于文件内的偏移和时长（秒）；未合并时为空
+    segment_offset = models.FloatField(null=True, blank=True, verbose_name="文件内偏移(秒)")
+    segment_duration = models.FloatField(null=True, blank=True, verbose_name="文件内时长(秒)")
+    # 同一小时内编码或分辨率不一致、无法直接复制合并时标记，保留分钟文件，不再参与合并
+    compaction_skipped = models.BooleanField(default=False, verbose_name="跳过合并")
+    # 子码流文件（低分辨率，仅用于人物检测；截图仍取自主码流文件）
+    sub_file_path = models.CharField(max_length=500, null=True, blank=True, verbose_name="子码流文件路径")
+    record_mode = models.CharField(
+        max_length=20,
+        choices=RECORD_MODE_CHOICES,
+        default='transcode',
+        verbose_name="录制模式"
+    )
+    storage_tier = models.CharField(
+        max_length=20,
+        choices=STORAGE_TIER_CHOICES,
+        default='hot',
+        verbose_name="存储层级"
+    )
+
+    # 关键帧索引 [[时间戳(秒), 字节偏移], ...]，录制完成后由 ffprobe 生成，用于按 GOP 定位
+    keyframe_index = models.JSONField(null=True, blank=True, verbose_name="关键帧索引")
+
+    # 人物轨迹 [{'bbox': 归一化坐标, 'last_seen': 时间, 'saved_at': 时间}, ...]
+    track_state = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="人物轨迹",
+        help_text="检测结束时仍在画面中的人物轨迹，供同一摄像头下一分钟接续去重"
+    )
+
+    # 人物检测推理的帧数（扫描帧 + 加密帧），用于对比采样策略的开销
+    inferred_frames = models.PositiveIntegerField(null=True, blank=True, verbose_name="推理帧数")
+
+    # 检测检查点 {'frame': 最后处理的扫描帧, 'refined_frame_numbers': 该帧之后已处理的加密帧,
+    #            'last_detection_time': 秒, 'tracks': 人物轨迹}，检测完成后清空
+    analysis_checkpoint = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="检测检查点",
+        help_text="检测中断或失败后，重试从检查点之后的帧继续"
+    )
+
+    # 每秒 1 字节的运动指数（0-255，变化像素占比），录制时计算，用于跳过静止画面的检测
+    motion_index = models.BinaryField(null=True, blank=True, verbose_name="每秒运动指数")
 
     error_message = models.TextField(null=True, blank=True, verbose_name="错误信息")
 
@@ -44,6 +246,8 @@ class RecordLog(models.Model):
         verbose_name="检测状态"
     )
     analysis_time = models.DateTimeField(null=True, blank=True, verbose_name="检测完成时间")
+    # 领取检测（置为检测中）的时间，写检查点时刷新；超过 DETECTION_STALE_TIMEOUT 未刷新视为检测进程已退出
+    analysis_claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="检测领取时间")
 
     class Meta:
         verbose_name = "录制日志"
@@ -53,6 +257,8 @@ class RecordLog(models.Model):
             models.Index(fields=['-start_time']),
             models.Index(fields=['camera_ip']),
             models.Index(fields=['status']),
+            # 保留策略按摄像头从最旧的录像开始处理
+            models.Index(fields=['camera_ip', 'storage_tier', 'start_time']),
         ]
 
     def __str__(self):
@@ -65,6 +271,12 @@ class RecordLog(models.Model):
             return delta.total_seconds()
         return None
 
+    def motion_seconds(self, threshold):
+        """运动指数达到阈值的秒数，没有运动指数时返回 None"""
+        if self.motion_index is None:
+            return None
+        return sum(1 for score in bytes(self.motion_index) if score >= threshold)
+
     def get_video_url(self):
         """生成视频访问 URL"""
         if not self.file_path:
@@ -74,11 +286,26 @@ class RecordLog(models.Model):
         base_url = os.getenv('RESOURCE_BASE_URL', 'http://resource.haoke.vip')
         base_dir = os.getenv('CAMERA_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraRecordings')
 
+        if self.storage_tier == 'archive':
+            # 归档目录需要单独配置访问地址
+            archive_url = os.getenv('RETENTION_ARCHIVE_URL')
+            if not archive_url:
+                return None
+            relative_path = self.file_path.replace(os.getenv('RETENTION_ARCHIVE_DIR', ''), '').lstrip('/')
+            return f"{archive_url.rstrip('/')}/{relative_path}{self.get_media_fragment()}"
+
         # 将本地路径转换为相对路径
         relative_path = self.file_path.replace(base_dir, '').lstrip('/')
 
         # 拼接 URL
-        return f"{base_url}/CameraRecordings/{relative_path}"
+        return f"{base_url}/CameraRecordings/{relative_path}{self.get_media_fragment()}"
+
+    def get_media_fragment(self):
+        """合并后的录像通过媒体片段 #t=开始,结束 定位到本分钟"""
+        if self.segment_offset is None:
+            return ''
+        end = self.segment_offset + (self.segment_duration or 0)
+        return f"#t={self.segment_offset:.3f},{end:.3f}"
 
 
 class PersonDetection(models.Model):
@@ -99,6 +326,7 @@ class PersonDetection(models.Model):
     frame_number = models.IntegerField(verbose_name="帧序号")
     timestamp = models.FloatField(verbose_name="视频时间戳(秒)")
     image_path = models.CharField(max_length=500, verbose_name="截图路径")
+    thumbnail_path = models.CharField(max_length=500, blank=True, default='', verbose_name="缩略图路径")
     confidence = models.FloatField(verbose_name="检测置信度")
     bbox = models.JSONField(null=True, blank=True, verbose_name="边界框坐标")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
@@ -124,20 +352,32 @@ class PersonDetection(models.Model):
             models.Index(fields=['-created_at']),
             models.Index(fields=['caption_status']),
         ]
+        constraints = [
+            # 重试、检测服务重新领取时同一帧不会重复写入
+            models.UniqueConstraint(fields=['record_log', 'frame_number'], name='unique_detection_frame'),
+        ]
 
     def __str__(self):
         return f"{self.record_log.camera_ip} - Frame {self.frame_number} - {self.confidence:.2f}"
 
     def get_image_url(self):
         """生成图片访问 URL"""
-        if not self.image_path:
+        return self._path_to_url(self.image_path)
+
+    def get_thumbnail_url(self):
+        """生成缩略图访问 URL，没有缩略图时使用原图"""
+        return self._path_to_url(self.thumbnail_path) or self.get_image_url()
+
+    @staticmethod
+    def _path_to_url(path):
+        if not path:
             return None
 
         base_url = os.getenv('RESOURCE_BASE_URL', 'http://resource.haoke.vip')
         pics_base_dir = os.getenv('PICS_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraWarningPics')
 
         # 将本地路径转换为相对路径
-        relative_path = self.image_path.replace(pics_base_dir, '').lstrip('/')
+        relative_path = path.replace(pics_base_dir, '').lstrip('/')
 
         # 拼接 URL
         return f"{base_url}/CameraWarningPics/{relative_path}"
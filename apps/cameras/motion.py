@@ -0,0 +1,198 @@
+"""
+每秒运动指数
+
+录制时让 ffmpeg 额外输出一路极低分辨率（64x36）、2fps 的灰度原始帧，用 NumPy 帧差计算每秒的运动指数：
+相邻两帧中灰度变化超过 MOTION_PIXEL_DIFF 的像素占比，映射到 0-255，每秒 1 字节存入 RecordLog.motion_index。
+
+analyze_video_for_person 据此跳过没有运动的秒，整分钟都没有运动时直接跳过 YOLO 检测。
+
+没有运动指数的录像（历史录像、录制时未开启）可以开启 DETECTION_MOTION_FILTER，
+在检测时用 FrameMotionFilter 对采样帧做同样的帧差，画面没有变化的采样帧不送入模型。
+"""
+import os
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# 运动检测帧率和尺寸（缩小后压缩噪声基本被平滑掉，帧差计算几乎不占 CPU）
+MOTION_FPS = 2
+MOTION_WIDTH = 64
+MOTION_HEIGHT = 36
+MOTION_FRAME_BYTES = MOTION_WIDTH * MOTION_HEIGHT
+
+
+def is_motion_index_enabled():
+    """
+    是否在录制时计算运动指数（MOTION_INDEX_ENABLED，默认关闭）
+
+    copy 模式本来不解码视频，没有子码流时计算运动指数需要额外解码一路全分辨率主码流，因此需要显式开启
+    """
+    return os.getenv('MOTION_INDEX_ENABLED', 'False').lower() in ('true', '1', 't')
+
+
+def build_motion_args(target, stream="0:v"):
+    """
+    生成运动检测输出的 ffmpeg 参数
+
+    Args:
+        target: 输出目标（文件路径或 pipe:N）
+        stream: 用于计算运动的视频流（有子码流时使用子码流）
+    """
+    return [
+        "-map", stream,
+        "-vf", f"fps={MOTION_FPS},scale={MOTION_WIDTH}:{MOTION_HEIGHT},format=gray",
+        "-f", "rawvideo",
+        target,
+    ]
+
+
+def frame_motion_score(previous, current):
+    """
+    两帧之间的运动分数（0-255）
+
+    Args:
+        previous, current: MOTION_HEIGHT x MOTION_WIDTH 的灰度帧（numpy uint8）
+    """
+    import numpy as np  # 延迟导入
+
+    pixel_diff = int(os.getenv('MOTION_PIXEL_DIFF', '25'))
+    diff = np.abs(current.astype(np.int16) - previous.astype(np.int16))
+    changed_ratio = np.count_nonzero(diff > pixel_diff) / diff.size
+    return min(255, math.ceil(changed_ratio * 255))
+
+
+def motion_index_from_file(path, duration=0):
+    """
+    从录制时输出的灰度原始帧文件计算运动指数
+
+    Args:
+        path: 灰度原始帧文件
+        duration: 视频时长（秒），灰度帧不足该时长时末尾补 0
+
+    Returns:
+        bytes: 每秒 1 字节的运动指数
+    """
+    import numpy as np  # 延迟导入
+
+    data = np.fromfile(path, dtype=np.uint8)
+    frame_count = len(data) // MOTION_FRAME_BYTES
+    frames = data[:frame_count * MOTION_FRAME_BYTES].reshape(frame_count, MOTION_HEIGHT, MOTION_WIDTH)
+
+    seconds = max(math.ceil(duration), math.ceil(frame_count / MOTION_FPS))
+    scores = bytearray(seconds)
+    for i in range(1, frame_count):
+        second = i // MOTION_FPS
+        scores[second] = max(scores[second], frame_motion_score(frames[i - 1], frames[i]))
+    return bytes(scores)
+
+
+class MotionTracker:
+    """
+    常驻录制使用的运动指数累加器
+
+    旁路读取的灰度帧按读取时的挂钟时间归入对应的秒，切片关闭时取出切片时间范围内的运动指数。
+    """
+
+    # 只保留最近一段时间的分数（秒），切片最长一分钟，留出余量
+    RETENTION_SECONDS = 300
+
+    def __init__(self):
+        self._previous = None
+        self._scores = {}   # 挂钟秒（整数时间戳）-> 运动分数
+
+    def add(self, captured_at, data):
+        """登记一帧灰度原始数据"""
+        import numpy as np  # 延迟导入
+
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(MOTION_HEIGHT, MOTION_WIDTH)
+        if self._previous is not None:
+            second = int(captured_at.timestamp())
+            self._scores[second] = max(self._scores.get(second, 0), frame_motion_score(self._previous, frame))
+            cutoff = second - self.RETENTION_SECONDS
+            for stale in [s for s in self._scores if s < cutoff]:
+                del self._scores[stale]
+        self._previous = frame
+
+    def reset(self):
+        """ffmpeg 重启后重新开始帧差"""
+        self._previous = None
+
+    def slice(self, start_time, end_time):
+        """
+        取出 [start_time, end_time) 的运动指数
+
+        Returns:
+            bytes: 每秒 1 字节；没有任何分数时返回 None（例如运动旁路未运行）
+        """
+        start = int(start_time.timestamp())
+        seconds = max(math.ceil(end_time.timestamp() - start_time.timestamp()), 0)
+        if not any(start + i in self._scores for i in range(seconds)):
+            return None
+        return bytes(self._scores.get(start + i, 0) for i in range(seconds))
+
+
+class FrameMotionFilter:
+    """
+    采样帧运动预过滤
+
+    采样帧缩小为 MOTION_WIDTH x MOTION_HEIGHT 灰度后，与参照帧计算运动分数（与运动指数同一尺度 0-255），
+    低于 DETECTION_MOTION_FILTER_THRESHOLD 的帧不送入模型。静止画面中的人物已在之前的帧中检测过。
+
+    参照帧由 DETECTION_MOTION_FILTER_MODE 决定：
+        previous   - 上一个采样帧
+        background - 滑动平均背景（权重 DETECTION_MOTION_FILTER_ALPHA），对缓慢的光线变化不敏感
+    """
+
+    def __init__(self, threshold=None, mode=None, alpha=None):
+        self.threshold = threshold if threshold is not None else int(os.getenv('DETECTION_MOTION_FILTER_THRESHOLD', '2'))
+        self.mode = mode or os.getenv('DETECTION_MOTION_FILTER_MODE', 'previous')
+        self.alpha = alpha if alpha is not None else float(os.getenv('DETECTION_MOTION_FILTER_ALPHA', '0.1'))
+        self._reference = None
+
+    def accept(self, frame):
+        """
+        判断采样帧是否需要检测（第一帧总是需要）
+
+        Args:
+            frame: BGR 帧（numpy uint8）
+        """
+        import cv2  # 延迟导入
+        import numpy as np  # 延迟导入
+
+        small = cv2.resize(frame, (MOTION_WIDTH, MOTION_HEIGHT), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if self._reference is None:
+            self._reference = gray.astype(np.float32)
+            return True
+
+        score = frame_motion_score(self._reference.astype(np.uint8), gray)
+        if self.mode == 'background':
+            self._reference = self._reference * (1 - self.alpha) + gray * self.alpha
+        else:
+            self._reference = gray.astype(np.float32)
+        return score >= self.threshold
+
+
+def is_motion_filter_enabled():
+    """是否在检测前对采样帧做运动预过滤（DETECTION_MOTION_FILTER）"""
+    return os.getenv('DETECTION_MOTION_FILTER', 'False').lower() in ('true', '1', 't')
+
+
+def active_seconds(motion_index, threshold, padding=None):
+    """
+    根据运动指数计算需要检测的秒
+
+    运动前后各扩展 padding 秒，避免人物刚停下或即将进入画面时漏检。
+
+    Returns:
+        set: 需要检测的秒（视频内偏移）
+    """
+    if padding is None:
+        padding = int(os.getenv('MOTION_PADDING_SECONDS', '2'))
+    active = set()
+    for second, score in enumerate(motion_index):
+        if score >= threshold:
+            active.update(range(max(second - padding, 0), min(second + padding + 1, len(motion_index))))
+    return active
@@ -0,0 +1,175 @@
+"""
+视频分析流水线
+
+解码、推理、写入（截图 JPEG）三个阶段通过有界队列连接并行执行：
+
+    解码线程 --帧队列--> 推理（调用线程） --写入队列--> 写入线程
+
+推理时解码线程继续准备下一批帧，写入线程同时保存上一批的截图，GPU 和 CPU 不再互相等待。
+队列长度为 ANALYSIS_QUEUE_SIZE（默认 2 倍 DETECTION_BATCH_SIZE），某个阶段跟不上时上游阻塞等待，内存占用有上限。
+
+每个阶段分别统计工作耗时和等待耗时，结束时输出各阶段耗时和瓶颈阶段。
+"""
+import os
+import queue
+import threading
+import time
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# 阶段结束标记
+_END = object()
+
+STAGE_NAMES = {'decode': '解码', 'infer': '推理', 'write': '写入'}
+
+
+class AnalysisPipeline:
+    """
+    三阶段分析流水线
+
+    Args:
+        batch_size: 每次推理的帧数
+        queue_size: 帧队列和写入队列的长度
+        max_wait: 凑批最长等待时间（秒），超时后不足 batch_size 的批次也立即推理；None 表示一直等到凑满或结束
+    """
+
+    def __init__(self, batch_size, queue_size=None, max_wait=None):
+        self.batch_size = max(int(batch_size), 1)
+        self.queue_size = queue_size or int(os.getenv('ANALYSIS_QUEUE_SIZE', '0')) or self.batch_size * 2
+        self.max_wait = max_wait
+        # {阶段}: 工作耗时；{阶段}_wait: 等待上游或下游的耗时
+        self.timings = Counter()
+        self._stop = threading.Event()
+        self._errors = []
+
+    def run(self, frames, infer, write):
+        """
+        执行流水线，任一阶段出错时停止其他阶段并抛出该异常
+
+        Args:
+            frames: 产出 (帧序号, 时间戳, 帧) 的可迭代对象，在解码线程中迭代
+            infer: infer(batch) -> 写入任务列表，batch 为 [(帧序号, 时间戳, 帧), ...]，在调用线程中执行
+            write: write(job) 在写入线程中逐个执行
+
+        Returns:
+            Counter: 各阶段耗时（秒）
+        """
+        frame_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        decoder = threading.Thread(
+            target=self._decode, args=(frames, frame_queue), name='analysis-decode', daemon=True
+        )
+        writer = threading.Thread(
+            target=self._write, args=(write, write_queue), name='analysis-write', daemon=True
+        )
+        decoder.start()
+        writer.start()
+
+        try:
+            batch = []
+            finished = False
+            while not finished and not self._stop.is_set():
+                item = self._get(frame_queue, 'infer_wait', timeout=self.max_wait if batch else None)
+                if item is _END:
+                    finished = True
+                elif item is not None:
+                    batch.append(item)
+                if batch and (finished or item is None or len(batch) >= self.batch_size):
+                    started = time.perf_counter()
+                    jobs = infer(batch)
+                    self.timings['infer'] += time.perf_counter() - started
+                    for job in jobs:
+                        self._put(write_queue, job, 'infer_wait')
+                    batch = []
+            self._put(write_queue, _END, 'infer_wait')
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            decoder.join()
+            writer.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return self.timings
+
+    def summary(self):
+        """各阶段耗时摘要，工作耗时最长的阶段为瓶颈"""
+        parts = [
+            f"{label} {self.timings[stage]:.2f}s（等待 {self.timings[stage + '_wait']:.2f}s）"
+            for stage, label in STAGE_NAMES.items()
+        ]
+        bottleneck = max(STAGE_NAMES, key=lambda stage: self.timings[stage])
+        return f"{', '.join(parts)}，瓶颈: {STAGE_NAMES[bottleneck]}"
+
+    def _decode(self, frames, frame_queue):
+        iterator = iter(frames)
+        try:
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.timings['decode'] += time.perf_counter() - started
+                self._put(frame_queue, item, 'decode_wait')
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(frame_queue, _END, 'decode_wait')
+
+    def _write(self, write, write_queue):
+        from django.db import connection
+
+        try:
+            while True:
+                job = self._get(write_queue, 'write_wait')
+                if job is _END or (job is None and self._stop.is_set()):
+                    break
+                if job is None:
+                    continue
+                started = time.perf_counter()
+                write(job)
+                self.timings['write'] += time.perf_counter() - started
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # 写入线程使用独立的数据库连接，结束时关闭
+            connection.close()
+
+    def _fail(self, error):
+        logger.error(f"分析流水线 {threading.current_thread().name} 阶段出错: {error}", exc_info=True)
+        self._errors.append(error)
+        self._stop.set()
+
+    def _get(self, source, timing_key, timeout=None):
+        """从队列取一项，停止或超过 timeout 秒时返回 None"""
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return source.get(timeout=0.2 if timeout is None else min(timeout, 0.2))
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return None
+                    if timeout is not None and time.perf_counter() - started >= timeout:
+                        return None
+        finally:
+            self.timings[timing_key] += time.perf_counter() - started
+
+    def _put(self, target, item, timing_key):
+        """放入队列，队列满时等待；停止后放弃（下游已不再读取）"""
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    target.put(item, timeout=0.2)
+                    return
+                except queue.Full:
+                    if self._stop.is_set():
+                        return
+        finally:
+            self.timings[timing_key] += time.perf_counter() - started
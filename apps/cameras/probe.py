@@ -0,0 +1,67 @@
+"""
+ffprobe 工具函数
+"""
+import json
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def probe_video(path, timeout=30):
+    """
+    读取视频的时长和首个视频流信息
+
+    Returns:
+        dict: {'duration': 秒, 'codec': 编码, 'width': 宽, 'height': 高}
+
+    Raises:
+        subprocess.CalledProcessError: ffprobe 执行失败（文件损坏或不存在）
+    """
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "format=duration:stream=codec_name,width,height",
+            "-of", "json",
+            path,
+        ],
+        capture_output=True, text=True, timeout=timeout, check=True,
+    )
+    info = json.loads(result.stdout)
+    stream = (info.get('streams') or [{}])[0]
+    return {
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'codec': stream.get('codec_name'),
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+    }
+
+
+def probe_keyframes(path, timeout=60):
+    """
+    读取视频流的关键帧时间戳和字节偏移
+
+    只读取包头（-show_packets），不解码画面，一分钟的文件几十毫秒即可完成。
+
+    Returns:
+        list: [[时间戳(秒), 字节偏移], ...]，按时间排序
+    """
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,pos,flags",
+            "-of", "csv=p=0",
+            path,
+        ],
+        capture_output=True, text=True, timeout=timeout, check=True,
+    )
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 3 or 'K' not in parts[2] or parts[0] in ('', 'N/A'):
+            continue
+        keyframes.append([round(float(parts[0]), 3), int(parts[1]) if parts[1] not in ('', 'N/A') else None])
+    keyframes.sort(key=lambda item: item[0])
+    return keyframes
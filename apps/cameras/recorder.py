@@ -0,0 +1,841 @@
+"""
+摄像头分段录制
+
+每个摄像头常驻一个 ffmpeg 进程，使用 segment 复用器按整分钟切片，
+避免每分钟重新建立 RTSP 连接、等待关键帧导致的录制空档。
+
+切片先写入 <ip>/.segments/<节点名> 暂存目录，关闭后再移动到
+CAMERA_BASE_DIR/<ip>/YYYY/MM/DD/HH/MM.mp4，保持与 record_camera_task 相同的目录结构，
+每个切片生成一条 RecordLog 并触发人物检测任务。
+
+所有摄像头的 ffmpeg 子进程由同一个 asyncio 事件循环驱动（RecordingSupervisor），
+一个进程即可录制上百路摄像头，不再每路每分钟占用一个 Celery worker。
+多个录制节点通过心跳登记在 RecordingNode 表中，按一致性哈希领取 Camera 表中的摄像头。
+"""
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from apps.cameras.motion import MOTION_FRAME_BYTES, MotionTracker, build_motion_args, is_motion_index_enabled
+from apps.cameras.probe import probe_keyframes
+
+logger = logging.getLogger(__name__)
+
+# 录制使用的时区（与 record_camera_task 保持一致）
+RECORD_TIMEZONE = "Asia/Shanghai"
+
+# 切片暂存目录名（位于每个摄像头目录下）
+STAGING_DIRNAME = ".segments"
+
+# 暂存文件名格式（精确到秒，避免进程重启后与上一个切片重名）
+STAGING_NAME_FORMAT = "%Y%m%d%H%M%S"
+
+# 子码流暂存切片的后缀（与主码流切片同名，正式文件为 MM.sub.mp4）
+SUB_SEGMENT_SUFFIX = ".sub.mp4"
+
+# 重新编码为 H.264，避免原始流的 HEVC NAL 单元错误
+H264_TRANSCODE_ARGS = [
+    "-c:v", "libx264",           # 使用 H.264 编码器
+    "-preset", "ultrafast",       # 快速编码
+    "-crf", "23",                 # 质量控制（18-28，越小质量越好）
+    "-r", "25",                   # 固定帧率为 25fps
+]
+
+# 错误处理参数
+ERROR_TOLERANCE_ARGS = [
+    "-err_detect", "ignore_err",  # 忽略非致命错误
+    "-fflags", "+genpts",         # 生成时间戳
+]
+
+# 录制模式
+#   copy      - 直接复制原始码流（-c copy），几乎不占 CPU
+#   transcode - 重新编码为 H.264
+#   fallback  - 配置为 copy，但检测到 HEVC NAL 错误后回退为 H.264 转码
+RECORD_MODE_COPY = 'copy'
+RECORD_MODE_TRANSCODE = 'transcode'
+RECORD_MODE_FALLBACK = 'fallback'
+
+# 出现这些 ffmpeg 错误时说明原始 HEVC 码流有问题，直接复制会得到无法播放的文件
+HEVC_NAL_ERROR_PATTERNS = (
+    "Invalid NAL unit",
+    "Error parsing NAL unit",
+    "Skipping invalid undecodable NALU",
+    "PPS id out of range",
+    "SPS id out of range",
+    "non-existing PPS",
+    "Could not find ref with POC",
+)
+
+# 记录最近一次 NAL 错误的标记文件，COPY_FALLBACK_RETRY_INTERVAL 秒内直接转码，之后再尝试复制
+COPY_FALLBACK_MARKER = ".copy_fallback"
+
+
+def build_rtsp_url(ip, user, password, port, path):
+    """拼接摄像头 RTSP 地址"""
+    return f"rtsp://{user}:{password}@{ip}:{port}/{path}"
+
+
+def build_input_args(source):
+    """
+    生成 ffmpeg 输入参数
+
+    RTSP 地址使用 TCP 传输；本地文件（用于测试）按实时速率循环读取，模拟摄像头直播流
+    """
+    if source.startswith("rtsp://"):
+        return ["-rtsp_transport", "tcp", "-i", source]
+    return ["-re", "-stream_loop", "-1", "-i", source]
+
+
+def build_codec_args(record_mode):
+    """生成视频编码参数：copy 模式直接复制码流，其余模式重新编码为 H.264"""
+    if record_mode == RECORD_MODE_COPY:
+        return ["-c:v", "copy"]
+    return list(H264_TRANSCODE_ARGS)
+
+
+def is_hevc_nal_error(line):
+    """判断 ffmpeg 输出的一行是否为 HEVC NAL 单元错误"""
+    return any(pattern in line for pattern in HEVC_NAL_ERROR_PATTERNS)
+
+
+def mark_copy_fallback(base_dir, ip):
+    """
+    记录摄像头出现过 NAL 错误
+
+    标记文件放在摄像头目录下，按分钟调度的录制任务和常驻录制进程可以共享该状态
+    """
+    marker = os.path.join(base_dir, ip, COPY_FALLBACK_MARKER)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, "w") as f:
+        f.write(datetime.now().isoformat())
+
+
+def resolve_record_mode(base_dir, ip, record_mode):
+    """
+    根据配置和最近的 NAL 错误确定本次实际使用的录制模式
+
+    Returns:
+        str: copy / transcode / fallback
+    """
+    if record_mode != RECORD_MODE_COPY:
+        return RECORD_MODE_TRANSCODE
+
+    marker = os.path.join(base_dir, ip, COPY_FALLBACK_MARKER)
+    retry_interval = int(os.getenv("COPY_FALLBACK_RETRY_INTERVAL", "1800"))
+    try:
+        if time.time() - os.path.getmtime(marker) < retry_interval:
+            return RECORD_MODE_FALLBACK
+    except FileNotFoundError:
+        pass
+    return RECORD_MODE_COPY
+
+
+def staging_start_time(staging_file):
+    """暂存切片的开始时间（由文件名解析，主码流和子码流切片通用）"""
+    return datetime.strptime(os.path.basename(staging_file).split(".", 1)[0], STAGING_NAME_FORMAT)
+
+
+def run_recording(cmd, timeout, stop_on_nal_error=False):
+    """
+    运行一次 ffmpeg 录制并实时检查错误输出
+
+    Args:
+        cmd: ffmpeg 命令
+        timeout: 超时时间（秒），超时后终止进程并抛出 subprocess.TimeoutExpired
+        stop_on_nal_error: 检测到 HEVC NAL 错误时向 ffmpeg 发送 SIGINT 结束录制（copy 模式使用），
+                           ffmpeg 正常写完文件尾，已录制的部分仍可播放
+
+    Returns:
+        tuple: (退出码, 触发终止的 NAL 错误行或 None)
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    timed_out = threading.Event()
+
+    def _kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, _kill_on_timeout)
+    timer.start()
+
+    nal_error = None
+    try:
+        for line in process.stderr:
+            line = line.strip()
+            if not line:
+                continue
+            logger.warning(f"ffmpeg: {line}")
+            if stop_on_nal_error and nal_error is None and is_hevc_nal_error(line):
+                nal_error = line
+                # 继续读取错误输出直到 ffmpeg 退出；不退出时由超时兜底
+                process.send_signal(signal.SIGINT)
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return returncode, nal_error
+
+
+class RecordLogWriter:
+    """
+    批量写入 RecordLog
+
+    切片完成后只在内存中登记，攒够 batch_size 条或每隔 flush_interval 秒
+    用一次 bulk_create 写入数据库，再统一提交分析任务，避免每个切片一次数据库往返。
+
+    指定 on_written 时（实时检测已处理过这些切片）不再提交分析任务，
+    改为回调 on_written(records)，records 中每条记录附带写入后的 id。
+
+    写入和提交分析分开重试：写入成功后提交失败（如消息队列不可用）时，
+    只重试提交已写入的记录，不会重复插入 RecordLog。
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, on_written=None):
+        self.batch_size = batch_size or int(os.getenv("RECORDLOG_BATCH_SIZE", "50"))
+        self.flush_interval = flush_interval or float(os.getenv("RECORDLOG_FLUSH_INTERVAL", "5"))
+        self.on_written = on_written
+        self._pending = []      # 待写入的字段
+        self._unqueued = []     # 已写入、尚未提交分析的记录（附带 id）
+        self._wakeup = asyncio.Event()
+        self._closed = False
+
+    def add(self, **fields):
+        """登记一条待写入的 RecordLog"""
+        self._pending.append(fields)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self):
+        """定时刷新，直到 close() 被调用；退出前写入剩余记录"""
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    def close(self):
+        """通知 run() 写完剩余记录后退出"""
+        self._closed = True
+        self._wakeup.set()
+
+    async def flush(self):
+        # ORM 和 Celery 投递都是同步 IO，放到线程中执行，不阻塞事件循环
+        if self._unqueued:
+            written, self._unqueued = self._unqueued, []
+            await self._dispatch(written)
+
+        if not self._pending:
+            return
+        records, self._pending = self._pending, []
+        try:
+            written = await asyncio.to_thread(self._insert, records)
+        except Exception as e:
+            logger.error(f"批量写入 RecordLog 失败，下次重试 ({len(records)} 条): {e}", exc_info=True)
+            self._pending = records + self._pending
+            return
+        await self._dispatch(written)
+
+    async def _dispatch(self, written):
+        """提交分析任务（或回调 on_written），失败时下次只重试提交"""
+        try:
+            await asyncio.to_thread(self._notify, written)
+        except Exception as e:
+            logger.error(f"提交录制日志的分析任务失败，下次重试 ({len(written)} 条): {e}", exc_info=True)
+            self._unqueued = written + self._unqueued
+
+    def _insert(self, records):
+        """
+        写入 RecordLog
+
+        Returns:
+            list: 附带 id 的记录字段
+        """
+        from apps.cameras.models import RecordLog
+
+        # 关键帧索引只读取包头，每个切片几十毫秒，和数据库写入一起放在线程中完成
+        for fields in records:
+            if 'keyframe_index' not in fields:
+                try:
+                    fields['keyframe_index'] = probe_keyframes(fields['file_path'])
+                except Exception as e:
+                    fields['keyframe_index'] = None
+                    logger.warning(f"关键帧索引生成失败 ({fields['file_path']}): {e}")
+
+        # 常驻进程中数据库连接可能已超时，先清理失效连接
+        close_old_connections()
+        paths = [fields['file_path'] for fields in records]
+        # 插入和查回 ID 在同一个事务内，查询失败时插入一起回滚，重试不会产生重复记录
+        with transaction.atomic():
+            RecordLog.objects.bulk_create([RecordLog(**fields) for fields in records])
+            # MySQL 的 bulk_create 不回填主键，按文件路径查回 ID
+            ids = dict(
+                RecordLog.objects.filter(file_path__in=paths).order_by('id').values_list('file_path', 'id')
+            )
+        logger.info(f"已写入 {len(records)} 条录制日志")
+        return [{**fields, 'id': ids[fields['file_path']]} for fields in records]
+
+    def _notify(self, written):
+        from apps.cameras.tasks import queue_person_analysis
+
+        if self.on_written is not None:
+            self.on_written(written)
+            return
+        queue_person_analysis([fields['id'] for fields in written])
+
+
+class SegmentRecorder:
+    """
+    单个摄像头的常驻分段录制器
+
+    ffmpeg 通过 -segment_list pipe:1 在每个切片关闭时输出一行 CSV（文件名,开始,结束），
+    录制器据此移动文件并登记 RecordLog；ffmpeg 异常退出或长时间没有产出切片时按退避时间自动重启。
+
+    copy 模式下如果 ffmpeg 报出 HEVC NAL 错误，立即结束当前进程并以 H.264 转码重启。
+
+    指定 live_detector 时，同一个 ffmpeg 进程额外输出一路低分辨率原始帧到管道，
+    供录制进程内实时检测，不再对录好的切片重新解码。
+
+    启用运动指数（MOTION_INDEX_ENABLED）时再输出一路 64x36 灰度帧，
+    切片关闭时把该时间段的每秒运动指数一并写入 RecordLog。
+
+    指定 sub_path 时同一个 ffmpeg 进程同时按整分钟切片录制子码流（直接复制），
+    子码流切片通过独立的 segment_list 管道通知，与开始时间相近的主码流切片配对后一起登记为 MM.mp4 / MM.sub.mp4；
+    等到下一个主码流切片关闭或进程退出仍未配对的，主码流切片单独登记，子码流切片删除。
+    """
+
+    # 重启退避时间（秒）
+    MIN_RESTART_DELAY = 5
+    MAX_RESTART_DELAY = 60
+
+    def __init__(self, ip, user, password, port, path, writer, base_dir=None, source=None, segment_time=60,
+                 record_mode=RECORD_MODE_TRANSCODE, node_name=None, live_detector=None, sub_path=None):
+        if base_dir is None:
+            base_dir = os.getenv("CAMERA_BASE_DIR", "/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraRecordings")
+        self.ip = ip
+        self.user = user
+        self.writer = writer
+        self.base_dir = base_dir
+        # source 可指定本地文件或本地 RTSP 服务，便于脱离真实摄像头测试
+        self.source = source or build_rtsp_url(ip, user, password, port, path)
+        self.sub_source = (source or build_rtsp_url(ip, user, password, port, sub_path)) if sub_path else None
+        self.segment_time = segment_time
+        self.record_mode = record_mode
+        self.live_detector = live_detector
+        self.motion_tracker = MotionTracker() if is_motion_index_enabled() else None
+        # 每个节点使用独立的暂存目录，摄像头在节点间迁移时不会误删对方正在写的切片
+        self.staging_dir = os.path.join(base_dir, ip, STAGING_DIRNAME, node_name or socket.gethostname())
+        # 超过该时长没有切片产出，视为 ffmpeg 卡死（首个切片最长需要等待近两个切片周期）
+        self.stall_timeout = int(os.getenv("RECORD_STALL_TIMEOUT", str(segment_time * 2 + 30)))
+
+        self._process = None
+        self._process_mode = None
+        self._fallback_requested = False
+        self._stopping = asyncio.Event()
+        # 等待配对的切片：主码流 [(开始时间, 暂存路径, 时长)]，子码流 [(开始时间, 暂存路径)]
+        self._main_segments = []
+        self._sub_segments = []
+
+    def build_command(self, record_mode, tap_fd=None, motion_fd=None, sub_list_fd=None):
+        """
+        生成分段录制的 ffmpeg 命令
+
+        Args:
+            record_mode: 录制模式
+            tap_fd: 旁路帧管道的写端文件描述符，为 None 时不输出旁路帧
+            motion_fd: 运动检测灰度帧管道的写端文件描述符，为 None 时不计算运动指数
+            sub_list_fd: 子码流 segment_list 管道的写端文件描述符，为 None 时不录制子码流
+        """
+        codec_args = build_codec_args(record_mode)
+        if record_mode != RECORD_MODE_COPY:
+            codec_args += ["-g", "50"]    # 2 秒一个关键帧，保证切点贴近整分钟
+        tap_args = []
+        if tap_fd is not None:
+            from apps.cameras.live_detection import build_frame_tap_args
+            tap_args = build_frame_tap_args(tap_fd)
+        sub_input_args, sub_args = [], []
+        if sub_list_fd is not None:
+            sub_input_args = build_input_args(self.sub_source)
+            # 子码流分辨率低，直接复制即可，不占用 CPU
+            sub_args = [
+                "-map", "1:v",
+                "-c:v", "copy",
+                "-an",
+                *ERROR_TOLERANCE_ARGS,
+                *self._segment_args(f"pipe:{sub_list_fd}"),
+                os.path.join(self.staging_dir, f"{STAGING_NAME_FORMAT}{SUB_SEGMENT_SUFFIX}"),
+            ]
+        if motion_fd is not None:
+            # 有子码流时在子码流上计算，解码量更小
+            tap_args += build_motion_args(f"pipe:{motion_fd}", stream="1:v" if sub_args else "0:v")
+        return [
+            "ffmpeg",
+            "-loglevel", "error",
+            *build_input_args(self.source),
+            *sub_input_args,
+            "-map", "0:v",
+            *codec_args,
+            "-an",                        # 禁用音频
+            *ERROR_TOLERANCE_ARGS,
+            *self._segment_args("pipe:1"),
+            os.path.join(self.staging_dir, f"{STAGING_NAME_FORMAT}.mp4"),
+            *sub_args,
+            *tap_args,
+        ]
+
+    def _segment_args(self, segment_list):
+        """分段参数：按整分钟切片，每个切片时间戳从 0 开始，切片关闭时向 segment_list 输出一行 CSV"""
+        return [
+            "-f", "segment",
+            "-segment_time", str(self.segment_time),
+            "-segment_atclocktime", "1",
+            "-reset_timestamps", "1",
+            "-segment_format", "mp4",
+            "-segment_list", segment_list,
+            "-segment_list_type", "csv",
+            "-strftime", "1",
+        ]
+
+    async def run(self):
+        """运行录制循环，直到 stop() 被调用"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._discard_stale_segments()
+
+        restart_delay = self.MIN_RESTART_DELAY
+        while not self._stopping.is_set():
+            logger.info(f"{self.ip} 启动分段录制进程")
+            try:
+                segment_count = await self._run_once()
+            except Exception as e:
+                logger.error(f"{self.ip} 录制进程异常: {e}", exc_info=True)
+                segment_count = 0
+
+            if self._stopping.is_set():
+                break
+
+            if self._fallback_requested:
+                # NAL 错误触发的回退，立即以转码模式重启
+                self._fallback_requested = False
+                continue
+
+            # 录到过切片说明连接正常过，重置退避时间
+            if segment_count > 0:
+                restart_delay = self.MIN_RESTART_DELAY
+            logger.warning(f"{self.ip} ffmpeg 进程退出，{restart_delay} 秒后重启")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=restart_delay)
+            except asyncio.TimeoutError:
+                pass
+            restart_delay = min(restart_delay * 2, self.MAX_RESTART_DELAY)
+
+        logger.info(f"{self.ip} 分段录制已停止")
+
+    def stop(self):
+        """停止录制；向 ffmpeg 发送 SIGINT 让其正常写完当前切片"""
+        self._stopping.set()
+        self._interrupt()
+
+    def _interrupt(self):
+        process = self._process
+        if process is not None and process.returncode is None:
+            process.send_signal(signal.SIGINT)
+
+    async def _run_once(self):
+        """运行一次 ffmpeg 进程直到退出，返回本次完成的切片数"""
+        segment_count = 0
+        self._process_mode = resolve_record_mode(self.base_dir, self.ip, self.record_mode)
+        logger.info(f"{self.ip} 录制模式: {self._process_mode}")
+
+        # 旁路管道：{名称: (读端, 写端)}
+        pipes = {}
+        if self.live_detector is not None:
+            pipes['tap'] = os.pipe()
+        if self.motion_tracker is not None:
+            self.motion_tracker.reset()
+            pipes['motion'] = os.pipe()
+        if self.sub_source is not None:
+            pipes['sub_list'] = os.pipe()
+        write_fds = {name: fds[1] for name, fds in pipes.items()}
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                *self.build_command(
+                    self._process_mode, write_fds.get('tap'), write_fds.get('motion'), write_fds.get('sub_list')
+                ),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={**os.environ, "TZ": RECORD_TIMEZONE},  # strftime 文件名使用录制时区
+                pass_fds=tuple(write_fds.values()),
+            )
+        except Exception:
+            for read_fd, _ in pipes.values():
+                os.close(read_fd)
+            raise
+        finally:
+            # 写端只保留在 ffmpeg 进程中，ffmpeg 退出后读端才能收到 EOF
+            for write_fd in write_fds.values():
+                os.close(write_fd)
+
+        # 持续读取 stderr，避免管道写满阻塞 ffmpeg
+        stderr_task = asyncio.create_task(self._read_stderr(self._process))
+        pipe_tasks = []
+        if 'tap' in pipes:
+            pipe_tasks.append(asyncio.create_task(self._read_pipe_frames(
+                pipes['tap'][0], self.live_detector.frame_bytes,
+                lambda captured_at, data: self.live_detector.submit(self.ip, captured_at, data),
+            )))
+        if 'motion' in pipes:
+            pipe_tasks.append(asyncio.create_task(self._read_pipe_frames(
+                pipes['motion'][0], MOTION_FRAME_BYTES, self.motion_tracker.add,
+            )))
+        if 'sub_list' in pipes:
+            pipe_tasks.append(asyncio.create_task(self._read_pipe_lines(
+                pipes['sub_list'][0], self._handle_sub_segment_line,
+            )))
+
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(self._process.stdout.readline(), timeout=self.stall_timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f"{self.ip} {self.stall_timeout} 秒没有产出切片，终止 ffmpeg 进程")
+                    self._process.kill()
+                    break
+                if not line:
+                    break
+                line = line.decode().strip()
+                if not line:
+                    continue
+                try:
+                    self._handle_segment_line(line)
+                    segment_count += 1
+                except Exception as e:
+                    logger.error(f"{self.ip} 处理切片失败 ({line}): {e}", exc_info=True)
+        finally:
+            if self._process.returncode is None and not self._stopping.is_set():
+                self._process.kill()
+            returncode = await self._process.wait()
+            await stderr_task
+            await asyncio.gather(*pipe_tasks)
+            self._flush_unpaired()
+            if returncode != 0 and not self._stopping.is_set():
+                logger.error(f"{self.ip} ffmpeg 退出码: {returncode}")
+        return segment_count
+
+    async def _read_stderr(self, process):
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            line = line.decode(errors='replace').strip()
+            if not line:
+                continue
+            logger.warning(f"{self.ip} ffmpeg: {line}")
+
+            if (self._process_mode == RECORD_MODE_COPY and not self._fallback_requested
+                    and is_hevc_nal_error(line)):
+                logger.error(f"{self.ip} 检测到 HEVC NAL 错误，回退为 H.264 转码录制")
+                mark_copy_fallback(self.base_dir, self.ip)
+                self._fallback_requested = True
+                # SIGINT 让 ffmpeg 写完当前切片后退出
+                self._interrupt()
+
+    async def _read_pipe_frames(self, fd, frame_bytes, callback):
+        """持续读取旁路管道中的原始帧并交给 callback(读取时间, 数据)，读到 EOF（ffmpeg 退出）时结束"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=frame_bytes * 2)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0)
+        )
+        try:
+            while True:
+                try:
+                    data = await reader.readexactly(frame_bytes)
+                except asyncio.IncompleteReadError:
+                    break
+                callback(datetime.now(), data)
+        finally:
+            transport.close()
+
+    async def _read_pipe_lines(self, fd, callback):
+        """持续读取管道中的文本行并交给 callback(行)，读到 EOF（ffmpeg 退出）时结束"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0)
+        )
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if not line:
+                    continue
+                try:
+                    callback(line)
+                except Exception as e:
+                    logger.error(f"{self.ip} 处理切片失败 ({line}): {e}", exc_info=True)
+        finally:
+            transport.close()
+
+    def _handle_segment_line(self, line):
+        """处理 segment_list 输出的一行：文件名,开始时间,结束时间"""
+        filename, start, end = line.rsplit(",", 2)
+        duration = float(end) - float(start)
+        staging_file = os.path.join(self.staging_dir, filename)
+        if self.sub_source is None:
+            self.finalize_segment(staging_file, duration)
+            return
+
+        segment_start = staging_start_time(staging_file)
+        # 上一个切片的子码流一直没有关闭，不再等待
+        self._flush_unpaired(before=segment_start)
+        sub = self._pop_paired(self._sub_segments, segment_start)
+        if sub is not None:
+            self.finalize_segment(staging_file, duration, sub[1])
+        else:
+            self._main_segments.append((segment_start, staging_file, duration))
+
+    def _handle_sub_segment_line(self, line):
+        """处理子码流 segment_list 输出的一行，与开始时间相近的主码流切片配对"""
+        filename, _, _ = line.rsplit(",", 2)
+        sub_file = os.path.join(self.staging_dir, filename)
+        segment_start = staging_start_time(sub_file)
+        main = self._pop_paired(self._main_segments, segment_start)
+        if main is not None:
+            self.finalize_segment(main[1], main[2], sub_file)
+        else:
+            self._sub_segments.append((segment_start, sub_file))
+
+    def _pop_paired(self, segments, segment_start):
+        """取出开始时间与 segment_start 相差不到半个切片周期的切片（两路码流的切点落在各自的关键帧上，相差几秒）"""
+        for index, segment in enumerate(segments):
+            if abs((segment[0] - segment_start).total_seconds()) < self.segment_time / 2:
+                return segments.pop(index)
+        return None
+
+    def _flush_unpaired(self, before=None):
+        """
+        不再等待配对：开始时间早于 before 半个切片周期以上的（before 为 None 时为全部）
+        主码流切片单独登记，子码流切片删除
+        """
+        def expired(segment):
+            return before is None or (before - segment[0]).total_seconds() >= self.segment_time / 2
+
+        for segment in [segment for segment in self._main_segments if expired(segment)]:
+            self._main_segments.remove(segment)
+            logger.warning(f"{self.ip} 切片没有对应的子码流切片，只登记主码流: {segment[1]}")
+            try:
+                self.finalize_segment(segment[1], segment[2])
+            except Exception as e:
+                logger.error(f"{self.ip} 处理切片失败 ({segment[1]}): {e}", exc_info=True)
+        for segment in [segment for segment in self._sub_segments if expired(segment)]:
+            self._sub_segments.remove(segment)
+            logger.warning(f"{self.ip} 子码流切片没有对应的主码流切片，删除: {segment[1]}")
+            if os.path.exists(segment[1]):
+                os.remove(segment[1])
+
+    def finalize_segment(self, staging_file, duration, sub_staging_file=None):
+        """
+        将关闭的切片移动到正式目录，并登记待写入的 RecordLog
+
+        Args:
+            staging_file: 暂存目录中的切片路径
+            duration: 切片时长（秒）
+            sub_staging_file: 同一时段的子码流切片，移动为同名的 .sub.mp4
+        """
+        segment_start = staging_start_time(staging_file)
+
+        output_dir = os.path.join(self.base_dir, self.ip, segment_start.strftime("%Y/%m/%d/%H"))
+        os.makedirs(output_dir, exist_ok=True)
+        output_file = os.path.join(output_dir, f"{segment_start.strftime('%M')}.mp4")
+        if os.path.exists(output_file):
+            # 进程在分钟中途重启时同一分钟会有两个切片，后一个追加秒数避免覆盖
+            output_file = os.path.join(output_dir, f"{segment_start.strftime('%M_%S')}.mp4")
+        os.replace(staging_file, output_file)
+        sub_file = None
+        if sub_staging_file is not None and os.path.exists(sub_staging_file):
+            sub_file = f"{os.path.splitext(output_file)[0]}{SUB_SEGMENT_SUFFIX}"
+            os.replace(sub_staging_file, sub_file)
+
+        segment_end = segment_start + timedelta(seconds=duration)
+        motion_index = None
+        if self.motion_tracker is not None:
+            motion_index = self.motion_tracker.slice(segment_start, segment_end)
+
+        self.writer.add(
+            camera_ip=self.ip,
+            camera_user=self.user,
+            file_path=output_file,
+            status='success',
+            record_mode=self._process_mode,
+            start_time=segment_start,
+            end_time=segment_end,
+            file_size=os.path.getsize(output_file),
+            sub_file_path=sub_file,
+            motion_index=motion_index,
+        )
+        logger.info(f"{self.ip} 切片完成: {output_file} ({duration:.1f}秒)")
+        return output_file
+
+    def _discard_stale_segments(self):
+        """清理上次进程异常退出时残留的未完成切片（mp4 未写入 moov，无法播放）"""
+        for name in os.listdir(self.staging_dir):
+            stale_file = os.path.join(self.staging_dir, name)
+            logger.warning(f"{self.ip} 删除残留的未完成切片: {stale_file}")
+            os.remove(stale_file)
+
+
+class RecordingSupervisor:
+    """
+    在一个事件循环中管理所有摄像头的分段录制器和 RecordLog 批量写入
+
+    未指定摄像头时以节点身份运行：定期上报心跳，按一致性哈希从 Camera 表中领取摄像头，
+    节点加入或离开、摄像头增删改后自动启停对应的录制器。
+
+    frame_tap 为 True 时所有录制器输出旁路帧，由同一个 LiveDetector 实时检测，
+    切片写入后直接归属检测结果，不再投递 analyze_video_for_person 任务。
+    """
+
+    def __init__(self, base_dir=None, source=None, node_name=None, frame_tap=None):
+        self.base_dir = base_dir
+        self.source = source
+        self.node_name = node_name or socket.gethostname()
+        self.rebalance_interval = int(os.getenv("RECORDING_REBALANCE_INTERVAL", "30"))
+        self.node_ttl = int(os.getenv("RECORDING_NODE_TTL", "90"))
+        if frame_tap is None:
+            frame_tap = os.getenv("FRAME_TAP_ENABLED", "False").lower() in ("true", "1", "t")
+        self.live_detector = None
+        if frame_tap:
+            from apps.cameras.live_detection import LiveDetector
+            self.live_detector = LiveDetector()
+        self.writer = RecordLogWriter(on_written=self.live_detector.attach if self.live_detector else None)
+        self.recorders = {}
+        self._configs = {}
+        self._tasks = {}
+        self._stopped = asyncio.Event()
+
+    def add_camera(self, camera):
+        """
+        启动一个摄像头的录制（需在事件循环中调用）
+
+        Args:
+            camera: Camera.to_recorder_config() 返回的摄像头配置
+        """
+        recorder = SegmentRecorder(
+            camera['ip'], camera['user'], camera['password'], camera['port'], camera['path'],
+            self.writer,
+            base_dir=self.base_dir,
+            source=self.source,
+            record_mode=camera['record_mode'],
+            node_name=self.node_name,
+            live_detector=self.live_detector,
+            sub_path=camera.get('sub_path'),
+        )
+        self.recorders[recorder.ip] = recorder
+        self._configs[recorder.ip] = camera
+        self._tasks[recorder.ip] = asyncio.create_task(recorder.run(), name=f"recorder-{recorder.ip}")
+        logger.info(f"已启动分段录制: {recorder.ip}")
+
+    async def remove_camera(self, ip):
+        """停止一个摄像头的录制并等待 ffmpeg 写完当前切片"""
+        recorder = self.recorders.pop(ip)
+        self._configs.pop(ip)
+        recorder.stop()
+        await self._tasks.pop(ip)
+        logger.info(f"已停止分段录制: {ip}")
+
+    async def run(self, cameras=None):
+        """
+        运行到 stop() 被调用
+
+        Args:
+            cameras: 指定录制的摄像头配置列表；为 None 时按一致性哈希领取摄像头
+        """
+        writer_task = asyncio.create_task(self.writer.run())
+        detector_task = None
+        if self.live_detector is not None:
+            detector_task = asyncio.create_task(self.live_detector.run(), name="live-detector")
+
+        if cameras is not None:
+            for camera in cameras:
+                self.add_camera(camera)
+            await self._stopped.wait()
+        else:
+            await self._rebalance_loop()
+
+        await asyncio.gather(*(self.remove_camera(ip) for ip in list(self.recorders)))
+        if detector_task is not None:
+            detector_task.cancel()
+            await asyncio.gather(detector_task, return_exceptions=True)
+        self.writer.close()
+        await writer_task
+
+        if cameras is None:
+            await asyncio.to_thread(self._unregister_node)
+
+    def stop(self):
+        self._stopped.set()
+
+    async def _rebalance_loop(self):
+        logger.info(f"录制节点 {self.node_name} 启动，每 {self.rebalance_interval} 秒重新分配摄像头")
+        while not self._stopped.is_set():
+            try:
+                assigned = await asyncio.to_thread(self._claim_cameras)
+                await self._apply_assignment(assigned)
+            except Exception as e:
+                logger.error(f"摄像头分配失败: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.rebalance_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim_cameras(self):
+        """上报心跳并计算本节点负责的摄像头"""
+        from apps.cameras.models import Camera, RecordingNode
+        from apps.cameras.sharding import HashRing
+
+        close_old_connections()
+        RecordingNode.objects.update_or_create(
+            name=self.node_name,
+            defaults={'last_heartbeat': timezone.now(), 'cameras': sorted(self.recorders)},
+        )
+        ring = HashRing(RecordingNode.alive_names(self.node_ttl))
+        return {
+            camera.ip: camera.to_recorder_config()
+            for camera in Camera.objects.filter(enabled=True)
+            if ring.get_node(camera.ip) == self.node_name
+        }
+
+    async def _apply_assignment(self, assigned):
+        # 不再属于本节点或配置有变化的摄像头先停止
+        to_remove = [
+            ip for ip in self.recorders
+            if ip not in assigned or assigned[ip] != self._configs[ip]
+        ]
+        await asyncio.gather(*(self.remove_camera(ip) for ip in to_remove))
+
+        for ip, camera in assigned.items():
+            if ip not in self.recorders:
+                self.add_camera(camera)
+
+    def _unregister_node(self):
+        """退出时删除节点记录，其他节点下一轮分配即可接管摄像头"""
+        from apps.cameras.models import RecordingNode
+
+        close_old_connections()
+        RecordingNode.objects.filter(name=self.node_name).delete()
+        logger.info(f"录制节点 {self.node_name} 已注销")
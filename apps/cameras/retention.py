@@ -0,0 +1,271 @@
+"""
+录像保留策略
+
+按摄像头执行三条规则（均从最旧的录像开始，按 RETENTION_CHUNK_SIZE 分块处理）：
+
+1. 超过保留天数：删除录像文件、子码流文件、截图，以及对应的 RecordLog / PersonDetection 记录
+2. 超过归档天数：录像移动到 RETENTION_ARCHIVE_DIR（保持相对路径），RecordLog 标记为归档存储
+3. 主存储超出容量上限：最旧的录像转入归档目录，未配置归档目录时删除
+
+要处理的文件全部由数据库查询得到，不遍历录像目录；每次运行每个摄像头最多处理
+RETENTION_MAX_CHUNKS 块，剩余部分留给下一次运行，避免一次执行过长的删除。
+"""
+import os
+import shutil
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def remove_file(path):
+    """删除文件，返回释放的字节数（文件不存在时为 0）"""
+    if not path:
+        return 0
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def prune_empty_dirs(directories, root):
+    """自下而上删除空目录，直到 root 或遇到非空目录为止"""
+    root = os.path.abspath(root)
+    for directory in sorted(set(directories), key=len, reverse=True):
+        directory = os.path.abspath(directory)
+        while directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+class RetentionEngine:
+    """
+    录像保留策略执行器
+
+    Args:
+        dry_run: 只统计不删除、不移动
+        chunk_size: 每块处理的 RecordLog 数量
+        max_chunks: 每个摄像头每条规则每次运行最多处理的块数
+    """
+
+    def __init__(self, dry_run=False, chunk_size=None, max_chunks=None):
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or int(os.getenv('RETENTION_CHUNK_SIZE', '500'))
+        self.max_chunks = max_chunks or int(os.getenv('RETENTION_MAX_CHUNKS', '20'))
+        self.base_dir = os.getenv('CAMERA_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraRecordings')
+        self.pics_base_dir = os.getenv('PICS_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraWarningPics')
+        self.archive_dir = os.getenv('RETENTION_ARCHIVE_DIR', '')
+        self.stats = Counter()
+        # dry_run 时记录当前摄像头已计入统计的录像 {id: file_size}，避免后续规则重复统计
+        self._dry_run_handled = {}
+
+    def get_policy(self, camera=None):
+        """
+        摄像头的保留策略，Camera 未配置的项使用环境变量默认值（0 表示不限制）
+
+        Returns:
+            dict: {'retention_days', 'budget_bytes', 'archive_after_days'}
+        """
+        retention_days = getattr(camera, 'retention_days', None)
+        if retention_days is None:
+            retention_days = int(os.getenv('RETENTION_DAYS', '0'))
+        budget_gb = getattr(camera, 'storage_budget_gb', None)
+        if budget_gb is None:
+            budget_gb = float(os.getenv('RETENTION_BUDGET_GB', '0'))
+        archive_after_days = getattr(camera, 'archive_after_days', None)
+        if archive_after_days is None:
+            archive_after_days = int(os.getenv('RETENTION_ARCHIVE_AFTER_DAYS', '0'))
+        return {
+            'retention_days': retention_days,
+            'budget_bytes': int(budget_gb * 1024 ** 3),
+            'archive_after_days': archive_after_days if self.archive_dir else 0,
+        }
+
+    def run(self, camera_ips=None):
+        """
+        对所有摄像头（或指定摄像头）执行保留策略
+
+        Returns:
+            Counter: 统计信息
+        """
+        from apps.cameras.models import Camera, RecordLog
+
+        cameras = {camera.ip: camera for camera in Camera.objects.all()}
+        if camera_ips is None:
+            # 已从 Camera 表中删除的摄像头的历史录像同样使用默认策略清理
+            camera_ips = sorted(set(cameras) | set(
+                RecordLog.objects.order_by().values_list('camera_ip', flat=True).distinct()
+            ))
+
+        for ip in camera_ips:
+            try:
+                self.enforce(ip, cameras.get(ip))
+            except Exception as e:
+                logger.error(f"{ip} 执行保留策略失败: {e}", exc_info=True)
+                self.stats['failed_cameras'] += 1
+        return self.stats
+
+    def enforce(self, ip, camera=None):
+        """对单个摄像头执行保留策略"""
+        from apps.cameras.models import RecordLog
+
+        policy = self.get_policy(camera)
+        now = timezone.now()
+        self._dry_run_handled = {}
+
+        # 1. 超过保留天数的录像直接删除
+        if policy['retention_days']:
+            expired = RecordLog.objects.filter(
+                camera_ip=ip, start_time__lt=now - timedelta(days=policy['retention_days'])
+            )
+            self._process_chunks(expired, self._delete_chunk)
+
+        # 2. 超过归档天数的录像移动到归档目录
+        if policy['archive_after_days']:
+            aged = RecordLog.objects.filter(
+                camera_ip=ip, storage_tier='hot',
+                start_time__lt=now - timedelta(days=policy['archive_after_days']),
+            )
+            self._process_chunks(aged, self._archive_chunk)
+
+        # 3. 主存储超出容量上限，从最旧的录像开始腾出空间
+        if policy['budget_bytes']:
+            hot = RecordLog.objects.filter(camera_ip=ip, storage_tier='hot')
+            used = hot.aggregate(total=Sum('file_size'))['total'] or 0
+            used -= sum(self._dry_run_handled.values())
+            excess = used - policy['budget_bytes']
+            if excess > 0:
+                logger.info(f"{ip} 主存储 {used / 1024 ** 3:.1f}GB 超出上限 {policy['budget_bytes'] / 1024 ** 3:.1f}GB")
+                handler = self._archive_chunk if self.archive_dir else self._delete_chunk
+                self._process_chunks(hot, handler, excess_bytes=excess)
+
+    def _process_chunks(self, queryset, handler, excess_bytes=None):
+        """
+        按 start_time 从旧到新分块处理
+
+        Args:
+            excess_bytes: 指定时只处理到累计 file_size 达到该值为止
+        """
+        queryset = queryset.order_by('start_time', 'id')
+        offset = 0
+        for _ in range(self.max_chunks):
+            # 处理过的记录会被删除或改为归档，下一块直接从头取；dry_run 时记录不变，需要按偏移量翻页
+            records = list(queryset.values('id', 'camera_ip', 'file_path', 'sub_file_path', 'file_size')[offset:offset + self.chunk_size])
+            if not records:
+                return
+            offset += len(records) if self.dry_run else 0
+            records = [record for record in records if record['id'] not in self._dry_run_handled]
+            if not records:
+                continue
+
+            if excess_bytes is not None:
+                selected = []
+                for record in records:
+                    selected.append(record)
+                    excess_bytes -= record['file_size'] or 0
+                    if excess_bytes <= 0:
+                        break
+                records = selected
+
+            handler(records)
+            if self.dry_run:
+                self._dry_run_handled.update((record['id'], record['file_size'] or 0) for record in records)
+            if excess_bytes is not None and excess_bytes <= 0:
+                return
+
+    def _delete_chunk(self, records):
+        """删除一块录像的文件和数据库记录（先删文件，避免记录删除后文件无人认领）"""
+        from apps.cameras.models import RecordLog, PersonDetection
+
+        ids = [record['id'] for record in records]
+        image_paths = []
+        for image_path, thumbnail_path in PersonDetection.objects.filter(
+            record_log_id__in=ids
+        ).values_list('image_path', 'thumbnail_path'):
+            image_paths.append(image_path)
+            if thumbnail_path:
+                image_paths.append(thumbnail_path)
+        self.stats['deleted_logs'] += len(ids)
+        self.stats['deleted_images'] += len(image_paths)
+        if self.dry_run:
+            self.stats['freed_bytes'] += sum(record['file_size'] or 0 for record in records)
+            return
+
+        # 小时合并后多条记录共用一个文件，块外还有记录引用的文件保留
+        paths = {p for record in records for p in (record['file_path'], record['sub_file_path']) if p}
+        shared_paths = set(
+            RecordLog.objects.filter(camera_ip__in={record['camera_ip'] for record in records}, file_path__in=paths)
+            .exclude(id__in=ids).values_list('file_path', flat=True)
+        )
+
+        directories = set()
+        for path in list(paths - shared_paths) + image_paths:
+            if path:
+                self.stats['freed_bytes'] += remove_file(path)
+                directories.add(os.path.dirname(path))
+
+        with transaction.atomic():
+            # PersonDetection 没有下级关联，级联删除时直接按 record_log_id 批量删除
+            RecordLog.objects.filter(id__in=ids).delete()
+
+        prune_empty_dirs([d for d in directories if d.startswith(self.base_dir)], self.base_dir)
+        prune_empty_dirs([d for d in directories if d.startswith(self.pics_base_dir)], self.pics_base_dir)
+        logger.info(f"已删除 {len(ids)} 条录像记录及 {len(image_paths)} 张截图")
+
+    def _archive_chunk(self, records):
+        """将一块录像移动到归档目录并更新记录（截图体积小，保留在原位置）"""
+        from apps.cameras.models import RecordLog
+
+        self.stats['archived_logs'] += len(records)
+        self.stats['archived_bytes'] += sum(record['file_size'] or 0 for record in records)
+        if self.dry_run:
+            return
+
+        updated = []
+        directories = set()
+        moved = {}  # 原路径 -> 归档路径（小时合并后同一文件只移动一次）
+        for record in records:
+            for path in (record['file_path'], record['sub_file_path']):
+                if path and path not in moved:
+                    moved[path] = self._move_to_archive(path)
+                    directories.add(os.path.dirname(path))
+            log = RecordLog(id=record['id'], storage_tier='archive')
+            log.file_path = moved.get(record['file_path'], record['file_path'])
+            log.sub_file_path = moved.get(record['sub_file_path'], record['sub_file_path'])
+            updated.append(log)
+
+        with transaction.atomic():
+            RecordLog.objects.bulk_update(updated, ['file_path', 'sub_file_path', 'storage_tier'])
+            # 块外共用同一个小时文件的记录一并指向归档路径
+            for old_path, new_path in moved.items():
+                if old_path != new_path:
+                    RecordLog.objects.filter(
+                        camera_ip__in={record['camera_ip'] for record in records}, file_path=old_path,
+                    ).update(file_path=new_path, storage_tier='archive')
+
+        prune_empty_dirs([d for d in directories if d.startswith(self.base_dir)], self.base_dir)
+        logger.info(f"已归档 {len(records)} 条录像")
+
+    def _move_to_archive(self, path):
+        """移动单个文件到归档目录，返回新路径（文件不存在或不在录像目录下时返回原路径）"""
+        if not path or not path.startswith(self.base_dir + os.sep):
+            return path
+        target = os.path.join(self.archive_dir, os.path.relpath(path, self.base_dir))
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # 归档目录通常在另一块磁盘上，shutil.move 会退化为复制后删除
+            shutil.move(path, target)
+        except FileNotFoundError:
+            logger.warning(f"归档时文件不存在: {path}")
+            return path
+        return target
@@ -0,0 +1,124 @@
+"""
+摄像头检测区域（ROI）
+
+Camera.roi_polygon 保存归一化坐标（0-1）的多边形，与分辨率无关，主码流、子码流和缩放后的帧共用。
+检测时只把多边形的外接矩形裁剪出来送入模型，推理面积更小；检测框换算回整帧坐标后，
+脚部（边界框底边中点）不在多边形内的丢弃，避免天空、墙面、邻居院子里的误检进入截图和 BLIP2 描述。
+
+多边形按摄像头 IP 缓存在 worker 进程内，ROI_CACHE_TTL 秒（默认 300）后重新读取数据库。
+"""
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 摄像头IP -> (过期时间, RegionOfInterest 或 None)
+_roi_cache = {}
+_roi_cache_lock = threading.Lock()
+
+
+def validate_polygon(polygon):
+    """
+    校验归一化多边形
+
+    Raises:
+        ValueError: 顶点少于 3 个、格式不对或坐标超出 0-1
+    """
+    if not isinstance(polygon, list) or len(polygon) < 3:
+        raise ValueError("检测区域至少需要 3 个顶点")
+    for point in polygon:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise ValueError(f"顶点格式应为 [x, y]: {point}")
+        if not all(isinstance(value, (int, float)) and 0 <= value <= 1 for value in point):
+            raise ValueError(f"顶点坐标应在 0-1 之间: {point}")
+
+
+def point_in_polygon(x, y, polygon):
+    """射线法判断点是否在多边形内（边界上的点视为在内）"""
+    inside = False
+    count = len(polygon)
+    for i in range(count):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % count]
+        # 点在边上
+        if min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2) \
+                and (x2 - x1) * (y - y1) == (y2 - y1) * (x - x1):
+            return True
+        if (y1 > y) != (y2 > y):
+            cross_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            if x < cross_x:
+                inside = not inside
+    return inside
+
+
+class RegionOfInterest:
+    """
+    归一化多边形检测区域
+
+    Args:
+        polygon: [[x, y], ...]，坐标为画面宽高的比例
+    """
+
+    def __init__(self, polygon):
+        validate_polygon(polygon)
+        self.polygon = [(float(x), float(y)) for x, y in polygon]
+        xs = [x for x, _ in self.polygon]
+        ys = [y for _, y in self.polygon]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        self._rects = {}    # (宽, 高) -> 像素外接矩形
+
+    def crop_rect(self, width, height):
+        """多边形在 width x height 画面中的像素外接矩形 (x1, y1, x2, y2)"""
+        rect = self._rects.get((width, height))
+        if rect is None:
+            x1, y1, x2, y2 = self.bounds
+            rect = (
+                int(x1 * width), int(y1 * height),
+                max(int(round(x2 * width)), int(x1 * width) + 1),
+                max(int(round(y2 * height)), int(y1 * height) + 1),
+            )
+            self._rects[(width, height)] = rect
+        return rect
+
+    def crop(self, frame):
+        """裁剪出外接矩形（numpy 切片，不复制）"""
+        x1, y1, x2, y2 = self.crop_rect(frame.shape[1], frame.shape[0])
+        return frame[y1:y2, x1:x2]
+
+    def to_frame_bbox(self, bbox, width, height):
+        """将裁剪画面中的边界框换算回整帧坐标"""
+        x1, y1, _, _ = self.crop_rect(width, height)
+        return [bbox[0] + x1, bbox[1] + y1, bbox[2] + x1, bbox[3] + y1]
+
+    def contains_bbox(self, bbox, width, height):
+        """整帧坐标的边界框脚部（底边中点）是否在多边形内"""
+        foot_x = (bbox[0] + bbox[2]) / 2 / width
+        foot_y = bbox[3] / height
+        return point_in_polygon(foot_x, foot_y, self.polygon)
+
+
+def get_camera_roi(camera_ip):
+    """
+    摄像头的检测区域，未配置时返回 None（进程内缓存 ROI_CACHE_TTL 秒）
+    """
+    from apps.cameras.models import Camera
+
+    now = time.monotonic()
+    with _roi_cache_lock:
+        cached = _roi_cache.get(camera_ip)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    polygon = Camera.objects.filter(ip=camera_ip).values_list('roi_polygon', flat=True).first()
+    roi = None
+    if polygon:
+        try:
+            roi = RegionOfInterest(polygon)
+        except ValueError as e:
+            logger.warning(f"{camera_ip} 检测区域配置无效，检测整个画面: {e}")
+
+    with _roi_cache_lock:
+        _roi_cache[camera_ip] = (now + int(os.getenv('ROI_CACHE_TTL', '300')), roi)
+    return roi
@@ -0,0 +1,75 @@
+"""
+检测采样策略
+
+- fixed: 每 DETECTION_SAMPLE_INTERVAL 秒采样一帧（原有方式）
+- adaptive: 每 coarse 秒扫描一帧，扫描帧代表以它为中心、长 coarse 秒的区间；
+  扫描帧检测到人物，或区间内运动指数达到 DETECTION_REFINE_MOTION 时，
+  区间内再按 DETECTION_SAMPLE_INTERVAL 加密采样，从更多帧中选出最佳截图。
+  画面空闲时推理帧数约为固定间隔的 sample_interval / coarse。
+
+策略按摄像头配置（Camera.sampling_mode / coarse_sample_interval），留空使用
+DETECTION_SAMPLING_MODE（默认 fixed）和 DETECTION_COARSE_INTERVAL（默认 4 秒）。
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES = ('fixed', 'adaptive')
+
+
+class SamplingPolicy:
+    """
+    采样策略
+
+    Args:
+        mode: fixed 或 adaptive
+        coarse_interval: 自适应采样的扫描间隔（秒）
+        refine_motion: 区间内运动指数达到该值时加密，0 表示只在检测到人物时加密
+    """
+
+    def __init__(self, mode='fixed', coarse_interval=None, refine_motion=None):
+        self.mode = mode
+        self.coarse_interval = coarse_interval or float(os.getenv('DETECTION_COARSE_INTERVAL', '4'))
+        self.refine_motion = (
+            refine_motion if refine_motion is not None else int(os.getenv('DETECTION_REFINE_MOTION', '10'))
+        )
+
+    @property
+    def adaptive(self):
+        return self.mode == 'adaptive'
+
+    def __str__(self):
+        if not self.adaptive:
+            return '固定间隔'
+        return f"自适应（扫描间隔 {self.coarse_interval:g}s，运动加密阈值 {self.refine_motion}）"
+
+
+def get_sampling_policy(camera_ip):
+    """摄像头的采样策略，未单独配置的项使用环境变量默认值"""
+    from apps.cameras.models import Camera
+
+    mode, coarse_interval = Camera.objects.filter(ip=camera_ip).values_list(
+        'sampling_mode', 'coarse_sample_interval'
+    ).first() or ('', None)
+    mode = mode or os.getenv('DETECTION_SAMPLING_MODE', 'fixed')
+    if mode not in SAMPLING_MODES:
+        logger.warning(f"未知的采样策略 {mode}，使用固定间隔，可选: {', '.join(SAMPLING_MODES)}")
+        mode = 'fixed'
+    return SamplingPolicy(mode, coarse_interval)
+
+
+def refine_window(frame_number, coarse_frames, fine_frames, limit=None):
+    """
+    扫描帧所代表区间 [frame_number - coarse/2, frame_number + coarse/2) 内的加密采样帧（不含扫描帧本身）
+
+    扫描帧位于 coarse_frames 的整数倍上时，相邻扫描帧的区间首尾相接、互不重叠，
+    加密帧按时间顺序插在相邻扫描帧之间。
+    """
+    half = coarse_frames // 2
+    start = max(frame_number - half, 0)
+    start = -(-start // fine_frames) * fine_frames     # 对齐到加密采样网格
+    end = frame_number + coarse_frames - half
+    if limit is not None:
+        end = min(end, limit)
+    return [number for number in range(start, end, fine_frames) if number != frame_number]
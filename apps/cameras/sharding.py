@@ -0,0 +1,57 @@
+"""
+摄像头录制分片：一致性哈希
+
+摄像头按 IP 映射到哈希环上，顺时针找到的第一个节点负责录制该摄像头。
+节点加入或离开时只有相邻区间的摄像头需要迁移，其余摄像头保持在原节点。
+"""
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    一致性哈希环
+
+    Args:
+        nodes: 节点名称列表（录制节点名或 Celery 队列名）
+        replicas: 每个节点的虚拟节点数，越大分布越均匀
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._ring = []
+        for node in set(nodes):
+            for i in range(replicas):
+                self._ring.append((_hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._keys = [h for h, _ in self._ring]
+
+    def __bool__(self):
+        return bool(self._ring)
+
+    def get_node(self, key):
+        """返回负责 key 的节点，环为空时返回 None"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._ring[index][1]
+
+
+def assign_cameras(camera_ips, nodes):
+    """
+    将摄像头分配到节点
+
+    Returns:
+        dict: {节点名: [摄像头IP, ...]}
+    """
+    ring = HashRing(nodes)
+    assignment = {node: [] for node in nodes}
+    for ip in camera_ips:
+        node = ring.get_node(ip)
+        if node is not None:
+            assignment[node].append(ip)
+    return assignment
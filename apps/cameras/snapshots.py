@@ -0,0 +1,150 @@
+"""
+检测截图异步编码写入
+
+cv2.imwrite 编码一张 1080p/4K 截图需要几十毫秒，逐张同步写入会拖慢分析。
+SnapshotWriter 把编码和写文件交给进程内共享的线程池（SNAPSHOT_WRITER_THREADS 个线程，
+OpenCV 编码时释放 GIL），每个录像最多 SNAPSHOT_MAX_PENDING 张在途，超过时提交方等待最早的一张完成；
+录像检测完成前 drain() 等待全部写完。
+
+    SNAPSHOT_FORMAT          jpg（默认）或 webp
+    SNAPSHOT_QUALITY         编码质量 1-100，默认 95
+    SNAPSHOT_MAX_WIDTH       截图最大宽度，超过时等比缩小，0 表示保持原始分辨率
+    SNAPSHOT_THUMBNAIL_WIDTH 同时写入的缩略图宽度，默认 320，0 表示不生成缩略图
+"""
+import os
+import time
+import threading
+import logging
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMATS = ('jpg', 'webp')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_snapshot_executor():
+    """进程内共享的截图编码线程池（首次使用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('SNAPSHOT_WRITER_THREADS', '2')),
+                thread_name_prefix='snapshot-writer',
+            )
+        return _executor
+
+
+def resize_to_width(image, max_width):
+    """宽度超过 max_width 时等比缩小（max_width 为 0 时不缩放）"""
+    import cv2  # 延迟导入
+
+    height, width = image.shape[:2]
+    if not max_width or width <= max_width:
+        return image
+    return cv2.resize(image, (max_width, max(int(height * max_width / width), 1)), interpolation=cv2.INTER_AREA)
+
+
+class SnapshotWriter:
+    """
+    一个录像的截图写入器
+
+    用法：paths() 得到截图和缩略图路径，scale() 得到截图相对原帧的缩放比例（用于换算边界框），
+    submit() 提交编码，drain() 等待全部写完并返回统计。
+    """
+
+    def __init__(self):
+        self.format = os.getenv('SNAPSHOT_FORMAT', 'jpg').lower()
+        if self.format not in SNAPSHOT_FORMATS:
+            logger.warning(f"未知的截图格式 {self.format}，使用 jpg，可选: {', '.join(SNAPSHOT_FORMATS)}")
+            self.format = 'jpg'
+        self.quality = int(os.getenv('SNAPSHOT_QUALITY', '95'))
+        self.max_width = int(os.getenv('SNAPSHOT_MAX_WIDTH', '0'))
+        self.thumbnail_width = int(os.getenv('SNAPSHOT_THUMBNAIL_WIDTH', '320'))
+        self.max_pending = max(int(os.getenv('SNAPSHOT_MAX_PENDING', '8')), 1)
+        self.stats = Counter()
+        self._pending = deque()
+
+    def paths(self, base_path):
+        """
+        截图和缩略图路径
+
+        Args:
+            base_path: 不含扩展名的截图路径
+
+        Returns:
+            tuple: (截图路径, 缩略图路径)，不生成缩略图时缩略图路径为空字符串
+        """
+        image_path = f"{base_path}.{self.format}"
+        thumbnail_path = f"{base_path}_thumb.{self.format}" if self.thumbnail_width else ''
+        return image_path, thumbnail_path
+
+    def scale(self, frame):
+        """截图相对原帧的缩放比例"""
+        width = frame.shape[1]
+        if not self.max_width or width <= self.max_width:
+            return 1.0
+        return self.max_width / width
+
+    def submit(self, frame, image_path, thumbnail_path=''):
+        """提交一张截图（frame 提交后不能再修改）"""
+        while len(self._pending) >= self.max_pending:
+            self._collect(self._pending.popleft())
+        self._pending.append(get_snapshot_executor().submit(self._encode, frame, image_path, thumbnail_path))
+
+    def drain(self):
+        """
+        等待已提交的截图全部写完
+
+        Returns:
+            Counter: images/thumbnails/bytes/encode_seconds
+
+        Raises:
+            Exception: 第一张写入失败的截图的异常（其余截图仍会等待写完）
+        """
+        error = None
+        while self._pending:
+            try:
+                self._collect(self._pending.popleft())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return self.stats
+
+    def summary(self):
+        """截图写入统计文本"""
+        return (
+            f"截图 {self.stats['images']} 张、缩略图 {self.stats['thumbnails']} 张，"
+            f"编码写入 {self.stats['encode_seconds']:.2f}s，共 {self.stats['bytes'] / 1024 / 1024:.1f}MB"
+            f"（{self.format}，质量 {self.quality}）"
+        )
+
+    def _collect(self, future):
+        elapsed, written, thumbnails = future.result()
+        self.stats['images'] += 1
+        self.stats['thumbnails'] += thumbnails
+        self.stats['bytes'] += written
+        self.stats['encode_seconds'] += elapsed
+
+    def _encode(self, frame, image_path, thumbnail_path):
+        """在线程池中执行：返回 (耗时, 写入字节数, 缩略图数)"""
+        started = time.perf_counter()
+        written = self._write(image_path, resize_to_width(frame, self.max_width))
+        if thumbnail_path:
+            written += self._write(thumbnail_path, resize_to_width(frame, self.thumbnail_width))
+        return time.perf_counter() - started, written, 1 if thumbnail_path else 0
+
+    def _write(self, path, image):
+        import cv2  # 延迟导入
+
+        quality_flag = cv2.IMWRITE_WEBP_QUALITY if self.format == 'webp' else cv2.IMWRITE_JPEG_QUALITY
+        ok, buffer = cv2.imencode(f'.{self.format}', image, [quality_flag, self.quality])
+        if not ok:
+            raise OSError(f"截图编码失败: {path}")
+        with open(path, 'wb') as f:
+            f.write(buffer.tobytes())
+        return buffer.size
@@ -1,7 +1,9 @@
 # app/tasks.py
 from celery import shared_task
 from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_process_init
 import subprocess
+import time
 from datetime import datetime
 import os
 import pytz
@@ -9,12 +11,36 @@ import logging
 from django.utils import timezone
 from pathlib import Path
 
+from apps.cameras.motion import build_motion_args, is_motion_index_enabled, motion_index_from_file
+from apps.cameras.probe import probe_keyframes
+from apps.cameras.recorder import (
+    ERROR_TOLERANCE_ARGS, RECORD_MODE_COPY, RECORD_MODE_FALLBACK, RECORD_MODE_TRANSCODE,
+    build_codec_args, build_rtsp_url, mark_copy_fallback, resolve_record_mode, run_recording,
+)
+
 # 注意：torch, cv2, YOLO 等重型依赖移到函数内部延迟导入
 # 避免 celery worker 启动时就加载这些模块占用大量内存
 
 logger = logging.getLogger(__name__)
 
 
+@worker_process_init.connect
+def preload_yolo_model(**kwargs):
+    """
+    worker 子进程启动时预加载 YOLO 模型（YOLO_PRELOAD=True 时）
+
+    只需在分析 worker 上开启，录制 worker 不需要加载模型
+    """
+    if os.getenv('YOLO_PRELOAD', 'False').lower() not in ('true', '1', 't'):
+        return
+    from apps.cameras.detection import get_yolo_model
+
+    try:
+        get_yolo_model()
+    except Exception as e:
+        logger.error(f"预加载 YOLO 模型失败，将在首个任务中加载: {e}", exc_info=True)
+
+
 def get_gpu_stats():
     """获取 GPU 利用率和显存使用情况"""
     import torch  # 延迟导入
@@ -105,7 +131,20 @@ def log_gpu_stats(prefix="", task_type="idle", worker_name=None):
 
 
 @shared_task(bind=True, max_retries=3, time_limit=120, soft_time_limit=90)
-def record_camera_task(self, ip, user, password, port, path, base_dir=None):
+def record_camera_task(self, ip, user, password, port, path, base_dir=None, record_mode=RECORD_MODE_TRANSCODE,
+                       sub_path=None):
+    """
+    录制摄像头 60 秒视频
+
+    Args:
+        record_mode: copy 直接复制码流；transcode 重新编码为 H.264。
+                     copy 模式检测到 HEVC NAL 错误时回退为转码
+        sub_path: 子码流路径（如 Streaming/Channels/102），指定时同一个 ffmpeg 进程
+                  同时录制子码流到 MM.sub.mp4，供人物检测使用
+
+    copy 模式回退转码时，已录制的部分保留在 MM.mp4，剩余时间录制到 MM_SS.mp4（SS 为回退时的秒数），
+    两个文件各有一条 RecordLog。
+    """
     # 导入模型（避免循环导入）
     from apps.cameras.models import RecordLog
 
@@ -118,9 +157,18 @@ def record_camera_task(self, ip, user, password, port, path, base_dir=None):
 
     output_dir = os.path.join(base_dir, ip, now.strftime("%Y/%m/%d/%H"))
     os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, f"{minute}.mp4")
 
-    rtsp_url = f"rtsp://{user}:{password}@{ip}:{port}/{path}"
+    def outputs(name):
+        """(主码流文件, 子码流文件, 运动检测灰度帧文件)；灰度帧在录制结束后计算运动指数并删除"""
+        return (
+            os.path.join(output_dir, f"{name}.mp4"),
+            os.path.join(output_dir, f"{name}.sub.mp4") if sub_path else None,
+            os.path.join(output_dir, f"{name}.motion.gray") if is_motion_index_enabled() else None,
+        )
+
+    output_file, sub_output_file, motion_file = outputs(minute)
+
+    rtsp_url = build_rtsp_url(ip, user, password, port, path)
 
     # 创建日志记录
     log = RecordLog.objects.create(
@@ -130,36 +178,99 @@ def record_camera_task(self, ip, user, password, port, path, base_dir=None):
         file_path=output_file,
     )
 
-    try:
-        # 添加超时保护：ffmpeg录制60秒，但给它75秒的超时时间
-        # 重新编码以避免 HEVC NAL 单元错误，使用更稳定的 H.264 编码
-        subprocess.run([
+    def build_command(mode, duration, output_file, sub_output_file, motion_file):
+        cmd = [
             "ffmpeg",
             "-loglevel", "error",
             "-rtsp_transport", "tcp",
             "-i", rtsp_url,
-            # 编码参数：重新编码为 H.264，避免原始流的编码问题
-            "-c:v", "libx264",           # 使用 H.264 编码器
-            "-preset", "ultrafast",       # 快速编码
-            "-crf", "23",                 # 质量控制（18-28，越小质量越好）
-            "-r", "25",                   # 固定帧率为 25fps
+        ]
+        if sub_path:
+            cmd += ["-rtsp_transport", "tcp", "-i", build_rtsp_url(ip, user, password, port, sub_path)]
+        cmd += [
+            "-map", "0:v",
+            # 编码参数：copy 直接复制码流，否则重新编码为 H.264 避免原始流的编码问题
+            *build_codec_args(mode),
             "-an",                        # 禁用音频
-            "-t", "60",                   # 录制 60 秒
-            # 错误处理参数
-            "-err_detect", "ignore_err",  # 忽略非致命错误
-            "-fflags", "+genpts",         # 生成时间戳
+            "-t", str(duration),          # 录制时长
+            *ERROR_TOLERANCE_ARGS,
             "-y", output_file
-        ], check=True, timeout=75)
-
-        # 录制成功，更新日志
+        ]
+        if sub_path:
+            # 子码流分辨率低，直接复制即可，不占用 CPU
+            cmd += [
+                "-map", "1:v",
+                "-c:v", "copy",
+                "-an",
+                "-t", str(duration),
+                *ERROR_TOLERANCE_ARGS,
+                "-y", sub_output_file
+            ]
+        if motion_file:
+            # 有子码流时在子码流上计算，解码量更小
+            cmd += ["-t", str(duration), *build_motion_args(motion_file, stream="1:v" if sub_path else "0:v")]
+        return cmd
+
+    def finish(log, mode, output_file, sub_output_file, motion_file):
+        """录制成功，更新日志"""
         log.status = 'success'
+        log.record_mode = mode
         log.end_time = timezone.now()
         if os.path.exists(output_file):
             log.file_size = os.path.getsize(output_file)
+            try:
+                log.keyframe_index = probe_keyframes(output_file)
+            except Exception as e:
+                logger.warning(f"{ip} 关键帧索引生成失败: {e}")
+        if sub_output_file and os.path.exists(sub_output_file):
+            log.sub_file_path = sub_output_file
+        if motion_file and os.path.exists(motion_file):
+            try:
+                log.motion_index = motion_index_from_file(motion_file)
+            except Exception as e:
+                logger.warning(f"{ip} 运动指数计算失败: {e}")
+            finally:
+                os.remove(motion_file)
         log.save()
 
-        # 触发视频分析任务（异步执行）
-        analyze_video_for_person.delay(log.id)
+    try:
+        mode = resolve_record_mode(base_dir, ip, record_mode)
+        started = time.monotonic()
+
+        # 添加超时保护：ffmpeg录制60秒，但给它75秒的超时时间
+        cmd = build_command(mode, 60, output_file, sub_output_file, motion_file)
+        returncode, nal_error = run_recording(cmd, timeout=75, stop_on_nal_error=(mode == RECORD_MODE_COPY))
+
+        if nal_error:
+            # 原始 HEVC 码流有问题，本分钟剩余时间改用 H.264 转码录制到 MM_SS.mp4，
+            # 已直接复制的部分（ffmpeg 收到 SIGINT 后正常写完）保留在 MM.mp4
+            logger.warning(f"{ip} 直接复制时检测到 HEVC NAL 错误，回退为 H.264 转码: {nal_error}")
+            mark_copy_fallback(base_dir, ip)
+            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                finish(log, mode, output_file, sub_output_file, motion_file)
+                queue_person_analysis([log.id])
+            else:
+                # 回退前没有录到内容
+                log.delete()
+            mode = RECORD_MODE_FALLBACK
+            output_file, sub_output_file, motion_file = outputs(f"{minute}_{datetime.now(tz).strftime('%S')}")
+            log = RecordLog.objects.create(
+                camera_ip=ip,
+                camera_user=user,
+                task_id=self.request.id,
+                file_path=output_file,
+            )
+            remaining = max(int(60 - (time.monotonic() - started)), 1)
+            cmd = build_command(mode, remaining, output_file, sub_output_file, motion_file)
+            returncode, _ = run_recording(cmd, timeout=remaining + 15)
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+
+        finish(log, mode, output_file, sub_output_file, motion_file)
+
+        # 触发视频分析（异步执行）
+        queue_person_analysis([log.id])
 
         return f"{ip} 录制成功: {output_file}"
 
@@ -197,6 +308,77 @@ def record_camera_task(self, ip, user, password, port, path, base_dir=None):
         return f"{ip} 录制失败: {str(e)}"
 
 
+def queue_person_analysis(record_log_ids):
+    """
+    提交人物检测
+
+    DETECTION_MODE=task 时为每个录像投递 analyze_video_for_person 任务；
+    DETECTION_MODE=service 时只把检测状态置为待检测，由检测服务领取。
+    """
+    from django.conf import settings
+    from apps.cameras.models import RecordLog
+
+    if settings.DETECTION_MODE == 'service':
+        RecordLog.objects.filter(id__in=record_log_ids).exclude(
+            analysis_status__in=('pending', 'processing')
+        ).update(analysis_status='pending')
+        return
+    for record_log_id in record_log_ids:
+        analyze_video_for_person.delay(record_log_id)
+
+
+def get_record_queues(app):
+    """
+    查询在线 worker 监听的录制队列（以 RECORD_QUEUE_PREFIX 开头）
+
+    Returns:
+        list: 队列名列表，没有在线的录制队列时为空
+    """
+    from django.conf import settings
+
+    try:
+        active_queues = app.control.inspect(timeout=1).active_queues() or {}
+    except Exception as e:
+        logger.warning(f"查询在线 worker 队列失败: {e}")
+        return []
+
+    return sorted({
+        queue['name']
+        for queues in active_queues.values()
+        for queue in queues
+        if queue['name'].startswith(settings.RECORD_QUEUE_PREFIX)
+    })
+
+
+@shared_task(bind=True)
+def dispatch_camera_recordings(self):
+    """
+    为所有启用的摄像头投递本分钟的录制任务（由 Celery Beat 每分钟触发）
+
+    录制任务按摄像头 IP 一致性哈希到在线的录制队列，worker 上下线后下一分钟自动重新分配；
+    没有录制队列时投递到默认队列
+    """
+    from apps.cameras.models import Camera
+    from apps.cameras.sharding import HashRing
+
+    queues = get_record_queues(self.app)
+    ring = HashRing(queues)
+    dispatched = 0
+
+    for camera in Camera.objects.filter(enabled=True):
+        queue = ring.get_node(camera.ip) or 'celery'
+        record_camera_task.apply_async(
+            args=(camera.ip, camera.username, camera.get_password(), camera.port, camera.stream_path),
+            kwargs={'record_mode': camera.record_mode, 'sub_path': camera.sub_stream_path or None},
+            queue=queue,
+            expires=50,  # 过期的录制任务没有意义，避免积压后集中执行
+        )
+        dispatched += 1
+
+    logger.info(f"已投递 {dispatched} 个录制任务，录制队列: {queues or ['celery']}")
+    return f"已投递 {dispatched} 个录制任务"
+
+
 @shared_task(
     bind=True,
     max_retries=3,
@@ -206,207 +388,66 @@ def record_camera_task(self, ip, user, password, port, path, base_dir=None):
     retry_backoff_max=600,
     retry_jitter=True
 )
-def analyze_video_for_person(self, record_log_id):
+def analyze_video_for_person(self, record_log_id, refresh_cache=False):
     """
     分析视频中的人物并保存截图
 
+    检测流程见 apps.cameras.analysis.VideoAnalysis；解码、推理、写入三个阶段由 AnalysisPipeline 并行执行。
+
     Args:
         record_log_id: RecordLog 的 ID
+        refresh_cache: 不使用检测缓存，全部重新推理
     """
-    from apps.cameras.models import RecordLog, PersonDetection
-    import gc
-    import cv2  # 延迟导入
-    import torch  # 延迟导入
-    from ultralytics import YOLO  # 延迟导入
+    from apps.cameras.models import RecordLog
+    from apps.cameras.analysis import AnalysisSkipped, VideoAnalysis
+    from apps.cameras.cascade import CascadeModel, get_cascade_model
+    from apps.cameras.detection import evict_if_memory_pressure, get_backend, get_device, get_yolo_model
+    from apps.cameras.pipeline import AnalysisPipeline
 
-    model = None
-    cap = None
+    analysis = None
 
     try:
         # 获取录制日志
         log = RecordLog.objects.get(id=record_log_id)
 
-        # 标记为检测中
-        log.analysis_status = 'processing'
-        log.save(update_fields=['analysis_status'])
-
-        if not log.file_path or not os.path.exists(log.file_path):
-            logger.error(f"视频文件不存在: {log.file_path}")
-            log.analysis_status = 'failed'
-            log.save(update_fields=['analysis_status'])
-            return f"视频文件不存在"
+        analysis = VideoAnalysis(log, refresh_cache=refresh_cache)
+        try:
+            analysis.open()
+        except AnalysisSkipped as e:
+            return str(e)
 
-        # 获取配置
-        pics_base_dir = os.getenv('PICS_BASE_DIR', '/workspace/ai_project_data/camera_env/server_sync/ResouceData/CameraWarningPics')
         model_path = os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')
-        sample_interval = int(os.getenv('DETECTION_SAMPLE_INTERVAL', '1'))
-        confidence_threshold = float(os.getenv('DETECTION_CONFIDENCE_THRESHOLD', '0.5'))
-        dedup_window = int(os.getenv('DETECTION_DEDUP_WINDOW', '10'))
         batch_size = int(os.getenv('DETECTION_BATCH_SIZE', '8'))  # 减小批处理大小
         use_gpu = os.getenv('USE_GPU', 'True').lower() in ('true', '1', 't')
 
-        logger.info(f"开始分析视频: {log.file_path}")
-        logger.info(f"配置: 采样间隔={sample_interval}s, 置信度={confidence_threshold}, 去重窗口={dedup_window}s, GPU={use_gpu}")
-
         # 打印初始 GPU 状态
         log_gpu_stats("【任务开始】", task_type="yolo", worker_name=self.request.hostname)
 
-        # 清理 GPU 缓存
-        if use_gpu and torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            gc.collect()
-
-        # 加载 YOLO 模型
-        device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
-
-        # 使用上下文管理器确保资源释放
-        model = YOLO(model_path)
-
-        if device == 'cuda':
-            # 设置 CUDA 环境变量避免多进程冲突
-            os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
-            model.to(device)
-        else:
-            model.to(device)
+        # 获取 YOLO 模型（worker 进程内缓存，只在首次使用时从磁盘加载）
+        backend = get_backend()
+        device = get_device(use_gpu) if backend == 'torch' else 'cpu'
+        model = get_yolo_model(model_path, device, backend=backend)
+        # 开启 DETECTION_CASCADE 时先低分辨率推理，只有不确定的帧升级
+        model = get_cascade_model(model, device, backend)
 
-        logger.info(f"YOLO 模型加载完成，使用设备: {device}")
+        logger.info(f"YOLO 模型就绪，推理后端: {backend}，使用设备: {device}")
         log_gpu_stats("【模型加载后】", task_type="yolo", worker_name=self.request.hostname)
 
-        # 打开视频并验证
-        cap = cv2.VideoCapture(log.file_path)
-
-        # 验证视频是否成功打开
-        if not cap.isOpened():
-            error_msg = f"无法打开视频文件: {log.file_path}"
-            logger.error(error_msg)
-            log.analysis_status = 'failed'
-            log.save(update_fields=['analysis_status'])
-            return error_msg
-
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        # 验证视频属性有效性
-        if fps <= 0 or total_frames <= 0:
-            error_msg = f"视频文件损坏或格式错误: FPS={fps}, 帧数={total_frames}"
-            logger.error(error_msg)
-            cap.release()
-            log.analysis_status = 'failed'
-            log.save(update_fields=['analysis_status'])
-            return error_msg
-
-        duration = total_frames / fps
-
-        logger.info(f"视频信息: FPS={fps}, 总帧数={total_frames}, 时长={duration:.1f}秒")
-
-        # 尝试读取第一帧以验证解码能力
-        test_ret, test_frame = cap.read()
-        if not test_ret or test_frame is None:
-            error_msg = f"无法解码视频帧，视频可能损坏"
-            logger.error(error_msg)
-            cap.release()
-            log.analysis_status = 'failed'
-            log.save(update_fields=['analysis_status'])
-            return error_msg
-
-        # 重置到开头
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        logger.info(f"视频验证通过，开始分析...")
-
-        # 创建输出目录
-        video_filename = os.path.basename(log.file_path).replace('.mp4', '')
-        # 从视频路径提取日期信息
-        video_dir = os.path.dirname(log.file_path)
-        # 例如: /path/to/192.168.0.201/2025/11/18/20/02.mp4
-        path_parts = video_dir.split(os.sep)
-        camera_ip = log.camera_ip
-
-        # 查找年月日时的位置
-        year, month, day, hour = None, None, None, None
-        for i, part in enumerate(path_parts):
-            if part == camera_ip and i + 4 < len(path_parts):
-                year = path_parts[i + 1]
-                month = path_parts[i + 2]
-                day = path_parts[i + 3]
-                hour = path_parts[i + 4]
-                break
-
-        if year and month and day and hour:
-            output_dir = os.path.join(pics_base_dir, camera_ip, year, month, day, hour)
-        else:
-            # 备用方案：使用当前时间
-            now = datetime.now()
-            output_dir = os.path.join(pics_base_dir, camera_ip, now.strftime("%Y/%m/%d/%H"))
-
-        os.makedirs(output_dir, exist_ok=True)
-        logger.info(f"输出目录: {output_dir}")
-
-        # 采样帧并批量检测
-        frames_to_process = []
-        frame_info = []  # 存储 (frame_number, timestamp)
-
-        frame_interval = int(fps * sample_interval) if fps > 0 else 30
-        current_frame = 0
-        detection_count = 0
-        last_detection_time = -dedup_window  # 上次检测到人物的时间
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                # 视频读取结束（正常到达末尾或文件损坏）
-                logger.info(f"视频读取结束，已处理 {current_frame}/{total_frames} 帧")
-                break
-
-            # 验证帧有效性
-            if frame is None or frame.size == 0:
-                logger.warning(f"帧 {current_frame} 无效（空帧），跳过")
-                current_frame += 1
-                continue
-
-            # 按间隔采样
-            if current_frame % frame_interval == 0:
-                timestamp = current_frame / fps if fps > 0 else 0
-                frames_to_process.append(frame)
-                frame_info.append((current_frame, timestamp))
-
-                # 批量处理
-                if len(frames_to_process) >= batch_size:
-                    result = process_batch(
-                        model, frames_to_process, frame_info, log, output_dir,
-                        video_filename, confidence_threshold, dedup_window,
-                        last_detection_time
-                    )
-                    detection_count += result['count']
-                    if result['last_time'] is not None:
-                        last_detection_time = result['last_time']
-                    frames_to_process = []
-                    frame_info = []
-
-            current_frame += 1
-
-        # 处理剩余的帧
-        if frames_to_process:
-            result = process_batch(
-                model, frames_to_process, frame_info, log, output_dir,
-                video_filename, confidence_threshold, dedup_window,
-                last_detection_time
-            )
-            detection_count += result['count']
-            if result['last_time'] is not None:
-                last_detection_time = result['last_time']
-
-        cap.release()
+        # 解码、推理、写入三个阶段并行
+        pipeline = AnalysisPipeline(batch_size)
+        pipeline.run(analysis.sample_frames(), lambda batch: analysis.detect(model, batch), analysis.save)
+        analysis.flush_tracks()
+        analysis.release()
 
         # 标记为检测完成
-        log.analysis_status = 'completed'
-        log.analysis_time = timezone.now()
-        log.save(update_fields=['analysis_status', 'analysis_time'])
+        analysis.complete()
 
         # 打印最终 GPU 状态
         log_gpu_stats("【分析完成】", task_type="yolo", worker_name=self.request.hostname)
-
-        logger.info(f"视频分析完成: {log.file_path}, 检测到 {detection_count} 个人物")
-        return f"分析完成，检测到 {detection_count} 个人物"
+        logger.info(f"流水线耗时: {pipeline.summary()}")
+        if isinstance(model, CascadeModel):
+            logger.info(model.summary())
+        return f"分析完成，检测到 {analysis.stats['detections']} 个人物，推理 {analysis.stats['inferred_frames']} 帧"
 
     except RecordLog.DoesNotExist:
         logger.error(f"RecordLog {record_log_id} 不存在")
@@ -425,96 +466,17 @@ def analyze_video_for_person(self, record_log_id):
 
     finally:
         # 清理资源
-        if cap is not None:
-            try:
-                cap.release()
-            except:
-                pass
-
-        if model is not None:
-            try:
-                del model
-            except:
-                pass
-
-        # 清理 GPU 缓存
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+        if analysis is not None:
+            analysis.release()
 
-        gc.collect()
+        # 模型保留在进程缓存中供下一个任务复用，只在显存紧张时淘汰
+        try:
+            evict_if_memory_pressure()
+        except Exception as e:
+            logger.warning(f"检查显存占用失败: {e}")
         logger.info(f"资源已清理")
 
 
-def process_batch(model, frames, frame_info, log, output_dir, video_filename,
-                  confidence_threshold, dedup_window, last_detection_time):
-    """
-    批量处理帧并保存检测结果
-
-    Args:
-        last_detection_time: 上一次保存检测的时间戳，用于去重判断
-
-    Returns:
-        dict: {'count': 检测数量, 'last_time': 最后检测时间}
-    """
-    import cv2  # 延迟导入
-    from apps.cameras.models import PersonDetection
-
-    detection_count = 0
-    last_time = last_detection_time
-
-    # 批量推理
-    results = model(frames, verbose=False)
-
-    for i, (result, (frame_number, timestamp)) in enumerate(zip(results, frame_info)):
-        # 检查是否检测到人物 (class 0 = person in COCO dataset)
-        person_detections = []
-
-        for box in result.boxes:
-            if int(box.cls[0]) == 0:  # person class
-                confidence = float(box.conf[0])
-                if confidence >= confidence_threshold:
-                    person_detections.append({
-                        'confidence': confidence,
-                        'bbox': box.xyxy[0].cpu().numpy().tolist()
-                    })
-
-        # 如果检测到人物
-        if person_detections:
-            time_since_last = timestamp - last_time
-
-            # 去重：检查时间窗口
-            # 只有当距离上次检测 >= dedup_window 时才保存
-            if time_since_last >= dedup_window:
-                # 保存最高置信度的检测
-                best_detection = max(person_detections, key=lambda x: x['confidence'])
-
-                # 保存图片
-                image_filename = f"{video_filename}_frame_{frame_number:05d}_person.jpg"
-                image_path = os.path.join(output_dir, image_filename)
-                cv2.imwrite(image_path, frames[i])
-
-                # 保存到数据库
-                PersonDetection.objects.create(
-                    record_log=log,
-                    frame_number=frame_number,
-                    timestamp=timestamp,
-                    image_path=image_path,
-                    confidence=best_detection['confidence'],
-                    bbox=best_detection['bbox']
-                )
-
-                detection_count += 1
-                # 更新last_time，确保批次内后续帧使用新的时间进行判断
-                last_time = timestamp
-
-                logger.debug(f"✓ 保存人物检测: 帧{frame_number}, 时间{timestamp:.1f}s, 置信度{best_detection['confidence']:.2f}, 距上次{time_since_last:.1f}s")
-            else:
-                # 跳过：距离上次检测太近
-                logger.debug(f"✗ 跳过重复检测: 帧{frame_number}, 时间{timestamp:.1f}s, 距上次仅{time_since_last:.1f}s (需>={dedup_window}s)")
-
-    return {'count': detection_count, 'last_time': last_time if detection_count > 0 else None}
-
-
 @shared_task(
     bind=True,
     max_retries=3,
@@ -724,6 +686,73 @@ def generate_captions_batch(self, detection_ids=None):
         logger.info("BLIP2 模型资源已释放")
 
 
+@shared_task(bind=True, time_limit=3600, soft_time_limit=3300)
+def compact_recordings(self, camera_ips=None):
+    """
+    将已结束小时的分钟录像合并为小时文件（由 Celery Beat 每小时触发）
+
+    Args:
+        camera_ips: 可选，只处理指定摄像头
+    """
+    from apps.cameras.compaction import HourCompactor
+
+    try:
+        stats = HourCompactor().run(camera_ips)
+        logger.info(
+            f"录像合并完成: 合并 {stats['compacted_hours']} 个小时/{stats['compacted_files']} 个文件, "
+            f"跳过 {stats['skipped_hours']} 个, 失败 {stats['failed_hours']} 个"
+        )
+        return dict(stats)
+
+    except Exception as e:
+        logger.error(f"录像合并失败: {e}", exc_info=True)
+        raise
+
+
+@shared_task(bind=True)
+def reclaim_stale_analyses(self):
+    """
+    检测中超过 DETECTION_STALE_TIMEOUT 秒未更新的录像（worker 或检测服务崩溃遗留）退回待检测并重新提交
+    （由 Celery Beat 每 10 分钟触发）
+    """
+    from apps.cameras.analysis import reclaim_stale_analyses as reclaim
+
+    record_log_ids = reclaim()
+    if record_log_ids:
+        # service 模式下保持待检测由检测服务领取，task 模式下重新投递分析任务
+        queue_person_analysis(record_log_ids)
+    return f"退回待检测 {len(record_log_ids)} 个录像"
+
+
+@shared_task(bind=True, time_limit=3600, soft_time_limit=3300)
+def enforce_retention(self, camera_ips=None):
+    """
+    执行录像保留策略：按天数删除、按天数或容量归档（由 Celery Beat 每小时触发）
+
+    每个摄像头每次最多处理 RETENTION_MAX_CHUNKS 块，积压的部分由后续运行继续处理
+
+    Args:
+        camera_ips: 可选，只处理指定摄像头
+    """
+    from apps.cameras.detection_cache import prune_cache
+    from apps.cameras.retention import RetentionEngine
+
+    try:
+        stats = RetentionEngine().run(camera_ips)
+        if not camera_ips:
+            stats['pruned_cache_files'] = prune_cache()
+        logger.info(
+            f"保留策略执行完成: 删除 {stats['deleted_logs']} 条录像/{stats['deleted_images']} 张截图, "
+            f"释放 {stats['freed_bytes'] / 1024 ** 3:.2f}GB, 归档 {stats['archived_logs']} 条录像, "
+            f"删除过期检测缓存 {stats['pruned_cache_files']} 个"
+        )
+        return dict(stats)
+
+    except Exception as e:
+        logger.error(f"保留策略执行失败: {e}", exc_info=True)
+        raise
+
+
 @shared_task(bind=True)
 def cleanup_old_gpu_metrics(self, days=30):
     """
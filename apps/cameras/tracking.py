@@ -0,0 +1,175 @@
+"""
+人物轨迹跟踪去重
+
+固定时间窗口（DETECTION_DEDUP_WINDOW）去重时，一个人在画面里站几分钟会每 10 秒保存一张截图，
+而且窗口在每个一分钟录像的边界重置。PersonTracker 按 IoU（其次中心点距离）把相邻采样帧的人物框
+关联成轨迹，每条轨迹只保存置信度最高的一张截图：
+
+- 轨迹 DETECTION_TRACK_MAX_AGE 秒没有再出现即结束，结束时保存该轨迹的最佳截图
+- 录像结束时仍在画面中的轨迹，从未保存过截图的先保存本分钟的最佳截图，
+  轨迹状态写入 RecordLog.track_state，同一摄像头下一分钟的录像接续跟踪，不再重复保存
+- DETECTION_TRACK_REFRESH 大于 0 时，长时间停留的轨迹每隔这么多秒再保存一张
+
+默认关闭（DETECTION_TRACKING=False），保持原有的时间窗口去重行为。
+开启后实时检测（FRAME_TAP_ENABLED）同样按轨迹去重，跟踪器在录制进程内按摄像头常驻。
+
+边界框使用归一化坐标（0-1），时间使用绝对时间（秒），与分辨率、录像文件无关。
+"""
+import os
+import math
+
+
+def is_tracking_enabled():
+    """是否按轨迹去重（DETECTION_TRACKING，关闭时按 DETECTION_DEDUP_WINDOW 时间窗口去重）"""
+    return os.getenv('DETECTION_TRACKING', 'False').lower() in ('true', '1', 't')
+
+
+def box_iou(a, b):
+    """两个 [x1, y1, x2, y2] 框的交并比"""
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def centroid_distance(a, b):
+    """两个框中心点的距离"""
+    return math.hypot((a[0] + a[2] - b[0] - b[2]) / 2, (a[1] + a[3] - b[1] - b[3]) / 2)
+
+
+class Track:
+    """一条人物轨迹"""
+
+    def __init__(self, bbox, seen_at, saved_at=None, first_seen=None):
+        self.bbox = bbox
+        self.first_seen = first_seen if first_seen is not None else seen_at
+        self.last_seen = seen_at
+        self.saved_at = saved_at    # 上次保存截图的时间，None 表示从未保存
+        self.candidate = None       # 上次保存后置信度最高的检测 (置信度, 时间, 写入任务)
+
+    def offer(self, confidence, seen_at, job):
+        if self.candidate is None or confidence > self.candidate[0]:
+            self.candidate = (confidence, seen_at, job)
+
+    def take(self, saved_at=None):
+        """取出候选截图并记为已保存（saved_at 默认为候选帧的时间）"""
+        _, seen_at, job = self.candidate
+        self.saved_at = saved_at if saved_at is not None else seen_at
+        self.candidate = None
+        return job
+
+
+class PersonTracker:
+    """
+    IoU / 中心点距离贪心关联的人物跟踪器
+
+    Args:
+        iou_threshold: 关联所需的最小 IoU
+        max_distance: IoU 不足时，中心点距离（归一化坐标）不超过该值也关联
+        max_age: 轨迹未出现多少秒后结束
+        refresh_interval: 长时间停留的轨迹每隔多少秒再保存一张截图，0 表示不再保存
+    """
+
+    def __init__(self, iou_threshold=None, max_distance=None, max_age=None, refresh_interval=None):
+        self.iou_threshold = iou_threshold if iou_threshold is not None else float(os.getenv('DETECTION_TRACK_IOU', '0.3'))
+        self.max_distance = max_distance if max_distance is not None else float(os.getenv('DETECTION_TRACK_DISTANCE', '0.05'))
+        self.max_age = max_age if max_age is not None else float(os.getenv('DETECTION_TRACK_MAX_AGE', '30'))
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None else float(os.getenv('DETECTION_TRACK_REFRESH', '0'))
+        )
+        self.tracks = []
+        self.created = 0    # 新建的轨迹数（不含接续的轨迹）
+
+    def load(self, state, now):
+        """接续上一分钟录像结束时（或检查点）的轨迹，已超过 max_age 的丢弃"""
+        for item in state or []:
+            if now - item['last_seen'] <= self.max_age:
+                self.tracks.append(
+                    Track(item['bbox'], item['last_seen'], item.get('saved_at'), item.get('first_seen'))
+                )
+
+    def state(self):
+        """轨迹状态（写入 RecordLog.track_state 和检查点），不含候选截图"""
+        return [
+            {
+                'bbox': track.bbox,
+                'first_seen': track.first_seen,
+                'last_seen': track.last_seen,
+                'saved_at': track.saved_at,
+            }
+            for track in self.tracks
+        ]
+
+    def update(self, seen_at, detections):
+        """
+        关联一个采样帧的人物框（按时间顺序调用，没有人物的帧也需要调用，用于结束轨迹）
+
+        Args:
+            seen_at: 帧的绝对时间（秒）
+            detections: [(归一化边界框, 置信度, 写入任务), ...]
+
+        Returns:
+            list: 需要保存的写入任务
+        """
+        jobs = []
+        alive = []
+        for track in self.tracks:
+            if seen_at - track.last_seen > self.max_age:
+                # 轨迹结束：从未保存过截图时保存最佳截图
+                if track.candidate is not None and track.saved_at is None:
+                    jobs.append(track.take())
+            else:
+                alive.append(track)
+        self.tracks = alive
+
+        # IoU 达标的配对优先（分数为正），其次按中心点距离（分数为负，越近越大）
+        pairs = []
+        for track_index, track in enumerate(self.tracks):
+            for detection_index, (bbox, _, _) in enumerate(detections):
+                iou = box_iou(track.bbox, bbox)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, track_index, detection_index))
+                else:
+                    distance = centroid_distance(track.bbox, bbox)
+                    if distance <= self.max_distance:
+                        pairs.append((-distance, track_index, detection_index))
+
+        matched_tracks, matched_detections = set(), set()
+        for _, track_index, detection_index in sorted(pairs, reverse=True):
+            if track_index in matched_tracks or detection_index in matched_detections:
+                continue
+            matched_tracks.add(track_index)
+            matched_detections.add(detection_index)
+
+            track = self.tracks[track_index]
+            bbox, confidence, job = detections[detection_index]
+            track.bbox = bbox
+            track.last_seen = seen_at
+            track.offer(confidence, seen_at, job)
+            # 从出现（或上次保存）起超过刷新间隔时保存一张
+            since = track.saved_at if track.saved_at is not None else track.first_seen
+            if self.refresh_interval > 0 and seen_at - since >= self.refresh_interval:
+                # 从本次刷新起重新计时，否则候选帧较早时下一帧又会立即刷新
+                jobs.append(track.take(seen_at))
+
+        for detection_index, (bbox, confidence, job) in enumerate(detections):
+            if detection_index not in matched_detections:
+                track = Track(bbox, seen_at)
+                track.offer(confidence, seen_at, job)
+                self.tracks.append(track)
+                self.created += 1
+        return jobs
+
+    def flush(self):
+        """
+        录像结束或写入检查点：从未保存过截图的轨迹保存目前为止的最佳截图，其余候选丢弃
+        （候选帧只在内存中，无法跨录像、跨重试保存）
+
+        Returns:
+            list: 需要保存的写入任务
+        """
+        jobs = [track.take() for track in self.tracks if track.candidate is not None and track.saved_at is None]
+        for track in self.tracks:
+            track.candidate = None
+        return jobs
@@ -171,7 +171,8 @@ CELERY_ENABLE_UTC = True
 
 # Celery 并发控制 - 限制视频分析任务的并发数
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # 一次只取一个任务
-CELERY_WORKER_MAX_TASKS_PER_CHILD = 10  # 每个 worker 处理10个任务后重启（防止内存泄漏）
+# 每个 worker 子进程处理 N 个任务后重启（防止内存泄漏）；YOLO 模型缓存在子进程内，重启后需要重新加载
+CELERY_WORKER_MAX_TASKS_PER_CHILD = int(os.getenv('CELERY_WORKER_MAX_TASKS_PER_CHILD', '200'))
 
 # 任务路由 - 视频分析任务使用专用队列
 CELERY_TASK_ROUTES = {
@@ -183,30 +184,29 @@ CELERY_TASK_ROUTES = {
         'queue': 'video_analysis',  # 和YOLO共用队列，避免并行冲突
         'routing_key': 'video.caption',
     },
+    # 维护任务单独排队，由 maintenance worker 消费，不占用录制和分析 worker
+    'apps.cameras.tasks.enforce_retention': {
+        'queue': 'maintenance',
+        'routing_key': 'maintenance.retention',
+    },
+    'apps.cameras.tasks.compact_recordings': {
+        'queue': 'maintenance',
+        'routing_key': 'maintenance.compaction',
+    },
+    'apps.cameras.tasks.reclaim_stale_analyses': {
+        'queue': 'maintenance',
+        'routing_key': 'maintenance.reclaim',
+    },
 }
 
 CELERY_BEAT_SCHEDULE = {
-    "record_camera_1": {
-        "task": "apps.cameras.tasks.record_camera_task",
-        "schedule": crontab(minute="*"),  # 每分钟执行一次
-        "args": (
-            os.getenv("CAMERA1_IP"),
-            os.getenv("CAMERA1_USER"),
-            os.getenv("CAMERA1_PASSWORD"),
-            int(os.getenv("CAMERA1_PORT")),
-            os.getenv("CAMERA1_PATH")
-        ),
-    },
-    "record_camera_2": {
-        "task": "apps.cameras.tasks.record_camera_task",
+    # 为 Camera 表中启用的摄像头投递录制任务 - 每分钟执行一次（RECORD_MODE=task 时）
+    "dispatch_camera_recordings": {
+        "task": "apps.cameras.tasks.dispatch_camera_recordings",
         "schedule": crontab(minute="*"),
-        "args": (
-            os.getenv("CAMERA2_IP"),
-            os.getenv("CAMERA2_USER"),
-            os.getenv("CAMERA2_PASSWORD"),
-            int(os.getenv("CAMERA2_PORT")),
-            os.getenv("CAMERA2_PATH")
-        ),
+        "options": {
+            "expires": 50,
+        },
     },
     # 批量生成图片描述 - 每10分钟执行一次
     "batch_generate_captions": {
@@ -216,6 +216,30 @@ CELERY_BEAT_SCHEDULE = {
             "expires": 540,  # 任务9分钟后过期，避免堆积
         },
     },
+    # 分钟录像合并为小时文件 - 每小时执行一次
+    "compact_recordings": {
+        "task": "apps.cameras.tasks.compact_recordings",
+        "schedule": crontab(minute=40),
+        "options": {
+            "expires": 3000,
+        },
+    },
+    # 检测中超时的录像退回待检测（worker / 检测服务崩溃遗留）- 每10分钟执行一次
+    "reclaim_stale_analyses": {
+        "task": "apps.cameras.tasks.reclaim_stale_analyses",
+        "schedule": crontab(minute="*/10"),
+        "options": {
+            "expires": 540,
+        },
+    },
+    # 录像保留策略（删除过期录像、归档、容量控制）- 每小时执行一次
+    "enforce_retention": {
+        "task": "apps.cameras.tasks.enforce_retention",
+        "schedule": crontab(minute=17),
+        "options": {
+            "expires": 3000,
+        },
+    },
     # 清理旧的GPU监控数据 - 每天凌晨2点执行
     "cleanup_old_gpu_metrics": {
         "task": "apps.cameras.tasks.cleanup_old_gpu_metrics",
@@ -226,6 +250,22 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# 录制模式：
+#   task    - Celery Beat 每分钟启动一次 ffmpeg 录制 60 秒（record_camera_task）
+#   segment - 由 `python manage.py run_recorder` 常驻进程分段录制，不再调度每分钟的录制任务
+RECORD_MODE = os.getenv('RECORD_MODE', 'task')
+
+if RECORD_MODE == 'segment':
+    CELERY_BEAT_SCHEDULE.pop("dispatch_camera_recordings")
+
+# 人物检测模式：
+#   task    - 每个录像投递一个 analyze_video_for_person 任务
+#   service - 由 `python manage.py run_detection_service` 常驻进程领取待检测录像，跨录像拼批推理
+DETECTION_MODE = os.getenv('DETECTION_MODE', 'task')
+
+# 录制 worker 监听以该前缀开头的队列（如 -Q record.node1），按一致性哈希分担摄像头
+RECORD_QUEUE_PREFIX = os.getenv('RECORD_QUEUE_PREFIX', 'record.')
+
 # 日志配置
 LOGGING = {
     'version': 1,